@@ -1,8 +1,9 @@
 from rest_framework import serializers
+from logistics.sparse_fields import SparseFieldsMixin
 from .models import BuyingRequest, BuyAndShipQuote
 
 
-class BuyAndShipQuoteSerializer(serializers.ModelSerializer):
+class BuyAndShipQuoteSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     shipping_mode_name = serializers.CharField(source='shipping_mode.name', read_only=True)
     shipping_mode_code = serializers.CharField(source='shipping_mode.code', read_only=True)
     
@@ -10,9 +11,15 @@ class BuyAndShipQuoteSerializer(serializers.ModelSerializer):
         model = BuyAndShipQuote
         fields = '__all__'
         read_only_fields = ['id', 'created_at', 'updated_at']
+    
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None):
+        if cls.wants(fields, 'shipping_mode_name') or cls.wants(fields, 'shipping_mode_code'):
+            queryset = queryset.select_related('shipping_mode')
+        return cls.only_requested(queryset, fields)
 
 
-class BuyingRequestSerializer(serializers.ModelSerializer):
+class BuyingRequestSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     package = serializers.SerializerMethodField()
     quotes = BuyAndShipQuoteSerializer(many=True, read_only=True)
     shipment_tracking = serializers.SerializerMethodField()
@@ -23,6 +30,29 @@ class BuyingRequestSerializer(serializers.ModelSerializer):
         model = BuyingRequest
         fields = '__all__'
         read_only_fields = ['id', 'created_at', 'updated_at', 'reference_number', 'user']
+        expandable_fields = ['package', 'quotes', 'shipment_tracking', 'vehicle_info']
+        field_dependencies = {
+            'package': ['package'],
+            'quotes': [],
+            'shipment_tracking': ['shipment'],
+            'vehicle_info': ['shipment'],
+        }
+    
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None):
+        """Load the package, shipment (and vehicle) and quotes the response shows"""
+        from django.db.models import Prefetch
+        if cls.wants(fields, 'package'):
+            queryset = queryset.select_related('package')
+        if cls.wants(fields, 'vehicle_info'):
+            queryset = queryset.select_related('shipment__vehicle')
+        elif cls.wants(fields, 'shipment_tracking'):
+            queryset = queryset.select_related('shipment')
+        if cls.wants(fields, 'quotes'):
+            queryset = queryset.prefetch_related(
+                Prefetch('quotes', queryset=BuyAndShipQuote.objects.select_related('shipping_mode'))
+            )
+        return cls.only_requested(queryset, fields)
     
     def get_package(self, obj):
         if obj.package:
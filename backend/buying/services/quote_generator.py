@@ -1,5 +1,6 @@
 from decimal import Decimal
 from logistics.services.pricing_calculator import PricingCalculator
+from logistics.services.money import Money, quote_total
 from logistics.models import TransportMode, Country
 
 
@@ -19,7 +20,7 @@ class QuoteGenerator:
     def calculate_buying_fee(self, product_cost, fee_percent=None):
         """Calculate buying service fee"""
         fee_percent = self.get_buying_fee_percent(fee_percent)
-        return product_cost * (fee_percent / Decimal('100'))
+        return Money.from_amount(product_cost).percent(fee_percent).to_decimal()
     
     def generate_shipping_quotes(self, buying_request, weight=None, dimensions=None, declared_value=None):
         """
@@ -189,7 +190,7 @@ class QuoteGenerator:
             # Find matching quote for this shipping mode
             for quote in quotes:
                 if quote.get('transport_mode_code') == shipping_mode_code:
-                    shipping_cost = Decimal(str(quote.get('total_cost', 0)))
+                    shipping_cost = quote_total(quote).to_decimal()
                     if not estimated_days:
                         estimated_days = quote.get('transit_days')
                     if not service_name:
@@ -245,8 +246,8 @@ class QuoteGenerator:
             # Route-based quotes use 'transport_mode' (e.g., 'AIR', 'SEA'), not 'transport_mode_code'
             mode_code = shipping_quote.get('transport_mode_code') or shipping_quote.get('transport_mode')
             if mode_code:
-                # Get shipping cost (route-based quotes use 'total', not 'total_cost')
-                shipping_cost = shipping_quote.get('total', shipping_quote.get('total_cost', 0))
+                # Get shipping cost (route-based quotes use 'total'/'total_cents', not 'total_cost')
+                shipping_cost = quote_total(shipping_quote).to_decimal()
                 
                 # Get transit days (could be tuple or single value)
                 transit_days = shipping_quote.get('transit_days')
@@ -28,7 +28,8 @@ class BuyingRequestViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return BuyingRequest.objects.filter(user=self.request.user)
+        fields = BuyingRequestSerializer.requested_fields(self.request)
+        return BuyingRequestSerializer.setup_eager_loading(BuyingRequest.objects.filter(user=self.request.user), fields)
     
     def create(self, request, *args, **kwargs):
         """Override create to add logging and ensure proper user assignment"""
@@ -529,8 +530,9 @@ def get_quotes(request, request_id):
     except BuyingRequest.DoesNotExist:
         return Response({'error': 'Buying request not found'}, status=status.HTTP_404_NOT_FOUND)
     
-    quotes = BuyAndShipQuote.objects.filter(buying_request=buying_request)
-    serializer = BuyAndShipQuoteSerializer(quotes, many=True)
+    fields = BuyAndShipQuoteSerializer.requested_fields(request)
+    quotes = BuyAndShipQuoteSerializer.setup_eager_loading(BuyAndShipQuote.objects.filter(buying_request=buying_request), fields)
+    serializer = BuyAndShipQuoteSerializer(quotes, many=True, context={'request': request})
     return Response(serializer.data)
 
 
@@ -3,6 +3,11 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Async views such as the streaming quote endpoint (calculate-shipping/stream/)
+and live tracking (track/<number>/events/) only avoid holding a worker per
+open stream when served through ASGI, e.g.
+gunicorn -k uvicorn.workers.UvicornWorker config.asgi:application
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 """
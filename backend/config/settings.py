@@ -139,7 +139,10 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/minute',
-        'user': '1000/minute'
+        'user': '1000/minute',
+        'batch_quote_anon': config('BATCH_QUOTE_ANON_RATE', default='5/minute'),
+        'batch_quote_user': config('BATCH_QUOTE_USER_RATE', default='60/minute'),
+        'tracking_stream': config('TRACKING_STREAM_RATE', default='20/minute'),  # live tracking connections per IP
     }
 }
 
@@ -165,11 +168,35 @@ CORS_ALLOW_CREDENTIALS = True
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='')
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
 STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET', default='')
+STRIPE_EVENT_MAX_ATTEMPTS = config('STRIPE_EVENT_MAX_ATTEMPTS', default=5, cast=int)  # inbox retries per event
 
 # EasyShip
 EASYSHIP_API_KEY = config('EASYSHIP_API_KEY', default='')
 EASYSHIP_API_URL = config('EASYSHIP_API_URL', default='https://public-api.easyship.com/2024-09')
 EASYSHIP_WEBHOOK_SECRET = config('EASYSHIP_WEBHOOK_SECRET', default='')
+EASYSHIP_WEBHOOK_MAX_ATTEMPTS = config('EASYSHIP_WEBHOOK_MAX_ATTEMPTS', default=10, cast=int)  # inbox retries per event (e.g. shipment not saved yet)
+EASYSHIP_QUOTE_DEADLINE_SECONDS = config('EASYSHIP_QUOTE_DEADLINE_SECONDS', default=8, cast=float)  # Overall EasyShip budget per quote request
+EASYSHIP_MAX_WORKERS = config('EASYSHIP_MAX_WORKERS', default=8, cast=int)  # Threads for concurrent EasyShip calls
+EASYSHIP_POOL_SIZE = config('EASYSHIP_POOL_SIZE', default=16, cast=int)  # Keep-alive connections per process
+EASYSHIP_CONNECT_TIMEOUT = config('EASYSHIP_CONNECT_TIMEOUT', default=3.05, cast=float)  # seconds; read timeouts are per endpoint
+EASYSHIP_MAX_RETRIES = config('EASYSHIP_MAX_RETRIES', default=2, cast=int)  # idempotent calls only
+EASYSHIP_RETRY_BACKOFF = config('EASYSHIP_RETRY_BACKOFF', default=0.25, cast=float)  # seconds, doubled per retry, full jitter
+EASYSHIP_CIRCUIT_FAILURE_THRESHOLD = config('EASYSHIP_CIRCUIT_FAILURE_THRESHOLD', default=5, cast=int)
+EASYSHIP_CIRCUIT_RESET_SECONDS = config('EASYSHIP_CIRCUIT_RESET_SECONDS', default=30, cast=int)
+EASYSHIP_RATE_LIMIT_PER_SECOND = config('EASYSHIP_RATE_LIMIT_PER_SECOND', default=10, cast=int)  # shared by all workers; 0 disables
+EASYSHIP_RECORD_DIR = config('EASYSHIP_RECORD_DIR', default='')  # save EasyShip responses for the simulator (manage.py easyship_simulator)
+# Rate cache: fresh window (served as-is), then stale window (served while refreshing in the background)
+EASYSHIP_RATE_FRESH_SECONDS = config('EASYSHIP_RATE_FRESH_SECONDS', default=300, cast=int)
+EASYSHIP_RATE_STALE_SECONDS = config('EASYSHIP_RATE_STALE_SECONDS', default=1800, cast=int)
+EASYSHIP_RATE_LANE_FRESH_SECONDS = config(  # per-lane fresh windows, e.g. "US-CA=900,CN-*=1800"
+    'EASYSHIP_RATE_LANE_FRESH_SECONDS',
+    default='',
+    cast=lambda v: {lane.strip().upper(): int(seconds) for lane, seconds in (item.split('=') for item in v.split(',') if item.strip())}
+)
+SINGLE_FLIGHT_WAIT_SECONDS = config('SINGLE_FLIGHT_WAIT_SECONDS', default=10, cast=float)  # max wait for an identical in-flight EasyShip call
+# Address validation cache: valid addresses (days), rejected addresses (hours)
+ADDRESS_VALIDATION_TTL_DAYS = config('ADDRESS_VALIDATION_TTL_DAYS', default=30, cast=int)
+ADDRESS_VALIDATION_NEGATIVE_TTL_HOURS = config('ADDRESS_VALIDATION_NEGATIVE_TTL_HOURS', default=24, cast=int)
 # AWS S3
 AWS_ACCESS_KEY_ID = config('AWS_ACCESS_KEY_ID', default='')
 AWS_SECRET_ACCESS_KEY = config('AWS_SECRET_ACCESS_KEY', default='')
@@ -187,6 +214,17 @@ if AWS_STORAGE_BUCKET_NAME:
 # Redis
 REDIS_URL = config('REDIS_URL', default='redis://localhost:6379/0')
 
+# Cache - use Redis in production so every worker shares the rate card version
+# (the logistics.W001 system check warns while a per-process cache is configured)
+USE_REDIS_CACHE = config('USE_REDIS_CACHE', default=False, cast=bool)
+if USE_REDIS_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+
 # Celery
 CELERY_BROKER_URL = REDIS_URL
 CELERY_RESULT_BACKEND = REDIS_URL
@@ -194,6 +232,49 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool)  # run tasks inline (development without a worker)
+CELERY_BEAT_SCHEDULE = {
+    'rebuild-price-grid': {
+        'task': 'logistics.tasks.rebuild_price_grid',
+        'schedule': config('PRICE_GRID_REBUILD_SECONDS', default=300, cast=int),  # only rebuilds after rate card changes
+    },
+    'retry-label-jobs': {
+        'task': 'logistics.tasks.retry_label_jobs',
+        'schedule': 60,
+    },
+    'process-pending-easyship-webhooks': {
+        'task': 'logistics.tasks.process_pending_easyship_webhooks',
+        'schedule': 30,
+    },
+    'process-pending-stripe-events': {
+        'task': 'payments.tasks.process_pending_stripe_events',
+        'schedule': 30,
+    },
+    'refresh-tracking': {
+        'task': 'logistics.tasks.refresh_tracking',
+        'schedule': config('TRACKING_REFRESH_TICK_SECONDS', default=60, cast=int),
+    },
+}
+
+# Background label purchase (logistics.services.label_purchase)
+LABEL_PURCHASE_MAX_ATTEMPTS = config('LABEL_PURCHASE_MAX_ATTEMPTS', default=5, cast=int)
+LABEL_PURCHASE_RETRY_BACKOFF = config('LABEL_PURCHASE_RETRY_BACKOFF', default=30, cast=float)  # seconds, doubled per retry
+LABEL_PURCHASE_RUNNING_TIMEOUT = config('LABEL_PURCHASE_RUNNING_TIMEOUT', default=600, cast=int)  # seconds before a running job counts as lost
+
+# Tracking refresher (logistics.services.tracking_refresher): shipments polled per tick, poll interval per status
+TRACKING_REFRESH_BATCH_SIZE = config('TRACKING_REFRESH_BATCH_SIZE', default=50, cast=int)
+TRACKING_REFRESH_INTERVALS = config(  # seconds per shipment status, e.g. "in_transit=3600,out_for_delivery=600"
+    'TRACKING_REFRESH_INTERVALS',
+    default='',
+    cast=lambda v: {status.strip(): int(seconds) for status, seconds in (item.split('=') for item in v.split(',') if item.strip())}
+)
+
+# Rendered public tracking responses (logistics.services.tracking_cache); invalidated on every tracking write
+TRACKING_RESPONSE_CACHE_TTL = config('TRACKING_RESPONSE_CACHE_TTL', default=3600, cast=int)  # seconds
+
+# Live tracking push (logistics.services.tracking_events): Redis pub/sub -> track/<number>/events/ SSE stream
+TRACKING_PUSH_ENABLED = config('TRACKING_PUSH_ENABLED', default=True, cast=bool)
+TRACKING_STREAM_MAX_SECONDS = config('TRACKING_STREAM_MAX_SECONDS', default=1800, cast=int)  # clients reconnect after this; only served under ASGI
 
 # Email Configuration - Gmail SMTP
 # To use Gmail:
@@ -230,6 +311,11 @@ SERVICE_FEE_PER_PACKAGE = config('SERVICE_FEE_PER_PACKAGE', default=5.0, cast=fl
 # Shipping Calculation Settings
 SHIPPING_PICKUP_WEIGHT_THRESHOLD = config('SHIPPING_PICKUP_WEIGHT_THRESHOLD', default=100, cast=float)  # kg
 QUOTE_REQUEST_EXPIRY_HOURS = config('QUOTE_REQUEST_EXPIRY_HOURS', default=24, cast=int)
+QUOTE_RESULT_CACHE_TIMEOUT = config('QUOTE_RESULT_CACHE_TIMEOUT', default=300, cast=int)  # seconds, same as the EasyShip rate fresh window
+BATCH_QUOTE_MAX_ROWS = config('BATCH_QUOTE_MAX_ROWS', default=500, cast=int)
+BATCH_QUOTE_ANON_MAX_ROWS = config('BATCH_QUOTE_ANON_MAX_ROWS', default=20, cast=int)  # row cap for unauthenticated callers
+PRICE_GRID_ENABLED = config('PRICE_GRID_ENABLED', default=True, cast=bool)  # serve standard boxes from the precomputed grid
+PRICE_GRID_INTERPOLATE = config('PRICE_GRID_INTERPOLATE', default=False, cast=bool)  # interpolate between weight breaks (can differ from live by a few cents)
 
 # EasyShip Webhook
 EASYSHIP_WEBHOOK_SECRET = config('EASYSHIP_WEBHOOK_SECRET', default='')
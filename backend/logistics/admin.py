@@ -9,7 +9,9 @@ from django import forms
 from .models import (
     Country, TransportMode, ShippingRoute, Package, 
     LogisticsShipment, ShippingCalculationSettings,
-    QuoteRequest, TrackingUpdate, PickupRequest, Warehouse, PickupCalculationSettings
+    QuoteRequest, TrackingUpdate, PickupRequest, Warehouse, PickupCalculationSettings,
+    PriceGridEntry, AddressValidation, LabelPurchaseJob, EasyShipWebhookEvent,
+    TrackingIdentifier
 )
 from buying.models import BuyingRequest
 from warehouse.models import WarehouseReceiving
@@ -1665,6 +1667,75 @@ class PickupCalculationSettingsAdmin(admin.ModelAdmin):
     ordering = ['country', 'state', 'shipping_category']
 
 
+@admin.register(PriceGridEntry)
+class PriceGridEntryAdmin(admin.ModelAdmin):
+    """Read-only view of the precomputed price grid (rebuilt with `manage.py build_price_grid`)"""
+    list_display = ['route', 'shipping_category', 'dimension_bucket', 'weight_grams', 'total_cents', 'rate_card_version', 'created_at']
+    list_filter = ['shipping_category', 'dimension_bucket', 'route__transport_mode', 'route__origin_country']
+    readonly_fields = ['route', 'shipping_category', 'dimension_bucket', 'weight_grams', 'total_cents', 'quote', 'rate_card_version', 'created_at']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(LabelPurchaseJob)
+class LabelPurchaseJobAdmin(admin.ModelAdmin):
+    """Background EasyShip label purchases (logistics.tasks.purchase_label)"""
+    list_display = ['job_id', 'kind', 'status', 'shipment', 'user', 'attempts', 'next_attempt_at', 'created_at', 'completed_at']
+    list_filter = ['status', 'kind']
+    search_fields = ['job_id', 'idempotency_key', 'shipment__shipment_number', 'user__email']
+    readonly_fields = ['job_id', 'idempotency_key', 'kind', 'user', 'shipment', 'request_data', 'tracking_fields',
+                       'status', 'attempts', 'next_attempt_at', 'purchase_unconfirmed', 'result', 'error',
+                       'created_at', 'updated_at', 'completed_at']
+    actions = ['reconcile_with_easyship']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def reconcile_with_easyship(self, request, queryset):
+        from .services.label_purchase import reconcile_unconfirmed_jobs
+        count = reconcile_unconfirmed_jobs(queryset)
+        messages.success(request, f'Re-queued {count} unconfirmed job(s); each checks EasyShip for an existing label before buying.')
+    reconcile_with_easyship.short_description = 'Reconcile unconfirmed jobs with EasyShip and retry'
+
+
+@admin.register(EasyShipWebhookEvent)
+class EasyShipWebhookEventAdmin(admin.ModelAdmin):
+    """EasyShip webhook inbox (applied by logistics.tasks.process_easyship_webhooks)"""
+    list_display = ['id', 'event_type', 'easyship_shipment_id', 'status', 'attempts', 'received_at', 'processed_at']
+    list_filter = ['status', 'event_type']
+    search_fields = ['easyship_shipment_id', 'payload_hash']
+    readonly_fields = ['payload_hash', 'event_type', 'easyship_shipment_id', 'payload', 'status', 'attempts', 'error',
+                       'received_at', 'processed_at']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(AddressValidation)
+class AddressValidationAdmin(admin.ModelAdmin):
+    """Cached EasyShip address validation results; delete a row to force re-validation"""
+    list_display = ['__str__', 'is_valid', 'created_at', 'expires_at']
+    list_filter = ['is_valid']
+    search_fields = ['address_hash']
+    readonly_fields = ['address_hash', 'normalized_address', 'is_valid', 'result', 'created_at', 'expires_at']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(TrackingIdentifier)
+class TrackingIdentifierAdmin(admin.ModelAdmin):
+    """Public tracking lookup index; maintained automatically (backfill_tracking_identifiers rebuilds it)"""
+    list_display = ['identifier', 'kind', 'shipment', 'updated_at']
+    list_filter = ['kind']
+    search_fields = ['identifier']
+    readonly_fields = ['identifier', 'kind', 'shipment', 'created_at', 'updated_at']
+    
+    def has_add_permission(self, request):
+        return False
+
+
 # Customize admin site header and title
 admin.site.site_header = 'YuuSell Logistics Administration'
 admin.site.site_title = 'YuuSell Logistics Admin'
@@ -5,3 +5,5 @@ class LogisticsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'logistics'
 
+    def ready(self):
+        from logistics import checks, signals  # noqa: F401
@@ -0,0 +1,35 @@
+"""
+System checks for settings the logistics services rely on.
+"""
+from django.conf import settings
+from django.core import checks
+
+# Cache backends whose data lives inside one process
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    The rate card and price grid versions, EasyShip single flight and quota,
+    and the webhook inbox locks all coordinate workers through the default
+    cache. With a process-local cache every gunicorn/Celery process sees its
+    own copy, so an admin edit only reaches the worker that handled it.
+
+    A warning rather than an error: a single process (runserver, the test
+    runner) works fine with LocMem, and settings alone cannot tell how many
+    gunicorn/Celery processes the deployment starts.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend not in PROCESS_LOCAL_CACHE_BACKENDS:
+        return []
+    message = (
+        f"The default cache ({backend}) is local to each process; rate card and "
+        "price grid invalidation, EasyShip quota and single flight will not be "
+        "shared between gunicorn and Celery workers."
+    )
+    hint = "Set USE_REDIS_CACHE=True (and REDIS_URL) when running more than one process."
+    return [checks.Warning(message, hint=hint, id='logistics.W001')]
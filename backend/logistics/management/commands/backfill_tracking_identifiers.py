@@ -0,0 +1,14 @@
+"""
+Management command to rebuild the tracking identifier index
+"""
+from django.core.management.base import BaseCommand
+from logistics.services.tracking_identifiers import backfill
+
+
+class Command(BaseCommand):
+    help = 'Index every shipment number, carrier tracking number and package/buying reference for public tracking'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Indexing tracking identifiers...')
+        count = backfill()
+        self.stdout.write(self.style.SUCCESS(f'Successfully indexed tracking identifiers ({count} entries)'))
@@ -0,0 +1,22 @@
+"""
+Management command to rebuild the precomputed price grid
+"""
+from django.core.management.base import BaseCommand
+from logistics.services.price_grid import WEIGHT_BREAKS_KG, build_price_grid
+
+
+class Command(BaseCommand):
+    help = 'Precompute route freight for every route, shipping category, weight break and standard box'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--category',
+            action='append',
+            choices=list(WEIGHT_BREAKS_KG.keys()),
+            help='Only rebuild this shipping category (can be repeated)'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Building price grid...')
+        count = build_price_grid(options.get('category'))
+        self.stdout.write(self.style.SUCCESS(f'Successfully built price grid ({count} entries)'))
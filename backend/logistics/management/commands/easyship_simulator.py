@@ -0,0 +1,46 @@
+"""
+Management command to run the local EasyShip simulator (record/replay)
+"""
+from django.core.management.base import BaseCommand
+from logistics.services.easyship_simulator import EasyShipSimulator, make_server
+
+
+class Command(BaseCommand):
+    help = 'Serve recorded or synthetic EasyShip responses locally for load tests and benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--fixtures', help='Directory recorded with EASYSHIP_RECORD_DIR')
+        parser.add_argument('--latency-median-ms', type=float, default=150, help='Median response latency (log-normal)')
+        parser.add_argument('--latency-sigma', type=float, default=0.5, help='Log-normal sigma; higher means a longer tail')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 503')
+        parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of requests answered with 429')
+        parser.add_argument('--webhook-url', help='Post label/tracking webhooks here after each shipment, e.g. http://127.0.0.1:8000/api/v1/logistics/easyship-webhook/')
+        parser.add_argument('--webhook-delay-ms', type=float, default=500)
+        parser.add_argument('--seed', type=int, help='Random seed for reproducible runs')
+
+    def handle(self, *args, **options):
+        simulator = EasyShipSimulator(
+            fixtures_dir=options['fixtures'],
+            latency_median_ms=options['latency_median_ms'],
+            latency_sigma=options['latency_sigma'],
+            error_rate=options['error_rate'],
+            throttle_rate=options['throttle_rate'],
+            webhook_url=options['webhook_url'],
+            webhook_delay_ms=options['webhook_delay_ms'],
+            seed=options['seed'],
+        )
+        server = make_server(simulator, options['host'], options['port'])
+        recorded = ', '.join(f'{endpoint}: {len(items)}' for endpoint, items in simulator.recordings.items()) or 'none'
+        self.stdout.write(f'Recorded responses: {recorded}')
+        self.stdout.write(self.style.SUCCESS(
+            f'EasyShip simulator on http://{options["host"]}:{server.server_port}/2024-09 '
+            f'(set EASYSHIP_API_URL to this)'
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping simulator')
+        finally:
+            server.server_close()
@@ -70,7 +70,13 @@ class ShippingRoute(models.Model):
 
 
 class EasyShipRate(models.Model):
-    """Cached EasyShip rates with 5-minute expiry"""
+    """
+    EasyShip rates, one row per rate of a response. Also the durable (L2) tier
+    of the rate cache: rows of the latest response for a request fingerprint
+    are served as-is until fresh_until, served stale while refreshing in the
+    background until expires_at, and kept afterwards as history.
+    """
+    fingerprint = models.CharField(max_length=64, blank=True, default='', help_text='quote_fingerprint of the rate request')
     origin_country = models.CharField(max_length=2)
     destination_country = models.CharField(max_length=2)
     weight = models.DecimalField(max_digits=10, decimal_places=2)
@@ -82,15 +88,34 @@ class EasyShipRate(models.Model):
     transit_days = models.IntegerField(null=True, blank=True)
     rate_data = models.JSONField(default=dict)  # Full EasyShip response
     created_at = models.DateTimeField(auto_now_add=True)
+    fresh_until = models.DateTimeField(null=True, blank=True)
     expires_at = models.DateTimeField()
     
     class Meta:
         indexes = [
             models.Index(fields=['origin_country', 'destination_country', 'weight']),
             models.Index(fields=['expires_at']),
+            models.Index(fields=['fingerprint', '-fresh_until']),
         ]
 
 
+class AddressValidation(models.Model):
+    """
+    EasyShip address validation result for a normalized address.
+    Valid results are kept for ADDRESS_VALIDATION_TTL_DAYS, rejected addresses
+    (negative cache) for ADDRESS_VALIDATION_NEGATIVE_TTL_HOURS.
+    """
+    address_hash = models.CharField(max_length=64, unique=True, help_text='sha256 of the normalized address')
+    normalized_address = models.JSONField(default=dict)
+    is_valid = models.BooleanField()
+    result = models.JSONField(default=dict)  # EasyShip response, or {'error': ...} for rejected addresses
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"{self.normalized_address.get('line_1', '')}, {self.normalized_address.get('city', '')} ({'valid' if self.is_valid else 'invalid'})"
+
+
 class Package(models.Model):
     """Packages received at warehouse"""
     STATUS_CHOICES = [
@@ -286,10 +311,13 @@ class LogisticsShipment(models.Model):
     status = models.CharField(max_length=30, choices=STATUS_CHOICES, default='quote_requested')
     tracking_number = models.CharField(max_length=200, blank=True)
     carrier = models.CharField(max_length=100, blank=True)
-    easyship_shipment_id = models.CharField(max_length=200, blank=True)
+    easyship_shipment_id = models.CharField(max_length=200, blank=True, db_index=True)
     easyship_label_url = models.CharField(max_length=500, blank=True)
     tracking_page_url = models.CharField(max_length=500, blank=True)  # EasyShip tracking page URL
     local_carrier_tracking_number = models.CharField(max_length=200, blank=True)  # For EasyShip tracking
+    tracking_data = models.JSONField(default=dict, blank=True)  # Last EasyShip tracking response (tracking refresher)
+    tracking_refreshed_at = models.DateTimeField(null=True, blank=True)
+    tracking_next_refresh_at = models.DateTimeField(null=True, blank=True, db_index=True)
     estimated_delivery = models.DateTimeField(null=True, blank=True)
     actual_delivery = models.DateTimeField(null=True, blank=True)
     
@@ -318,6 +346,55 @@ class LogisticsShipment(models.Model):
         return f"{self.shipment_number} - {self.user.email}"
 
 
+class LabelPurchaseJob(models.Model):
+    """
+    Background EasyShip label purchase (see logistics.services.label_purchase).
+    One job per idempotency key, so repeated requests for the same label
+    return the same job instead of buying a second label.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+        ('unconfirmed', 'Unconfirmed (check EasyShip)'),
+    ]
+
+    KIND_CHOICES = [
+        ('shipment', 'Shipment Label'),
+        ('warehouse', 'Warehouse Label'),
+    ]
+
+    job_id = models.CharField(max_length=100, unique=True, default=uuid.uuid4)
+    idempotency_key = models.CharField(max_length=255, unique=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='shipment')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='label_jobs')
+    shipment = models.ForeignKey(LogisticsShipment, on_delete=models.CASCADE, null=True, blank=True, related_name='label_jobs')
+
+    request_data = models.JSONField(default=dict)  # EasyShipService.create_shipment kwargs
+    tracking_fields = models.JSONField(default=list)  # shipment fields that receive the tracking number
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    purchase_unconfirmed = models.BooleanField(default=False)  # an attempt may have bought a label; look it up before buying again
+    result = models.JSONField(default=dict, blank=True)  # create_shipment result (label_url, tracking_number, ...)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.job_id} ({self.kind}, {self.status})"
+
+
 class ShippingCalculationSettings(models.Model):
     """Global and route-specific calculation settings"""
     SHIPPING_CATEGORIES = [
@@ -443,7 +520,7 @@ class TrackingUpdate(models.Model):
     status = models.CharField(max_length=100)
     location = models.CharField(max_length=200, blank=True)
     timestamp = models.DateTimeField()
-    source = models.CharField(max_length=20, choices=[('webhook', 'Webhook'), ('manual', 'Manual')], default='webhook')
+    source = models.CharField(max_length=20, choices=[('webhook', 'Webhook'), ('poll', 'EasyShip Poll'), ('manual', 'Manual')], default='webhook')
     raw_data = models.JSONField(default=dict)  # Full webhook/API response
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -458,6 +535,65 @@ class TrackingUpdate(models.Model):
         return f"Tracking Update: {self.shipment.shipment_number} - {self.status}"
 
 
+class TrackingIdentifier(models.Model):
+    """
+    Every public identifier a customer can track by (carrier tracking number,
+    shipment number, package or buying request reference) mapped to its
+    shipment, so track_by_number is one unique-index lookup. Kept in sync by
+    logistics.signals; rebuild with `manage.py backfill_tracking_identifiers`.
+    """
+    KIND_CHOICES = [
+        ('carrier', 'Carrier Tracking Number'),
+        ('shipment_number', 'Shipment Number'),
+        ('local_carrier', 'Local Carrier Tracking Number'),
+        ('package_reference', 'Package Reference'),
+        ('buying_reference', 'Buying Request Reference'),
+    ]
+
+    identifier = models.CharField(max_length=200, unique=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    shipment = models.ForeignKey(LogisticsShipment, on_delete=models.CASCADE, related_name='tracking_identifiers')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.identifier} -> {self.shipment_id} ({self.kind})"
+
+
+class EasyShipWebhookEvent(models.Model):
+    """
+    EasyShip webhook inbox. The webhook view verifies and stores the event and
+    answers at once; logistics.tasks.process_easyship_webhooks applies events
+    in arrival order per shipment. Redeliveries of the same payload are
+    stored once (payload_hash).
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed'),
+    ]
+    
+    payload_hash = models.CharField(max_length=64, unique=True)
+    event_type = models.CharField(max_length=100, blank=True)
+    easyship_shipment_id = models.CharField(max_length=200, db_index=True)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'easyship_shipment_id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_type} {self.easyship_shipment_id} ({self.status})"
+
+
 class PickupRequest(models.Model):
     """Pickup requests for workers to schedule and manage"""
     STATUS_CHOICES = [
@@ -717,3 +853,29 @@ class PickupCalculationSettings(models.Model):
         category = self.get_shipping_category_display()
         return f"Pickup Settings: {location} ({category})"
 
+
+
+class PriceGridEntry(models.Model):
+    """
+    Precomputed route quote for a weight break and dimension bucket.
+    Built by the build_price_grid command / task; only entries whose
+    rate_card_version matches the current rate card are served.
+    """
+    route = models.ForeignKey(ShippingRoute, on_delete=models.CASCADE, related_name='price_grid')
+    shipping_category = models.CharField(max_length=20, choices=ShippingCalculationSettings.SHIPPING_CATEGORIES)
+    weight_grams = models.PositiveIntegerField()
+    dimension_bucket = models.CharField(max_length=20)
+    total_cents = models.BigIntegerField()
+    quote = models.JSONField(help_text='Route quote as returned by PricingCalculator (totals and breakdown)')
+    rate_card_version = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['route', 'shipping_category', 'dimension_bucket', 'weight_grams']
+        ordering = ['route', 'shipping_category', 'dimension_bucket', 'weight_grams']
+        indexes = [
+            models.Index(fields=['rate_card_version']),
+        ]
+    
+    def __str__(self):
+        return f"{self.route} {self.shipping_category} {self.dimension_bucket} {self.weight_grams}g: {self.total_cents}c"
@@ -1,8 +1,9 @@
 from rest_framework import serializers
-from .models import Package, LogisticsShipment, Country, TransportMode, ShippingRoute, TrackingUpdate
+from .models import Package, LogisticsShipment, Country, TransportMode, ShippingRoute, TrackingUpdate, LabelPurchaseJob
+from .sparse_fields import SparseFieldsMixin
 
 
-class PackageSerializer(serializers.ModelSerializer):
+class PackageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     shipment_info = serializers.SerializerMethodField()
     photos_list = serializers.SerializerMethodField()
     delivery_photos_list = serializers.SerializerMethodField()
@@ -11,6 +12,18 @@ class PackageSerializer(serializers.ModelSerializer):
         model = Package
         fields = '__all__'
         read_only_fields = ['id', 'created_at', 'updated_at']
+        expandable_fields = ['shipment_info', 'photos_list', 'delivery_photos_list']
+        field_dependencies = {
+            'shipment_info': ['shipment'],
+            'photos_list': [f'photo_{i}' for i in range(1, 6)] + ['photos'],
+            'delivery_photos_list': [f'delivery_photo_{i}' for i in range(1, 6)] + ['delivery_photos'],
+        }
+    
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None):
+        if cls.wants(fields, 'shipment_info'):
+            queryset = queryset.select_related('shipment')
+        return cls.only_requested(queryset, fields)
     
     def get_shipment_info(self, obj):
         """Get shipment details if linked"""
@@ -75,7 +88,12 @@ class TrackingUpdateSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
-class LogisticsShipmentSerializer(serializers.ModelSerializer):
+class LogisticsShipmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Querysets passed through setup_eager_loading() are serialized in a fixed
+    number of queries whatever the page size; a plain instance falls back to
+    one query per related field.
+    """
     packages = serializers.SerializerMethodField()
     pickup_request_id = serializers.SerializerMethodField()
     tracking_updates = serializers.SerializerMethodField()
@@ -85,11 +103,30 @@ class LogisticsShipmentSerializer(serializers.ModelSerializer):
         model = LogisticsShipment
         fields = '__all__'
         read_only_fields = ['id', 'shipment_number', 'created_at', 'updated_at']
+        expandable_fields = ['packages', 'tracking_updates']
+    
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None):
+        """Load packages, tracking updates, pickup request and paid status with the shipments (those requested)"""
+        from django.db.models import Exists, OuterRef, Prefetch
+        from payments.models import Payment
+        if cls.wants(fields, 'pickup_request_id'):
+            queryset = queryset.select_related('pickup_request')
+        if cls.wants(fields, 'packages'):
+            queryset = queryset.prefetch_related('primary_packages')
+        if cls.wants(fields, 'tracking_updates'):
+            queryset = queryset.prefetch_related(
+                Prefetch('tracking_updates', queryset=TrackingUpdate.objects.order_by('timestamp'), to_attr='ordered_tracking_updates')
+            )
+        if cls.wants(fields, 'is_paid'):
+            queryset = queryset.annotate(
+                has_completed_payment=Exists(Payment.objects.filter(shipment=OuterRef('pk'), status='completed'))
+            )
+        return cls.only_requested(queryset, fields)
     
     def get_packages(self, obj):
         """Get packages for this shipment"""
-        packages = Package.objects.filter(shipment=obj)
-        return PackageSerializer(packages, many=True).data
+        return PackageSerializer(obj.primary_packages.all(), many=True).data
     
     def get_pickup_request_id(self, obj):
         """Get pickup request ID if exists"""
@@ -100,14 +137,18 @@ class LogisticsShipmentSerializer(serializers.ModelSerializer):
     
     def get_tracking_updates(self, obj):
         """Get all tracking updates for this shipment, ordered by timestamp"""
-        from .models import TrackingUpdate
-        updates = TrackingUpdate.objects.filter(shipment=obj).order_by('timestamp')
+        updates = getattr(obj, 'ordered_tracking_updates', None)
+        if updates is None:
+            updates = obj.tracking_updates.order_by('timestamp')
         return TrackingUpdateSerializer(updates, many=True).data
     
     def get_is_paid(self, obj):
         """Check if shipment has a completed payment"""
-        from payments.models import Payment
-        return Payment.objects.filter(shipment=obj, status='completed').exists()
+        is_paid = getattr(obj, 'has_completed_payment', None)
+        if is_paid is None:
+            from payments.models import Payment
+            is_paid = Payment.objects.filter(shipment=obj, status='completed').exists()
+        return is_paid
 
 
 class CountrySerializer(serializers.ModelSerializer):
@@ -121,3 +162,11 @@ class TransportModeSerializer(serializers.ModelSerializer):
         model = TransportMode
         fields = '__all__'
 
+
+
+class LabelPurchaseJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LabelPurchaseJob
+        fields = ['job_id', 'kind', 'status', 'shipment', 'attempts', 'next_attempt_at', 'result', 'error',
+                  'created_at', 'updated_at', 'completed_at']
+        read_only_fields = fields
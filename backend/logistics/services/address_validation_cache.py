@@ -0,0 +1,126 @@
+"""
+Persistent EasyShip address validation cache.
+
+Addresses are normalized (field aliases merged, whitespace collapsed, case
+folded, postal code without spaces) and hashed; the validation result is
+stored in AddressValidation and mirrored in the Django cache. Valid results
+live for ADDRESS_VALIDATION_TTL_DAYS, rejected addresses (422) for
+ADDRESS_VALIDATION_NEGATIVE_TTL_HOURS, so repeat checkouts skip the EasyShip
+round trip either way.
+
+get_rates/create_shipment use apply_validated_address() to send the corrected
+address EasyShip returned earlier; that lookup never calls EasyShip.
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from logistics.models import AddressValidation
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_PREFIX = 'address_validation_'
+
+# Canonical field -> accepted input names (our address format and EasyShip's)
+FIELD_ALIASES = {
+    'line_1': ('line_1', 'street_address'),
+    'line_2': ('line_2', 'street_address_2'),
+    'city': ('city',),
+    'state': ('state', 'state_province'),
+    'postal_code': ('postal_code',),
+    'country_alpha2': ('country_alpha2', 'country'),
+    'company_name': ('company_name', 'company'),
+}
+
+# Fields of EasyShip's validated address copied into outgoing payloads
+CORRECTED_FIELDS = ('line_1', 'line_2', 'city', 'state', 'postal_code')
+
+
+def _clean(value):
+    return ' '.join(str(value).split()) if value is not None else ''
+
+
+def normalize_validation_address(address):
+    """Address dict (any supported field names) -> canonical dict used for the hash"""
+    normalized = {}
+    for field, aliases in FIELD_ALIASES.items():
+        value = next((_clean(address.get(alias)) for alias in aliases if _clean(address.get(alias))), '')
+        if value:
+            normalized[field] = value.casefold()
+    if 'postal_code' in normalized:
+        normalized['postal_code'] = normalized['postal_code'].replace(' ', '').upper()
+    if 'country_alpha2' in normalized:
+        normalized['country_alpha2'] = normalized['country_alpha2'].upper()
+    if 'state' in normalized and len(normalized['state']) <= 3:
+        normalized['state'] = normalized['state'].upper()
+    return normalized
+
+
+def address_hash(address, replace_with_validation_result=True):
+    payload = {
+        'address': normalize_validation_address(address),
+        'replace': bool(replace_with_validation_result),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_validation(address, replace_with_validation_result=True):
+    """Cached {'is_valid', 'result'} for the address, or None"""
+    if not isinstance(address, dict):
+        return None
+    key = address_hash(address, replace_with_validation_result)
+    entry = cache.get(CACHE_KEY_PREFIX + key)
+    if entry is not None:
+        return entry
+
+    record = AddressValidation.objects.filter(address_hash=key, expires_at__gt=timezone.now()).first()
+    if record is None:
+        return None
+    entry = {'is_valid': record.is_valid, 'result': record.result}
+    timeout = int((record.expires_at - timezone.now()).total_seconds())
+    if timeout > 0:
+        cache.set(CACHE_KEY_PREFIX + key, entry, timeout)
+    return entry
+
+
+def store_validation(address, replace_with_validation_result, is_valid, result):
+    """Save a validation result (valid or rejected) for the address"""
+    if is_valid:
+        ttl = timedelta(days=settings.ADDRESS_VALIDATION_TTL_DAYS)
+    else:
+        ttl = timedelta(hours=settings.ADDRESS_VALIDATION_NEGATIVE_TTL_HOURS)
+    key = address_hash(address, replace_with_validation_result)
+    AddressValidation.objects.update_or_create(
+        address_hash=key,
+        defaults={
+            'normalized_address': normalize_validation_address(address),
+            'is_valid': is_valid,
+            'result': result,
+            'expires_at': timezone.now() + ttl,
+        }
+    )
+    cache.set(CACHE_KEY_PREFIX + key, {'is_valid': is_valid, 'result': result}, int(ttl.total_seconds()))
+
+
+def apply_validated_address(formatted, address):
+    """
+    Overwrite the EasyShip payload address `formatted` with the corrected fields
+    EasyShip returned when `address` was validated. No-op if it never was.
+    """
+    try:
+        entry = get_validation(address)
+    except Exception as e:
+        logger.error(f"Address validation cache lookup failed: {str(e)}")
+        return formatted
+    if not entry or not entry['is_valid']:
+        return formatted
+    validated = (entry['result'] or {}).get('address') or {}
+    for field in CORRECTED_FIELDS:
+        if validated.get(field):
+            formatted[field] = validated[field]
+    return formatted
@@ -0,0 +1,170 @@
+"""
+Two-tier EasyShip rate cache with stale-while-revalidate.
+
+- L1: Django cache (process memory, or Redis with USE_REDIS_CACHE), keyed by
+  the request fingerprint (see quote_fingerprint).
+- L2: EasyShipRate rows tagged with the same fingerprint. They survive
+  restarts and are shared by every worker, so a cold worker reads rates from
+  the database instead of calling EasyShip.
+
+An entry is served as-is until fresh_until. Between fresh_until and expires_at
+it is still served immediately, and one background refresh is started (at
+most one per fingerprint at a time). Past expires_at, or when nothing is
+cached, rates are fetched synchronously through rate_flight, so identical
+concurrent misses make a single EasyShip call.
+
+The fresh window is EASYSHIP_RATE_FRESH_SECONDS, overridable per lane with
+EASYSHIP_RATE_LANE_FRESH_SECONDS ("US-CA=900,CN-*=1800"); the stale window
+(EASYSHIP_RATE_STALE_SECONDS) follows it.
+"""
+import logging
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+
+from logistics.models import EasyShipRate
+from logistics.services.pricing_context import get_executor
+from logistics.services.single_flight import SingleFlight
+from logistics.services.easyship_rate_limiter import BACKGROUND, call_priority
+
+logger = logging.getLogger(__name__)
+
+L1_KEY_PREFIX = 'easyship_rates_'
+REFRESH_LOCK_PREFIX = 'easyship_rates_refresh_'
+REFRESH_LOCK_TIMEOUT = 60  # seconds; longer than any retried rates call
+
+rate_flight = SingleFlight('easyship_rates')
+
+
+def country_code(country):
+    """ISO code from a code or an address dict"""
+    if isinstance(country, dict):
+        country = country.get('country') or country.get('country_alpha2')
+    return str(country or '').strip().upper()[:2]
+
+
+def fresh_seconds(origin_country, destination_country):
+    """Fresh window for a lane: exact lane, then origin wildcard, destination wildcard, default"""
+    lanes = settings.EASYSHIP_RATE_LANE_FRESH_SECONDS
+    origin, destination = country_code(origin_country), country_code(destination_country)
+    for lane in (f"{origin}-{destination}", f"{origin}-*", f"*-{destination}"):
+        if lane in lanes:
+            return lanes[lane]
+    return settings.EASYSHIP_RATE_FRESH_SECONDS
+
+
+class EasyShipRateCache:
+    """Serves EasyShip rates from memory, then the database, then the API"""
+
+    def get_rates(self, fingerprint, origin_country, destination_country, weight, dimensions, fetch):
+        """
+        Cached rates for a request fingerprint.
+
+        fetch() calls EasyShip and returns the list of rates, or None on error.
+        """
+        entry = cache.get(L1_KEY_PREFIX + fingerprint)
+        if entry is None:
+            entry = self._load(fingerprint)
+            if entry is not None:
+                self._set_l1(fingerprint, entry)
+
+        now = time.time()
+        if entry is not None and now < entry['expires_at']:
+            if now >= entry['fresh_until']:
+                self._refresh_in_background(fingerprint, origin_country, destination_country, weight, dimensions, fetch)
+            return entry['rates']
+
+        def fetch_and_store():
+            rates = fetch()
+            if rates:
+                self._store(fingerprint, origin_country, destination_country, weight, dimensions, rates)
+            return rates
+
+        # Identical concurrent misses (this process or other workers) share one EasyShip call
+        rates = rate_flight.do(fingerprint, fetch_and_store, lambda: self._fresh_l1_rates(fingerprint))
+        return rates or []
+
+    def _fresh_l1_rates(self, fingerprint):
+        """Rates another worker just stored, or None"""
+        entry = cache.get(L1_KEY_PREFIX + fingerprint)
+        if entry is not None and time.time() < entry['expires_at']:
+            return entry['rates']
+        return None
+
+    def _set_l1(self, fingerprint, entry):
+        timeout = max(1, int(entry['expires_at'] - time.time()))
+        cache.set(L1_KEY_PREFIX + fingerprint, entry, timeout)
+
+    def _load(self, fingerprint):
+        """Latest unexpired response for the fingerprint from EasyShipRate"""
+        rows = list(
+            EasyShipRate.objects.filter(fingerprint=fingerprint, expires_at__gt=timezone.now())
+            .order_by('-fresh_until', 'id')
+            .only('rate_data', 'fresh_until', 'expires_at')[:100]
+        )
+        if not rows or rows[0].fresh_until is None:
+            return None
+        latest = [row for row in rows if row.fresh_until == rows[0].fresh_until]
+        logger.debug(f"EasyShip rates for {fingerprint[:12]} loaded from the database ({len(latest)} rates)")
+        return {
+            'rates': [row.rate_data for row in latest],
+            'fresh_until': latest[0].fresh_until.timestamp(),
+            'expires_at': latest[0].expires_at.timestamp(),
+        }
+
+    def _store(self, fingerprint, origin_country, destination_country, weight, dimensions, rates):
+        now = timezone.now()
+        fresh_until = now + timedelta(seconds=fresh_seconds(origin_country, destination_country))
+        expires_at = fresh_until + timedelta(seconds=settings.EASYSHIP_RATE_STALE_SECONDS)
+        EasyShipRate.objects.bulk_create([
+            EasyShipRate(
+                fingerprint=fingerprint,
+                origin_country=country_code(origin_country),
+                destination_country=country_code(destination_country),
+                weight=weight,
+                dimensions=dimensions,
+                carrier=rate.get('courier', {}).get('name', ''),
+                service_name=rate.get('service', {}).get('name', ''),
+                rate=Decimal(str(rate.get('total_charge', 0))),
+                currency=rate.get('currency', 'USD'),
+                transit_days=rate.get('estimated_delivery_days'),
+                rate_data=rate,
+                fresh_until=fresh_until,
+                expires_at=expires_at,
+            )
+            for rate in rates
+        ])
+        self._set_l1(fingerprint, {
+            'rates': rates,
+            'fresh_until': fresh_until.timestamp(),
+            'expires_at': expires_at.timestamp(),
+        })
+
+    def _refresh_in_background(self, fingerprint, origin_country, destination_country, weight, dimensions, fetch):
+        lock_key = REFRESH_LOCK_PREFIX + fingerprint
+        if not cache.add(lock_key, True, REFRESH_LOCK_TIMEOUT):
+            return  # another request/worker is already refreshing it
+
+        def refresh():
+            try:
+                with call_priority(BACKGROUND):
+                    rates = fetch()
+                if rates:
+                    self._store(fingerprint, origin_country, destination_country, weight, dimensions, rates)
+                    logger.debug(f"Refreshed stale EasyShip rates for {fingerprint[:12]}")
+            except Exception as e:
+                logger.error(f"Background EasyShip rate refresh failed: {str(e)}")
+            finally:
+                cache.delete(lock_key)
+                close_old_connections()
+
+        logger.debug(f"Serving stale EasyShip rates for {fingerprint[:12]} while refreshing")
+        get_executor().submit(refresh)
+
+
+rate_cache = EasyShipRateCache()
@@ -0,0 +1,97 @@
+"""
+Client-side EasyShip quota limiter with priority classes.
+
+Every EasyShip call takes a token from one bucket shared by all workers (the
+Django cache, i.e. Redis with USE_REDIS_CACHE). The bucket holds
+EASYSHIP_RATE_LIMIT_PER_SECOND tokens and is refilled once per second; the
+counter is a per-second cache key updated with atomic incr/decr.
+
+Lower priorities may only use part of each second's tokens, so the rest is
+kept for higher ones:
+- LABEL (create_shipment): whole bucket, waits up to 5s for a token
+- INTERACTIVE (quotes, address validation, tracking pages): 80%, waits up to 1s
+- BACKGROUND (rate refresh, tracking refresh): 50%, waits up to 0.5s, then shed
+A caller that gets no token in time raises EasyShipRateLimited (a requests
+RequestException) instead of calling EasyShip and getting a 429.
+"""
+import contextvars
+import logging
+import random
+import time
+from contextlib import contextmanager
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+LABEL = 'label'
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+# Share of each second's tokens a priority may use, and how long it waits for one
+PRIORITY_SHARE = {LABEL: 1.0, INTERACTIVE: 0.8, BACKGROUND: 0.5}
+PRIORITY_MAX_WAIT = {LABEL: 5.0, INTERACTIVE: 1.0, BACKGROUND: 0.5}
+
+ENDPOINT_PRIORITY = {
+    'shipments': LABEL,
+    'rates': INTERACTIVE,
+    'address_validation': INTERACTIVE,
+    'tracking': INTERACTIVE,
+}
+
+_current_priority = contextvars.ContextVar('easyship_priority', default=None)
+
+
+class EasyShipRateLimited(requests.exceptions.ConnectionError):
+    """No EasyShip quota available for this priority in time; the call was not made"""
+
+
+@contextmanager
+def call_priority(priority):
+    """Run EasyShip calls in this block with the given priority (e.g. BACKGROUND for refresh jobs)"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def priority_for(endpoint, priority=None):
+    return priority or _current_priority.get() or ENDPOINT_PRIORITY.get(endpoint, INTERACTIVE)
+
+
+def _take_token(limit, priority):
+    """Try to take a token from the current second's bucket"""
+    key = f'easyship_quota_{int(time.time())}'
+    cache.add(key, 0, 5)
+    try:
+        used = cache.incr(key)
+    except ValueError:
+        return True  # window key evicted; let the call through
+    if used <= limit * PRIORITY_SHARE[priority]:
+        return True
+    try:
+        cache.decr(key)  # give it back so refused calls don't eat higher priorities' share
+    except ValueError:
+        pass
+    return False
+
+
+def acquire(endpoint, priority=None):
+    """Wait for a token for an EasyShip call; raises EasyShipRateLimited if none comes in time"""
+    limit = settings.EASYSHIP_RATE_LIMIT_PER_SECOND
+    if limit <= 0:
+        return
+    priority = priority_for(endpoint, priority)
+    deadline = time.monotonic() + PRIORITY_MAX_WAIT[priority]
+    while True:
+        if _take_token(limit, priority):
+            return
+        now = time.time()
+        wait = (1 - (now - int(now))) + random.uniform(0, 0.05)  # next refill, spread out
+        if time.monotonic() + wait > deadline:
+            logger.warning(f"EasyShip quota exhausted; shedding {priority} {endpoint} call")
+            raise EasyShipRateLimited(f"EasyShip quota exhausted for {priority} {endpoint} call")
+        time.sleep(wait)
@@ -4,10 +4,12 @@ EasyShip API Integration Service
 import requests
 import json
 from django.conf import settings
-from django.core.cache import cache
-from datetime import datetime, timedelta
-from decimal import Decimal
+from datetime import datetime
 import logging
+from logistics.services.quote_fingerprint import quote_fingerprint
+from logistics.services.easyship_transport import easyship_request
+from logistics.services.easyship_rate_cache import rate_cache
+from logistics.services import address_validation_cache
 
 logger = logging.getLogger(__name__)
 
@@ -48,13 +50,24 @@ class EasyShipService:
             logger.warning("EasyShip API not configured. Skipping rate request.")
             return []
         
-        cache_key = f"easyship_rates_{origin_country}_{destination_country}_{weight}_{dimensions.get('length', 0)}_{dimensions.get('width', 0)}_{dimensions.get('height', 0)}"
-        
-        # Check cache (5 minutes)
-        cached = cache.get(cache_key)
-        if cached:
-            return cached
+        # Addresses, declared value and items change the rates too, so key on the full request
+        fingerprint = quote_fingerprint(
+            origin_country, destination_country, weight, dimensions, declared_value, items,
+            origin_address=origin_address, destination_address=destination_address
+        )
         
+        # Memory, then EasyShipRate table (stale-while-revalidate), then the API
+        return rate_cache.get_rates(
+            fingerprint, origin_country, destination_country, weight, dimensions,
+            lambda: self._request_rates(
+                origin_country, destination_country, weight, dimensions,
+                declared_value, items, origin_address, destination_address
+            )
+        )
+    
+    def _request_rates(self, origin_country, destination_country, weight, dimensions,
+                       declared_value=0, items=None, origin_address=None, destination_address=None):
+        """Call the EasyShip rates endpoint; returns the list of rates, or None if the call failed"""
         try:
             # Determine API version based on BASE_URL
             if "2024-09" in self.BASE_URL or "public-api" in self.BASE_URL:
@@ -140,6 +153,12 @@ class EasyShipService:
                         "contact_email": "recipient@logistics.yuusell.com",
                     }
                 
+                # Use the corrected addresses if they were validated before (no EasyShip call)
+                if origin_address and isinstance(origin_address, dict):
+                    address_validation_cache.apply_validated_address(origin_addr, origin_address)
+                if destination_address and isinstance(destination_address, dict):
+                    address_validation_cache.apply_validated_address(dest_addr, destination_address)
+                
                 # Build items array according to 2024-09 API format
                 if items and isinstance(items, list) and len(items) > 0:
                     parcel_items = []
@@ -215,7 +234,7 @@ class EasyShipService:
                 
                 logger.info(f"EasyShip 2024-09 API request to {url} with payload: {payload}")
                 
-                response = requests.post(url, headers=self.headers, json=payload, timeout=10)
+                response = easyship_request('POST', 'rates', url, headers=self.headers, json=payload)
                 response.raise_for_status()
                 
                 data = response.json()
@@ -256,33 +275,13 @@ class EasyShipService:
                 }
                 logger.info(f"EasyShip legacy API request to {url}")
                 
-                response = requests.post(url, headers=self.headers, json=payload, timeout=10)
+                response = easyship_request('POST', 'rates', url, headers=self.headers, json=payload)
                 response.raise_for_status()
                 
                 data = response.json()
                 # Fallback for older API format
                 rates = data if isinstance(data, list) else []
             
-            # Cache for 5 minutes
-            cache.set(cache_key, rates, 300)
-            
-            # Store in database for history
-            from logistics.models import EasyShipRate
-            for rate in rates:
-                EasyShipRate.objects.create(
-                    origin_country=origin_country,
-                    destination_country=destination_country,
-                    weight=weight,
-                    dimensions=dimensions,
-                    carrier=rate.get('courier', {}).get('name', ''),
-                    service_name=rate.get('service', {}).get('name', ''),
-                    rate=Decimal(str(rate.get('total_charge', 0))),
-                    currency=rate.get('currency', 'USD'),
-                    transit_days=rate.get('estimated_delivery_days'),
-                    rate_data=rate,
-                    expires_at=datetime.now() + timedelta(minutes=5)
-                )
-            
             return rates
             
         except requests.exceptions.HTTPError as e:
@@ -299,13 +298,13 @@ class EasyShipService:
                     logger.error(f"EasyShip API 422 Unprocessable Entity - Invalid request format. Response: {e.response.text}")
             else:
                 logger.error(f"EasyShip API HTTP error ({e.response.status_code}): {str(e)}")
-            return []
+            return None
         except requests.exceptions.RequestException as e:
             logger.error(f"EasyShip API request error: {str(e)}")
-            return []
+            return None
         except Exception as e:
             logger.error(f"Error getting EasyShip rates: {str(e)}")
-            return []
+            return None
     
 
 
@@ -318,7 +317,8 @@ class EasyShipService:
 
 
 
-    def create_shipment(self, rate_id, origin_address, destination_address, parcels, courier_name=None, package_reference_number=None):
+    def create_shipment(self, rate_id, origin_address, destination_address, parcels, courier_name=None, package_reference_number=None,
+                        platform_order_number=None, raise_errors=False):
         """
         Create shipment and generate label
         
@@ -329,6 +329,9 @@ class EasyShipService:
             parcels: List of parcel objects
             courier_name: Optional courier name from selected quote
             package_reference_number: Optional package reference number to use as contact_name
+            platform_order_number: Optional order number shown in EasyShip (label job idempotency key)
+            raise_errors: Re-raise request errors instead of returning None (label purchase jobs
+                decide from the error whether to retry)
         
         Returns:
             Dict with shipment_id, easyship_shipment_id, label_url, and tracking_number
@@ -403,6 +406,10 @@ class EasyShipService:
                     "contact_email": destination_address.get('email', 'recipient@logistics.yuusell.com').strip() or 'recipient@logistics.yuusell.com',
                 }
                 
+                # Use the corrected addresses if they were validated before (no EasyShip call)
+                address_validation_cache.apply_validated_address(origin_formatted, origin_address)
+                address_validation_cache.apply_validated_address(destination_formatted, destination_address)
+                
                 # Format parcels according to 2024-09 API
                 formatted_parcels = []
                 for parcel in parcels:
@@ -441,6 +448,8 @@ class EasyShipService:
                 }
                 if courier_name:
                     order_data["buyer_selected_courier_name"] = courier_name
+                if platform_order_number:
+                    order_data["platform_order_number"] = platform_order_number
                 
                 payload = {
                     "origin_address": origin_formatted,
@@ -523,7 +532,7 @@ class EasyShipService:
             logger.info(f"EasyShip create shipment request to {url}")
             logger.info(f"Request payload: {json.dumps(payload, indent=2)}")
             
-            response = requests.post(url, headers=self.headers, json=payload, timeout=30)
+            response = easyship_request('POST', 'shipments', url, idempotent=False, headers=self.headers, json=payload)
             response.raise_for_status()
             
             data = response.json()
@@ -536,28 +545,7 @@ class EasyShipService:
             print(json.dumps(data, indent=2))
             print(f"{'='*80}\n")
             
-            shipment = data.get('shipment', {})
-            
-            # Extract tracking number from trackings array if available
-            trackings = shipment.get('trackings', [])
-            tracking_number = trackings[0].get('tracking_number', '') if trackings else shipment.get('tracking_number', '')
-            
-            # Get label URL from shipping_documents if available
-            shipping_documents = shipment.get('shipping_documents', [])
-            label_url = ''
-            if shipping_documents:
-                for doc in shipping_documents:
-                    if doc.get('type') == 'label':
-                        label_url = doc.get('url', '')
-                        break
-            
-            return {
-                'shipment_id': shipment.get('id'),
-                'easyship_shipment_id': shipment.get('easyship_shipment_id', ''),
-                'label_url': label_url,
-                'tracking_number': tracking_number,
-                'tracking_page_url': shipment.get('tracking_page_url', '')
-            }
+            return self._shipment_result(data.get('shipment', {}))
             
         except requests.exceptions.HTTPError as e:
             error_msg = f"EasyShip create shipment error: {e.response.status_code} {e.response.reason}"
@@ -576,22 +564,78 @@ class EasyShipService:
                 error_msg += f" - Response: {e.response.text[:500]}"
             logger.error(error_msg)
             logger.error(f"Request payload: {json.dumps(payload, indent=2)}")
+            if raise_errors:
+                raise
             return None
         except requests.exceptions.RequestException as e:
             logger.error(f"EasyShip create shipment error: {str(e)}")
+            if raise_errors:
+                raise
             return None
         except Exception as e:
             logger.error(f"Error creating EasyShip shipment: {str(e)}")
             logger.exception(e)
+            if raise_errors:
+                raise
             return None
     
-    def get_tracking(self, tracking_number):
-        """Get tracking information"""
+    def _shipment_result(self, shipment):
+        """create_shipment-style dict for an EasyShip shipment object"""
+        # Extract tracking number from trackings array if available
+        trackings = shipment.get('trackings', [])
+        tracking_number = trackings[0].get('tracking_number', '') if trackings else shipment.get('tracking_number', '')
+        
+        # Get label URL from shipping_documents if available
+        shipping_documents = shipment.get('shipping_documents', [])
+        label_url = ''
+        if shipping_documents:
+            for doc in shipping_documents:
+                if doc.get('type') == 'label':
+                    label_url = doc.get('url', '')
+                    break
+        
+        return {
+            'shipment_id': shipment.get('id'),
+            'easyship_shipment_id': shipment.get('easyship_shipment_id', ''),
+            'label_url': label_url,
+            'tracking_number': tracking_number,
+            'tracking_page_url': shipment.get('tracking_page_url', '')
+        }
+    
+    def find_shipments(self, platform_order_number):
+        """
+        Shipments EasyShip already has for a platform order number (label job idempotency key).
+        
+        Used before buying a label again after an attempt whose outcome is unknown.
+        Request errors are raised: a failed lookup must not be read as "no shipment".
+        """
+        # Same endpoint as create_shipment
+        if "2024-09" in self.BASE_URL or "public-api" in self.BASE_URL:
+            if "/2024-09" in self.BASE_URL:
+                url = f"{self.BASE_URL}/shipments"
+            else:
+                url = f"{self.BASE_URL}/2024-09/shipments"
+        else:
+            url = f"{self.BASE_URL}/shipment/v1/shipments"
+        
+        response = easyship_request('GET', 'shipments', url, headers=self.headers,
+                                    params={'platform_order_number': platform_order_number})
+        response.raise_for_status()
+        
+        # Match on the order number ourselves in case the filter is not applied
+        return [
+            self._shipment_result(shipment)
+            for shipment in response.json().get('shipments', [])
+            if (shipment.get('order_data') or {}).get('platform_order_number') == platform_order_number
+        ]
+    
+    def get_tracking(self, tracking_number, priority=None):
+        """Get tracking information (priority: easyship_rate_limiter class, BACKGROUND for refresh jobs)"""
         try:
             url = f"{self.BASE_URL}/track/v1/status"
             params = {'tracking_number': tracking_number}
             
-            response = requests.get(url, headers=self.headers, params=params, timeout=10)
+            response = easyship_request('GET', 'tracking', url, priority=priority, headers=self.headers, params=params)
             response.raise_for_status()
             
             return response.json()
@@ -621,6 +665,11 @@ class EasyShipService:
             logger.warning("EasyShip API not configured. Skipping address validation.")
             return None
         
+        cached = address_validation_cache.get_validation(address_data, replace_with_validation_result)
+        if cached is not None:
+            logger.info(f"EasyShip address validation served from cache (valid={cached['is_valid']})")
+            return cached['result']
+        
         try:
             # Determine API version
             if "/2024-09" in self.BASE_URL or "public-api" in self.BASE_URL:
@@ -661,12 +710,13 @@ class EasyShipService:
                 'Authorization': f'Bearer {self.API_KEY}'
             }
             
-            response = requests.post(url, headers=validation_headers, json=payload, timeout=10)
+            response = easyship_request('POST', 'address_validation', url, headers=validation_headers, json=payload)
             response.raise_for_status()
             
             data = response.json()
             logger.info(f"EasyShip address validation response: {data}")
             
+            address_validation_cache.store_validation(address_data, replace_with_validation_result, True, data)
             return data
             
         except requests.exceptions.HTTPError as e:
@@ -675,7 +725,15 @@ class EasyShipService:
                     error_data = e.response.json()
                     logger.error(f"EasyShip address validation 422 error: {error_data}")
                 except:
+                    error_data = {}
                     logger.error(f"EasyShip address validation 422 error: {e.response.text}")
+                # The address itself was rejected: remember it so retries don't call EasyShip again
+                error = error_data.get('error') if isinstance(error_data, dict) else None
+                if isinstance(error, dict):
+                    error = error.get('message')
+                result = {'error': error or 'Address could not be validated', 'details': error_data}
+                address_validation_cache.store_validation(address_data, replace_with_validation_result, False, result)
+                return result
             else:
                 logger.error(f"EasyShip address validation HTTP error ({e.response.status_code}): {str(e)}")
             return None
@@ -0,0 +1,258 @@
+"""
+Local EasyShip stand-in for load tests and benchmarks.
+
+Record: with EASYSHIP_RECORD_DIR set, every EasyShip response that goes
+through easyship_transport is saved as <dir>/<endpoint>/<n>.json.
+
+Replay: `python manage.py easyship_simulator --fixtures <dir>` serves
+/rates, /shipments, /addresses/validations and /track/v1/status (2024-09 and
+legacy paths) over HTTP. A recorded response for the endpoint is picked at
+random; endpoints without recordings get a synthetic response (rates priced
+from the parcel weight, new shipment/tracking ids, a tracking history, the
+address echoed back as valid).
+
+Latency is log-normal per request (median and sigma), errors are injected at
+a configurable rate (503) and throttle rate (429). After a shipment is created
+the simulator can post signed shipment.label.created and
+shipment.tracking.checkpoints.created webhooks back to the app.
+
+Point the app at it with EASYSHIP_API_URL=http://127.0.0.1:8765/2024-09 and
+any non-empty EASYSHIP_API_KEY.
+"""
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+ENDPOINT_PATHS = (
+    ('/addresses/validations', 'address_validation'),
+    ('/track/v1/status', 'tracking'),
+    ('/rates', 'rates'),
+    ('/shipments', 'shipments'),
+)
+
+_record_counter = itertools.count()
+
+
+def endpoint_for_path(path):
+    path = urlparse(path).path.rstrip('/')
+    for suffix, endpoint in ENDPOINT_PATHS:
+        if path.endswith(suffix):
+            return endpoint
+    return None
+
+
+def record_response(endpoint, response):
+    """Save an EasyShip response for replay (EASYSHIP_RECORD_DIR)"""
+    try:
+        body = response.json()
+    except ValueError:
+        return
+    directory = os.path.join(settings.EASYSHIP_RECORD_DIR, endpoint)
+    os.makedirs(directory, exist_ok=True)
+    name = f"{int(time.time() * 1000)}_{os.getpid()}_{next(_record_counter)}.json"
+    with open(os.path.join(directory, name), 'w') as f:
+        json.dump({'status': response.status_code, 'body': body}, f)
+
+
+def load_recordings(fixtures_dir):
+    """endpoint -> list of {'status', 'body'} from a record directory"""
+    recordings = {}
+    if not fixtures_dir:
+        return recordings
+    for _, endpoint in ENDPOINT_PATHS:
+        directory = os.path.join(fixtures_dir, endpoint)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.json'):
+                with open(os.path.join(directory, name)) as f:
+                    recordings.setdefault(endpoint, []).append(json.load(f))
+    return recordings
+
+
+class EasyShipSimulator:
+    """Response source and fault injection shared by the server's handler threads"""
+
+    SYNTHETIC_COURIERS = (
+        ('USPS', 'Priority Mail', 6.5, 1.9, (2, 5)),
+        ('UPS', 'Ground', 9.0, 1.6, (3, 6)),
+        ('FedEx', 'International Priority', 24.0, 4.2, (1, 3)),
+    )
+
+    def __init__(self, fixtures_dir=None, latency_median_ms=150, latency_sigma=0.5,
+                 error_rate=0.0, throttle_rate=0.0, webhook_url=None, webhook_delay_ms=500, seed=None):
+        self.recordings = load_recordings(fixtures_dir)
+        self.latency_median_ms = latency_median_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.webhook_url = webhook_url
+        self.webhook_delay_ms = webhook_delay_ms
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def latency_seconds(self):
+        with self._lock:
+            if self.latency_median_ms <= 0:
+                return 0.0
+            return self.random.lognormvariate(math.log(self.latency_median_ms / 1000), self.latency_sigma)
+
+    def respond(self, endpoint, payload):
+        """(status, body) for a request"""
+        with self._lock:
+            self.requests += 1
+            roll = self.random.random()
+            recorded = self.recordings.get(endpoint)
+            recording = self.random.choice(recorded) if recorded else None
+        if roll < self.throttle_rate:
+            return 429, {'error': {'message': 'Too many requests (simulated)'}}
+        if roll < self.throttle_rate + self.error_rate:
+            return 503, {'error': {'message': 'Service unavailable (simulated)'}}
+        if recording:
+            return recording['status'], recording['body']
+        return 200, getattr(self, f'_synthetic_{endpoint}')(payload or {})
+
+    def _synthetic_rates(self, payload):
+        parcels = payload.get('parcels') or [{}]
+        weight = float(parcels[0].get('total_actual_weight') or 1)
+        rates = []
+        for rank, (courier, service, base, per_kg, (min_days, max_days)) in enumerate(self.SYNTHETIC_COURIERS, start=1):
+            total = round(base + per_kg * weight, 2)
+            rates.append({
+                'id': f'sim_rate_{uuid.uuid4().hex[:12]}',
+                'courier_service': {
+                    'id': f'sim_{courier.lower()}_{rank}',
+                    'courier_id': f'sim_{courier.lower()}',
+                    'name': f'{courier} {service}',
+                    'umbrella_name': courier,
+                },
+                'total_charge': total,
+                'shipment_charge': total,
+                'fuel_surcharge': 0,
+                'insurance_fee': 0,
+                'currency': 'USD',
+                'min_delivery_time': min_days,
+                'max_delivery_time': max_days,
+                'cost_rank': rank,
+                'delivery_time_rank': rank,
+                'available_handover_options': ['dropoff', 'free_pickup'],
+            })
+        return {'rates': rates}
+
+    def _synthetic_shipments(self, payload):
+        shipment_id = f'ESSIM{uuid.uuid4().hex[:10].upper()}'
+        tracking_number = f'SIM{self.random.randrange(10 ** 11, 10 ** 12)}'
+        shipment = {
+            'id': shipment_id,
+            'easyship_shipment_id': shipment_id,
+            'trackings': [{'tracking_number': tracking_number}],
+            'tracking_page_url': f'https://track.example.test/{tracking_number}',
+            'shipping_documents': [{'type': 'label', 'url': f'https://labels.example.test/{shipment_id}.png'}],
+        }
+        self._send_webhooks(shipment_id, tracking_number)
+        return {'shipment': shipment}
+
+    def _synthetic_tracking(self, payload):
+        return {
+            'status': 'In Transit',
+            'checkpoints': [
+                {'order_number': 1, 'primary_status': 'Label Created', 'checkpoint_time': '2026-01-01T10:00:00Z'},
+                {'order_number': 2, 'primary_status': 'In Transit', 'checkpoint_time': '2026-01-02T10:00:00Z'},
+            ],
+        }
+
+    def _synthetic_address_validation(self, payload):
+        return {'address': {key: value for key, value in payload.items() if key != 'replace_with_validation_result'},
+                'status': 'valid'}
+
+    def _send_webhooks(self, shipment_id, tracking_number):
+        if not self.webhook_url:
+            return
+        events = [
+            {'event_type': 'shipment.label.created', 'resource_id': shipment_id, 'data': {
+                'easyship_shipment_id': shipment_id,
+                'tracking_number': tracking_number,
+                'label_url': f'https://labels.example.test/{shipment_id}.png',
+            }},
+            {'event_type': 'shipment.tracking.checkpoints.created', 'resource_id': shipment_id, 'data': {
+                'easyship_shipment_id': shipment_id,
+                'tracking_number': tracking_number,
+                'checkpoints': self._synthetic_tracking({})['checkpoints'],
+            }},
+        ]
+
+        def deliver():
+            for event in events:
+                time.sleep(self.webhook_delay_ms / 1000)
+                body = json.dumps(event).encode()
+                headers = {'Content-Type': 'application/json'}
+                if settings.EASYSHIP_WEBHOOK_SECRET:
+                    headers['X-EasyShip-Signature'] = hmac.new(
+                        settings.EASYSHIP_WEBHOOK_SECRET.encode(), body, hashlib.sha256
+                    ).hexdigest()
+                try:
+                    urlopen(Request(self.webhook_url, data=body, headers=headers, method='POST'), timeout=10).read()
+                except Exception as e:
+                    logger.warning(f"Simulated webhook {event['event_type']} failed: {str(e)}")
+
+        threading.Thread(target=deliver, daemon=True).start()
+
+
+def make_handler(simulator):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+        def _handle(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            raw = self.rfile.read(length) if length else b''
+            endpoint = endpoint_for_path(self.path)
+            if endpoint is None:
+                status, body = 404, {'error': {'message': f'Unknown path {self.path}'}}
+            else:
+                try:
+                    payload = json.loads(raw) if raw else {}
+                except ValueError:
+                    payload = {}
+                time.sleep(simulator.latency_seconds())
+                if self.command == 'GET' and endpoint == 'shipments':
+                    # Lookup by platform_order_number: the simulator keeps no shipments
+                    status, body = 200, {'shipments': []}
+                else:
+                    status, body = simulator.respond(endpoint, payload)
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = _handle
+        do_POST = _handle
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return Handler
+
+
+def make_server(simulator, host='127.0.0.1', port=8765):
+    """HTTP server for the simulator (port 0 picks a free port); call serve_forever()"""
+    server = ThreadingHTTPServer((host, port), make_handler(simulator))
+    server.daemon_threads = True
+    return server
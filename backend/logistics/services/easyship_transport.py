@@ -0,0 +1,180 @@
+"""
+HTTP transport for the EasyShip API.
+
+All EasyShipService calls go through one process-wide requests.Session, so TLS
+connections are pooled and kept alive instead of being opened per call.
+
+- Timeouts are (connect, read) per endpoint; the connect timeout is short so a
+  degraded EasyShip does not hold workers for the old flat 10 seconds.
+- Idempotent calls (rates, tracking, address validation) are retried a bounded
+  number of times on connection errors, timeouts and 429/5xx, with exponential
+  backoff and full jitter. Shipment creation is never retried here.
+- A circuit breaker opens after EASYSHIP_CIRCUIT_FAILURE_THRESHOLD consecutive
+  failures and fails fast (EasyShipUnavailable) for EASYSHIP_CIRCUIT_RESET_SECONDS,
+  then lets a single trial call through. EasyShipUnavailable is a
+  requests RequestException, so existing error handling covers it.
+The breaker is per process; every worker trips on its own. The quota limiter
+(easyship_rate_limiter) is shared by all workers.
+"""
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from logistics.services.easyship_rate_limiter import acquire
+
+logger = logging.getLogger(__name__)
+
+# Read timeouts (seconds) per endpoint
+READ_TIMEOUTS = {
+    'rates': 8,
+    'shipments': 30,
+    'tracking': 8,
+    'address_validation': 5,
+}
+DEFAULT_READ_TIMEOUT = 10
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class EasyShipUnavailable(requests.exceptions.ConnectionError):
+    """Raised without calling EasyShip while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker (closed -> open -> half-open -> closed)"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a call may go out now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("EasyShip circuit breaker closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"EasyShip circuit breaker open after {self.failures} failures; "
+                                   f"failing fast for {self.reset_seconds}s")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def release_trial(self):
+        """Give back the half-open trial slot when the allowed call was never sent"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_in_flight = False
+
+
+circuit_breaker = CircuitBreaker(
+    failure_threshold=settings.EASYSHIP_CIRCUIT_FAILURE_THRESHOLD,
+    reset_seconds=settings.EASYSHIP_CIRCUIT_RESET_SECONDS,
+)
+
+
+def get_session():
+    """Process-wide keep-alive session for EasyShip"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=4,
+                    pool_maxsize=settings.EASYSHIP_POOL_SIZE,
+                    max_retries=0,  # retries are handled by easyship_request
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def _backoff(attempt):
+    """Full jitter: uniform(0, base * 2^attempt), capped"""
+    return random.uniform(0, min(settings.EASYSHIP_RETRY_BACKOFF * (2 ** attempt), 4.0))
+
+
+def easyship_request(method, endpoint, url, idempotent=True, priority=None, **kwargs):
+    """
+    Send an EasyShip request through the pooled session.
+
+    Every attempt takes a quota token at the call's priority (see
+    easyship_rate_limiter). Returns the last response (callers still call
+    raise_for_status()); raises requests exceptions, EasyShipUnavailable while
+    the breaker is open, or EasyShipRateLimited when no quota was available.
+    """
+    timeout = kwargs.pop('timeout', None) or (
+        settings.EASYSHIP_CONNECT_TIMEOUT, READ_TIMEOUTS.get(endpoint, DEFAULT_READ_TIMEOUT)
+    )
+    max_retries = settings.EASYSHIP_MAX_RETRIES if idempotent else 0
+    session = get_session()
+
+    attempt = 0
+    while True:
+        if not circuit_breaker.allow():
+            raise EasyShipUnavailable(f"EasyShip circuit breaker is open; skipping {endpoint} call")
+        try:
+            acquire(endpoint, priority)
+        except Exception:
+            # Shed by the quota limiter: EasyShip was not called, so free the trial slot
+            circuit_breaker.release_trial()
+            raise
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except requests.exceptions.RequestException as e:
+            circuit_breaker.record_failure()
+            retryable = isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+            if not retryable or attempt >= max_retries:
+                raise
+            logger.warning(f"EasyShip {endpoint} call failed ({e.__class__.__name__}), retry {attempt + 1}/{max_retries}")
+        else:
+            if settings.EASYSHIP_RECORD_DIR:
+                from logistics.services.easyship_simulator import record_response
+                record_response(endpoint, response)
+            if response.status_code >= 500:
+                circuit_breaker.record_failure()
+            else:
+                circuit_breaker.record_success()
+            if response.status_code not in RETRY_STATUSES or attempt >= max_retries:
+                return response
+            logger.warning(f"EasyShip {endpoint} returned {response.status_code}, retry {attempt + 1}/{max_retries}")
+        time.sleep(_backoff(attempt))
+        attempt += 1
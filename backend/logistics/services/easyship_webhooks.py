@@ -0,0 +1,275 @@
+"""
+EasyShip webhook inbox.
+
+The webhook view only verifies the signature, stores the event
+(EasyShipWebhookEvent) and returns 200, so EasyShip never times out and
+retries during bursts. Events are applied by the process_easyship_webhooks
+task:
+
+- per shipment, in arrival order, by one worker at a time (cache lock);
+- a redelivered payload is stored once (payload_hash);
+- checkpoints are deduplicated and inserted with one bulk_create
+  (tracking_refresher.store_checkpoints);
+- an event for a shipment we don't know yet (the label job may not have
+  saved the EasyShip id) stays pending and is retried, like events whose
+  handler failed, up to EASYSHIP_WEBHOOK_MAX_ATTEMPTS; later events of that
+  shipment wait behind it so order is kept.
+"""
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from logistics.models import EasyShipWebhookEvent, LogisticsShipment, TrackingUpdate
+from logistics.services.tracking_refresher import latest_checkpoint_status, store_checkpoints
+
+logger = logging.getLogger(__name__)
+
+LOCK_TIMEOUT = 120
+RETRY_AFTER_SECONDS = 30
+
+# Webhook tracking status -> LogisticsShipment.status
+TRACKING_STATUS_MAPPING = {
+    'Label Created': 'processing',
+    'Picked Up': 'dispatched',
+    'In Transit': 'in_transit',
+    'Out for Delivery': 'out_for_delivery',
+    'Delivered': 'delivered',
+}
+
+
+class ShipmentNotFound(Exception):
+    """Webhook for an EasyShip shipment id we don't have (yet)"""
+
+
+def event_shipment_id(data):
+    """EasyShip shipment id from the places EasyShip puts it"""
+    webhook_data = data.get('data', {})
+    shipment_id = webhook_data.get('easyship_shipment_id') or data.get('resource_id') or webhook_data.get('id')
+    return str(shipment_id) if shipment_id else ''
+
+
+def receive_event(body, data):
+    """Store a verified webhook; returns (event, created). Processing is queued after commit."""
+    event, created = EasyShipWebhookEvent.objects.get_or_create(
+        payload_hash=hashlib.sha256(body).hexdigest(),
+        defaults={
+            'event_type': data.get('event_type') or '',
+            'easyship_shipment_id': event_shipment_id(data),
+            'payload': data,
+        }
+    )
+    if created:
+        transaction.on_commit(lambda: dispatch(event.easyship_shipment_id))
+    return event, created
+
+
+def dispatch(easyship_shipment_id, countdown=0):
+    """Queue processing for a shipment; if that fails the process_pending_events sweep picks it up"""
+    from logistics.tasks import process_easyship_webhooks
+    try:
+        process_easyship_webhooks.apply_async((easyship_shipment_id,), countdown=countdown, retry=False)
+    except Exception as e:
+        logger.error(f"Could not queue EasyShip webhook processing for {easyship_shipment_id}: {str(e)}")
+
+
+def process_shipment_events(easyship_shipment_id):
+    """Apply the pending events of one shipment in order; returns how many were applied"""
+    lock_key = f'easyship_webhook_lock_{easyship_shipment_id}'
+    if not cache.add(lock_key, True, LOCK_TIMEOUT):
+        return 0  # another worker is applying this shipment's events; it picks up ours too
+    applied = 0
+    try:
+        while True:
+            events = list(EasyShipWebhookEvent.objects.filter(
+                easyship_shipment_id=easyship_shipment_id, status='pending'
+            ).order_by('id')[:100])
+            if not events:
+                break
+            for event in events:
+                if not _process(event):
+                    # Keep order: later events wait until this one goes through or gives up
+                    dispatch(easyship_shipment_id, countdown=RETRY_AFTER_SECONDS)
+                    return applied
+                applied += 1
+    finally:
+        cache.delete(lock_key)
+    return applied
+
+
+def _process(event):
+    """Apply one event; False if it should be retried later"""
+    event.attempts += 1
+    try:
+        with transaction.atomic():
+            handled = apply_event(event.payload)
+        event.status = 'processed' if handled else 'ignored'
+        event.error = '' if handled else 'unhandled_event_type'
+    except Exception as e:
+        reason = 'shipment_not_found' if isinstance(e, ShipmentNotFound) else str(e)
+        if event.attempts < settings.EASYSHIP_WEBHOOK_MAX_ATTEMPTS:
+            event.error = reason
+            event.save(update_fields=['attempts', 'error'])
+            logger.warning(f"EasyShip webhook {event.id} ({event.event_type}) attempt {event.attempts} failed: {reason}")
+            return False
+        event.status = 'ignored' if isinstance(e, ShipmentNotFound) else 'failed'
+        event.error = reason
+        logger.error(f"EasyShip webhook {event.id} ({event.event_type}) gave up: {reason}")
+    event.processed_at = timezone.now()
+    event.save(update_fields=['status', 'attempts', 'error', 'processed_at'])
+    return True
+
+
+def process_pending_events():
+    """Queue shipments that still have pending events (lost dispatches, retries); returns the count"""
+    cutoff = timezone.now() - timedelta(seconds=RETRY_AFTER_SECONDS)
+    shipment_ids = set(
+        EasyShipWebhookEvent.objects.filter(status='pending', received_at__lt=cutoff)
+        .values_list('easyship_shipment_id', flat=True)
+    )
+    for easyship_shipment_id in shipment_ids:
+        dispatch(easyship_shipment_id)
+    return len(shipment_ids)
+
+
+def apply_event(data):
+    """Apply a webhook payload to its shipment; False for event types we don't handle"""
+    event_type = data.get('event_type')
+    handler = EVENT_HANDLERS.get(event_type)
+    if handler is None:
+        logger.warning(f"Unhandled EasyShip webhook event type: {event_type}")
+        return False
+    try:
+        shipment = LogisticsShipment.objects.select_for_update().get(easyship_shipment_id=event_shipment_id(data))
+    except LogisticsShipment.DoesNotExist:
+        raise ShipmentNotFound(event_shipment_id(data))
+    handler(shipment, event_type, data.get('data', {}))
+    return True
+
+
+def _label_created(shipment, event_type, webhook_data):
+    label_url = webhook_data.get('label_url', '')
+    tracking_number = webhook_data.get('tracking_number', '')
+    tracking_page_url = webhook_data.get('tracking_page_url', '')
+
+    if label_url:
+        shipment.easyship_label_url = label_url
+    if tracking_number:
+        shipment.tracking_number = tracking_number
+        shipment.local_carrier_tracking_number = tracking_number
+    if tracking_page_url:
+        shipment.tracking_page_url = tracking_page_url
+
+    # Change status from label_generating to processing
+    if shipment.status == 'label_generating':
+        shipment.status = 'processing'
+    shipment.save()
+
+    TrackingUpdate.objects.create(
+        shipment=shipment,
+        carrier_tracking_number=tracking_number,
+        status='label_created',
+        location='',
+        timestamp=timezone.now(),
+        source='webhook',
+        raw_data={
+            'event_type': event_type,
+            'label_url': label_url,
+            'tracking_number': tracking_number,
+            'status': 'success'
+        }
+    )
+    logger.info(f"Label created for shipment {shipment.id}: {tracking_number}")
+
+
+def _label_failed(shipment, event_type, webhook_data):
+    shipment.status = 'payment_received'  # Revert to previous status
+    shipment.save()
+
+    TrackingUpdate.objects.create(
+        shipment=shipment,
+        status='label_generation_failed',
+        location='',
+        timestamp=timezone.now(),
+        source='webhook',
+        raw_data={
+            'event_type': event_type,
+            'status': 'failed'
+        }
+    )
+    logger.warning(f"Label generation failed for shipment {shipment.id}")
+
+
+def _tracking_status_changed(shipment, event_type, webhook_data):
+    new_status = webhook_data.get('status', '')
+    tracking_number = webhook_data.get('tracking_number', shipment.tracking_number)
+
+    if new_status in TRACKING_STATUS_MAPPING:
+        shipment.status = TRACKING_STATUS_MAPPING[new_status]
+    if tracking_number:
+        shipment.tracking_number = tracking_number
+        shipment.local_carrier_tracking_number = tracking_number
+    shipment.save()
+
+    TrackingUpdate.objects.create(
+        shipment=shipment,
+        carrier_tracking_number=tracking_number,
+        status=new_status.lower().replace(' ', '_'),
+        location=webhook_data.get('destination', ''),
+        timestamp=timezone.now(),
+        source='webhook',
+        raw_data={
+            'event_type': event_type,
+            'status': new_status,
+            'tracking_number': tracking_number
+        }
+    )
+    logger.info(f"Tracking status changed for shipment {shipment.id}: {new_status}")
+
+
+def _tracking_checkpoints_created(shipment, event_type, webhook_data):
+    checkpoints = webhook_data.get('checkpoints', [])
+    tracking_number = webhook_data.get('tracking_number', shipment.tracking_number)
+
+    if tracking_number:
+        shipment.tracking_number = tracking_number
+        shipment.local_carrier_tracking_number = tracking_number
+    new_status = latest_checkpoint_status(checkpoints)
+    if new_status:
+        shipment.status = new_status
+    shipment.save()
+
+    # New checkpoints only (the tracking refresher may have stored some already), in one insert
+    created = store_checkpoints(shipment, checkpoints, tracking_number, source='webhook', event_type=event_type)
+    logger.info(f"Created {created} of {len(checkpoints)} tracking checkpoints for shipment {shipment.id}")
+
+
+def _cancelled(shipment, event_type, webhook_data):
+    shipment.status = 'cancelled'
+    shipment.save()
+
+    TrackingUpdate.objects.create(
+        shipment=shipment,
+        status='cancelled',
+        location='',
+        timestamp=timezone.now(),
+        source='webhook',
+        raw_data={
+            'event_type': event_type,
+            'status': 'cancelled'
+        }
+    )
+    logger.info(f"Shipment {shipment.id} was cancelled")
+
+
+EVENT_HANDLERS = {
+    'shipment.label.created': _label_created,
+    'shipment.label.failed': _label_failed,
+    'shipment.tracking.status.changed': _tracking_status_changed,
+    'shipment.tracking.checkpoints.created': _tracking_checkpoints_created,
+    'shipment.cancelled': _cancelled,
+}
@@ -0,0 +1,302 @@
+"""
+Background EasyShip label purchase.
+
+Views and the Stripe webhook no longer call EasyShipService.create_shipment
+inside the request. They call enqueue_label_purchase(), which stores a
+LabelPurchaseJob and hands it to the purchase_label Celery task, and return
+202 with the job id; clients poll /api/v1/logistics/label-jobs/<job_id>/.
+
+- Idempotency: one job per key (per shipment for shipment labels). Enqueueing
+  the same key again returns the existing job; a failed job is re-run.
+- Job state lives in the database: the task claims a pending job with an
+  atomic update, so duplicate task deliveries run it once.
+- Only failures where EasyShip never received the request are retried
+  automatically, with exponential backoff and jitter
+  (LABEL_PURCHASE_RETRY_BACKOFF, LABEL_PURCHASE_MAX_ATTEMPTS): connect
+  errors, the open circuit breaker, the local quota limiter and 429.
+- create_shipment is a paid POST. After a read timeout, a dropped connection
+  or a 5xx the label may already be bought, and nothing on our side can tell:
+  the EasyShip id only comes back in the response that was lost. Such jobs
+  become 'unconfirmed' and are not retried. Re-queueing one (admin action)
+  first looks EasyShip up by platform_order_number (the idempotency key) and
+  only buys if no shipment exists. Other 4xx responses fail the job.
+- The retry_label_jobs beat task re-dispatches jobs whose task was lost
+  (broker down at enqueue, worker killed mid-run). A job that was running
+  when its worker died is looked up before it buys again, like an
+  unconfirmed one.
+"""
+import hashlib
+import json
+import logging
+import random
+from datetime import timedelta
+
+import requests
+from urllib3.exceptions import NewConnectionError
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from logistics.models import EasyShipWebhookEvent, LabelPurchaseJob
+from logistics.services import easyship_webhooks
+from logistics.services.easyship_rate_limiter import EasyShipRateLimited
+from logistics.services.easyship_service import EasyShipService
+from logistics.services.easyship_transport import EasyShipUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Responses after which EasyShip may still have bought the label
+AMBIGUOUS_STATUS_CODES = {408, 409}
+
+
+def shipment_idempotency_key(shipment):
+    return f"shipment-{shipment.id}-label"
+
+
+def request_idempotency_key(prefix, user, create_kwargs, client_key=None):
+    """
+    Key for a label request: the client's Idempotency-Key when it sends one,
+    else a hash of everything that is bought (addresses, parcels, rate), so a
+    resubmitted form reuses its job while a different package gets its own.
+    """
+    if client_key:
+        return f"{prefix}-{user.id}-{client_key}"
+    digest = hashlib.sha256(json.dumps(create_kwargs, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return f"{prefix}-{user.id}-{digest}"
+
+
+def enqueue_label_purchase(idempotency_key, create_kwargs, user=None, shipment=None,
+                           kind='shipment', tracking_fields=('tracking_number',)):
+    """
+    Queue a label purchase; returns (job, created).
+
+    create_kwargs are the EasyShipService.create_shipment arguments (JSON only).
+    tracking_fields are the shipment fields set to the purchased tracking number.
+    """
+    job, created = LabelPurchaseJob.objects.get_or_create(
+        idempotency_key=idempotency_key,
+        defaults={
+            'kind': kind,
+            'user': user,
+            'shipment': shipment,
+            'request_data': create_kwargs,
+            'tracking_fields': list(tracking_fields),
+        }
+    )
+    if not created and job.status == 'unconfirmed':
+        logger.warning(f"Label purchase {idempotency_key} is unconfirmed; reconcile job {job.job_id} in the admin")
+    if not created and job.status == 'failed':
+        # Explicit retry of a failed purchase (same key, fresh attempts)
+        LabelPurchaseJob.objects.filter(pk=job.pk, status='failed').update(
+            status='pending', attempts=0, error='', next_attempt_at=None,
+            request_data=create_kwargs, tracking_fields=list(tracking_fields), updated_at=timezone.now()
+        )
+        job.refresh_from_db()
+        created = True
+
+    if created:
+        logger.info(f"Queued label purchase job {job.job_id} ({idempotency_key})")
+        transaction.on_commit(lambda: dispatch(job.job_id))
+    else:
+        logger.info(f"Label purchase {idempotency_key} already has job {job.job_id} ({job.status})")
+    return job, created
+
+
+def dispatch(job_id, countdown=0):
+    """Send the job to a Celery worker; if that fails, retry_label_jobs picks it up later"""
+    from logistics.tasks import purchase_label
+    try:
+        purchase_label.apply_async((str(job_id),), countdown=countdown, retry=False)
+    except Exception as e:
+        logger.error(f"Could not dispatch label purchase job {job_id}: {str(e)}")
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter: half the delay fixed, half random"""
+    delay = settings.LABEL_PURCHASE_RETRY_BACKOFF * (2 ** max(attempts - 1, 0))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def request_not_sent(error):
+    """True when EasyShip never got the request, so trying again cannot buy a second label"""
+    if isinstance(error, (EasyShipRateLimited, EasyShipUnavailable, requests.exceptions.ConnectTimeout)):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is not None and error.response.status_code == 429
+    if isinstance(error, requests.exceptions.ConnectionError):
+        # Connection refused / DNS failure; "connection aborted" may come after the request was sent
+        reason = error.args[0] if error.args else None
+        return isinstance(getattr(reason, 'reason', None), NewConnectionError)
+    return False
+
+
+def is_ambiguous(error):
+    """True when EasyShip may have bought the label although we got no usable answer"""
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        code = error.response.status_code
+        return code >= 500 or code in AMBIGUOUS_STATUS_CODES
+    return isinstance(error, requests.exceptions.RequestException)
+
+
+def describe_error(error):
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        try:
+            return f"EasyShip {error.response.status_code}: {error.response.json()}"
+        except ValueError:
+            return f"EasyShip {error.response.status_code}: {error.response.text[:500]}"
+    return str(error) or error.__class__.__name__
+
+
+def apply_label_result(shipment, result, tracking_fields):
+    """Copy a purchased label onto the shipment"""
+    shipment.easyship_shipment_id = result.get('shipment_id') or ''
+    for field in tracking_fields:
+        setattr(shipment, field, result.get('tracking_number') or '')
+    if result.get('tracking_page_url'):
+        shipment.tracking_page_url = result['tracking_page_url']
+    if result.get('label_url'):
+        shipment.easyship_label_url = result['label_url']
+        shipment.status = 'processing'
+    elif shipment.status != 'processing':
+        # Label is generated asynchronously by EasyShip; the label.created webhook completes it
+        shipment.status = 'label_generating'
+    shipment.save()
+    
+    # Webhooks for this label may have arrived before we knew the EasyShip id
+    if shipment.easyship_shipment_id and EasyShipWebhookEvent.objects.filter(
+        easyship_shipment_id=shipment.easyship_shipment_id, status='pending'
+    ).exists():
+        easyship_webhooks.dispatch(shipment.easyship_shipment_id)
+
+
+def run_label_purchase(job_id):
+    """Run one attempt of a job (the purchase_label task body); returns the job status"""
+    claimed = LabelPurchaseJob.objects.filter(job_id=job_id, status='pending').update(
+        status='running', attempts=F('attempts') + 1, updated_at=timezone.now()
+    )
+    if not claimed:
+        logger.info(f"Label purchase job {job_id} is not pending; skipping")
+        return None
+
+    job = LabelPurchaseJob.objects.select_related('shipment').get(job_id=job_id)
+    shipment = job.shipment
+
+    if shipment is not None and shipment.easyship_shipment_id:
+        # Bought by another path (e.g. an admin generated the label)
+        logger.warning(f"Shipment {shipment.id} already has EasyShip shipment {shipment.easyship_shipment_id}; "
+                       f"not buying another label for job {job_id}")
+        return _finish(job, 'succeeded', result={
+            'shipment_id': shipment.easyship_shipment_id,
+            'label_url': shipment.easyship_label_url,
+            'tracking_number': shipment.tracking_number or shipment.local_carrier_tracking_number,
+        })
+
+    easyship = EasyShipService()
+    if job.purchase_unconfirmed:
+        # An earlier attempt may have bought the label: look for it before buying again
+        try:
+            existing = easyship.find_shipments(job.idempotency_key)
+        except Exception as e:
+            return _retry(job, describe_error(e), retryable=isinstance(e, requests.exceptions.RequestException),
+                          exhausted_status='unconfirmed')
+        if existing:
+            logger.warning(f"Label purchase job {job_id}: EasyShip already has shipment "
+                           f"{existing[0]['shipment_id']} for {job.idempotency_key}; not buying another")
+            return _succeed(job, shipment, existing[0])
+        job.purchase_unconfirmed = False
+        job.save(update_fields=['purchase_unconfirmed', 'updated_at'])
+
+    try:
+        result = easyship.create_shipment(
+            **job.request_data, platform_order_number=job.idempotency_key, raise_errors=True
+        )
+    except Exception as e:
+        error = describe_error(e)
+        if request_not_sent(e):
+            return _retry(job, error, retryable=True)
+        if is_ambiguous(e):
+            logger.error(f"Label purchase job {job_id} attempt {job.attempts} has an unknown outcome ({error}); "
+                         f"the label may have been bought. Not retrying until it is reconciled.")
+            job.purchase_unconfirmed = True
+            job.save(update_fields=['purchase_unconfirmed', 'updated_at'])
+            return _finish(job, 'unconfirmed', error=error)
+        logger.error(f"Label purchase job {job_id} failed after {job.attempts} attempt(s): {error}")
+        return _finish(job, 'failed', error=error)
+
+    if not result:
+        return _finish(job, 'failed', error='EasyShip returned no shipment')
+    return _succeed(job, shipment, result)
+
+
+def _succeed(job, shipment, result):
+    if shipment is not None:
+        apply_label_result(shipment, result, job.tracking_fields)
+    job.purchase_unconfirmed = False
+    return _finish(job, 'succeeded', result=result)
+
+
+def _retry(job, error, retryable, exhausted_status='failed'):
+    """Schedule another attempt with backoff, or finish the job when out of attempts"""
+    if retryable and job.attempts < settings.LABEL_PURCHASE_MAX_ATTEMPTS:
+        delay = retry_delay(job.attempts)
+        logger.warning(f"Label purchase job {job.job_id} attempt {job.attempts} failed ({error}); retrying in {delay:.0f}s")
+        job.status = 'pending'
+        job.error = error
+        job.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+        job.save(update_fields=['status', 'error', 'next_attempt_at', 'updated_at'])
+        dispatch(job.job_id, countdown=delay)
+        return job.status
+    logger.error(f"Label purchase job {job.job_id} gave up after {job.attempts} attempt(s): {error}")
+    return _finish(job, exhausted_status, error=error)
+
+
+def _finish(job, status, result=None, error=''):
+    job.status = status
+    job.result = result or {}
+    job.error = error
+    job.next_attempt_at = None
+    job.completed_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'next_attempt_at', 'purchase_unconfirmed',
+                            'completed_at', 'updated_at'])
+    logger.info(f"Label purchase job {job.job_id} {status}")
+    return status
+
+
+def requeue_stalled_jobs():
+    """
+    Re-dispatch jobs whose task never ran: pending past their attempt time, or
+    running longer than LABEL_PURCHASE_RUNNING_TIMEOUT (worker died). Returns the count.
+    """
+    now = timezone.now()
+    grace = timedelta(seconds=60)
+    stalled_running = LabelPurchaseJob.objects.filter(
+        status='running', updated_at__lt=now - timedelta(seconds=settings.LABEL_PURCHASE_RUNNING_TIMEOUT)
+    )
+    for job in stalled_running:
+        logger.warning(f"Label purchase job {job.job_id} stalled while running; re-queueing")
+    # The dead worker may have sent create_shipment already
+    stalled_running.update(status='pending', next_attempt_at=None, purchase_unconfirmed=True, updated_at=now)
+
+    pending = LabelPurchaseJob.objects.filter(status='pending', updated_at__lt=now - grace).filter(
+        Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lt=now - grace)
+    ).values_list('job_id', flat=True)
+    job_ids = list(pending)
+    for job_id in job_ids:
+        dispatch(job_id)
+    return len(job_ids)
+
+
+def reconcile_unconfirmed_jobs(queryset):
+    """
+    Re-queue unconfirmed jobs (admin action). Each one looks EasyShip up by its
+    idempotency key first and only buys a label if none exists. Returns the count.
+    """
+    job_ids = list(queryset.filter(status='unconfirmed').values_list('job_id', flat=True))
+    LabelPurchaseJob.objects.filter(job_id__in=job_ids, status='unconfirmed').update(
+        status='pending', attempts=0, next_attempt_at=None, purchase_unconfirmed=True,
+        completed_at=None, updated_at=timezone.now()
+    )
+    for job_id in job_ids:
+        dispatch(job_id)
+    return len(job_ids)
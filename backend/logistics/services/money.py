@@ -0,0 +1,133 @@
+"""
+Fixed-point money and weight helpers for the pricing calculator.
+
+Rounding rules:
+- Amounts are integer cents. A charge is rounded ROUND_HALF_UP to the cent once,
+  when the line item is produced (base rate, each surcharge/fee, markup).
+- Totals are sums of already rounded line items, so total == sum(breakdown) exactly.
+- Percentages (fuel surcharge, markup) are applied to the rounded amount and the
+  result is rounded again.
+- Weights are integer grams, rounded ROUND_HALF_UP from kg.
+
+Quote dicts stay JSON-safe: amounts are written as dollars via Money.to_json()
+(plus the exact '*_cents' value where it is stored or compared later).
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+CENT = Decimal('0.01')
+HUNDRED = Decimal('100')
+GRAMS_PER_KG = Decimal('1000')
+
+
+def _decimal(value):
+    if isinstance(value, Decimal):
+        return value
+    if value is None or value == '':
+        return Decimal('0')
+    return Decimal(str(value))
+
+
+class Money:
+    """Amount in integer cents"""
+    __slots__ = ('cents',)
+
+    def __init__(self, cents=0):
+        self.cents = int(cents)
+
+    @classmethod
+    def from_amount(cls, amount):
+        """Dollars (Decimal/float/str) -> Money, rounded half-up to the cent"""
+        return cls(int((_decimal(amount) * HUNDRED).quantize(Decimal('1'), rounding=ROUND_HALF_UP)))
+
+    @classmethod
+    def from_cents(cls, cents):
+        return cls(cents)
+
+    def __add__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents + other.cents)
+        if other == 0:
+            return self
+        return NotImplemented
+
+    __radd__ = __add__  # allows sum()
+
+    def __sub__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents - other.cents)
+        return NotImplemented
+
+    def __mul__(self, factor):
+        """Money x factor, rounded half-up to the cent"""
+        return Money(int((Decimal(self.cents) * _decimal(factor)).quantize(Decimal('1'), rounding=ROUND_HALF_UP)))
+
+    __rmul__ = __mul__
+
+    def percent(self, percent):
+        return self * (_decimal(percent) / HUNDRED)
+
+    def _cents(self, other):
+        return other.cents if isinstance(other, Money) else Money.from_amount(other).cents
+
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.cents == other.cents
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.cents)
+
+    def __lt__(self, other):
+        return self.cents < self._cents(other)
+
+    def __le__(self, other):
+        return self.cents <= self._cents(other)
+
+    def __gt__(self, other):
+        return self.cents > self._cents(other)
+
+    def __ge__(self, other):
+        return self.cents >= self._cents(other)
+
+    def __bool__(self):
+        return self.cents != 0
+
+    def __repr__(self):
+        return f"Money({self.to_decimal()})"
+
+    def __str__(self):
+        return str(self.to_decimal())
+
+    def to_decimal(self):
+        return Decimal(self.cents) / HUNDRED
+
+    def to_json(self):
+        """Dollars as float for API responses / JSONField storage"""
+        return self.cents / 100
+
+
+def kg_to_grams(kg):
+    """kg (Decimal/float/str) -> integer grams, rounded half-up"""
+    return int((_decimal(kg) * GRAMS_PER_KG).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def grams_to_kg(grams):
+    """Integer grams -> exact Decimal kg"""
+    return Decimal(grams) / GRAMS_PER_KG
+
+
+def add_charge(quote, amount):
+    """Add a charge (Money or dollars) to a quote dict's total without float drift"""
+    charge = amount if isinstance(amount, Money) else Money.from_amount(amount)
+    total = Money(quote['total_cents']) if 'total_cents' in quote else Money.from_amount(quote.get('total', 0))
+    total = total + charge
+    quote['total_cents'] = total.cents
+    quote['total'] = total.to_json()
+    return quote
+
+
+def quote_total(quote):
+    """Exact total of a quote dict (prefers total_cents over the float total)"""
+    if quote.get('total_cents') is not None:
+        return Money(quote['total_cents'])
+    return Money.from_amount(quote.get('total', quote.get('total_cost', 0)))
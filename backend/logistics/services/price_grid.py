@@ -0,0 +1,281 @@
+"""
+Precomputed price grid.
+
+Route freight only depends on the route's calculation settings, the weight and
+the box, so it is priced ahead of time for every available route, shipping
+category, weight break and standard box (dimension bucket) and stored in
+PriceGridEntry. Quote requests with a standard box are then served from the
+grid:
+- exact weight break: the stored quote, identical to live pricing
+- between two breaks (PRICE_GRID_INTERPOLATE): components interpolated to
+  the cent, only when both breaks are priced by the same formula (same air
+  chargeable-weight rule, same sea LCL/FCL basis, same truck LTL/FTL side);
+  otherwise live pricing. Live pricing rounds each line item, so an
+  interpolated total can be a few cents off the live one; off by default.
+- anything else (custom box, weight outside the grid, grid built for an older
+  rate card version): live pricing
+
+The grid is tagged with the rate card version it was built from and is only
+used while that version is current, so an admin edit falls back to live
+pricing until the grid is rebuilt (build_price_grid command / Celery beat).
+"""
+import copy
+import logging
+import threading
+from bisect import bisect_left
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from logistics.models import PriceGridEntry
+from logistics.services.money import Money, kg_to_grams, grams_to_kg
+from logistics.services.pricing_kernel import price_matrix
+
+logger = logging.getLogger(__name__)
+
+PRICE_GRID_VERSION_KEY = 'price_grid_version'
+
+# Weight breaks (kg) per shipping category
+WEIGHT_BREAKS_KG = {
+    'small_parcel': ('0.5', '1', '1.5', '2', '3', '4', '5', '7.5', '10', '15', '20', '25', '30'),
+    'heavy_parcel': ('30', '40', '50', '60', '70', '80', '90', '100'),
+}
+
+# Standard boxes (cm) customers pick on the quote page
+DIMENSION_BUCKETS = {
+    'envelope': {'length': 35, 'width': 25, 'height': 3},
+    'small_box': {'length': 30, 'width': 20, 'height': 15},
+    'medium_box': {'length': 40, 'width': 30, 'height': 25},
+    'large_box': {'length': 60, 'width': 40, 'height': 40},
+    'xl_box': {'length': 80, 'width': 60, 'height': 60},
+}
+
+# Transport modes quoted per category (same as get_all_quotes)
+GRID_MODES = {
+    'small_parcel': ('air',),
+    'heavy_parcel': ('air', 'sea'),
+}
+
+# Quote fields that add up to 'total', per pricing formula
+TOTAL_COMPONENTS = {
+    'air': ('base_rate', 'fuel_surcharge', 'security_fee', 'markup'),
+    'sea_fcl': ('base_rate', 'origin_fees', 'destination_fees', 'customs_fee', 'delivery_fee', 'markup'),
+    'sea_lcl': ('base_rate', 'ocean_freight_base', 'port_origin_handling', 'port_destination_handling',
+                'documentation_fee', 'customs_clearance_fee', 'destination_delivery_fee', 'markup'),
+    'rail': ('base_rate', 'terminal_handling', 'customs_fee', 'markup'),
+    'truck': ('base_rate', 'fuel_surcharge', 'accessorials', 'markup'),
+}
+
+# Non-money numeric fields that scale with weight
+WEIGHT_FIELDS = ('chargeable_weight', 'actual_weight', 'weight_ton')
+
+TRUCK_FTL_THRESHOLD_GRAMS = kg_to_grams('4535.92')  # 10,000 lbs
+
+_grid = None
+_grid_lock = threading.Lock()
+
+
+def _box_key(dimensions):
+    """(length, width, height) in whole thousandths of a cm, so '30', 30 and 30.0 compare equal"""
+    return tuple(
+        int((Decimal(str(dimensions.get(key) or 0)) * 1000).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+        for key in ('length', 'width', 'height')
+    )
+
+
+def bucket_for(dimensions):
+    """Name of the standard box matching dimensions exactly, or None"""
+    if not isinstance(dimensions, dict):
+        return None
+    try:
+        box = _box_key(dimensions)
+    except Exception:
+        return None
+    for name, bucket in DIMENSION_BUCKETS.items():
+        if box == _box_key(bucket):
+            return name
+    return None
+
+
+def get_price_grid_version():
+    """Rate card version the stored grid was built from (None if never built)"""
+    return cache.get(PRICE_GRID_VERSION_KEY)
+
+
+def build_price_grid(categories=None):
+    """
+    Price every available route x category x weight break x box and replace the
+    stored grid. Each category is priced as one pricing_kernel matrix.
+    Returns the number of entries written.
+    """
+    from logistics.services.pricing_calculator import PricingCalculator
+
+    calculator = PricingCalculator()
+    rate_card = calculator.pin_rate_card()
+    version = rate_card.version
+    categories = categories or list(WEIGHT_BREAKS_KG.keys())
+
+    entries = []
+    for category in categories:
+        routes = [
+            route for route in rate_card.available_routes()
+            if route.transport_mode.type in GRID_MODES.get(category, ())
+            and rate_card.has_calculation_settings(route)
+        ]
+        if not routes:
+            continue
+        cells = [
+            (bucket, dimensions, weight)
+            for bucket, dimensions in DIMENSION_BUCKETS.items()
+            for weight in WEIGHT_BREAKS_KG[category]
+        ]
+        matrix = price_matrix(
+            calculator, routes, [{'weight': weight, 'dimensions': dimensions} for _, dimensions, weight in cells],
+            category
+        )
+        for route_index, route in enumerate(routes):
+            for shipment_index, (bucket, _, weight) in enumerate(cells):
+                quote = matrix.quote(route_index, shipment_index)
+                if quote is None:
+                    continue
+                entries.append(PriceGridEntry(
+                    route=route,
+                    shipping_category=category,
+                    dimension_bucket=bucket,
+                    weight_grams=kg_to_grams(weight),
+                    total_cents=quote['total_cents'],
+                    quote=quote,
+                    rate_card_version=version,
+                ))
+
+    with transaction.atomic():
+        PriceGridEntry.objects.filter(shipping_category__in=categories).delete()
+        PriceGridEntry.objects.bulk_create(entries, batch_size=500)
+    cache.set(PRICE_GRID_VERSION_KEY, version, None)
+    logger.info(f"Built price grid for rate card version {version}: {len(entries)} entries")
+    return len(entries)
+
+
+class PriceGrid:
+    """In-memory copy of the stored grid for one rate card version"""
+
+    def __init__(self, version):
+        self.version = version
+        self._series = {}
+        entries = PriceGridEntry.objects.filter(rate_card_version=version).order_by(
+            'route_id', 'shipping_category', 'dimension_bucket', 'weight_grams'
+        ).values_list('route_id', 'shipping_category', 'dimension_bucket', 'weight_grams', 'quote')
+        for route_id, category, bucket, weight_grams, quote in entries:
+            grams, quotes = self._series.setdefault((route_id, category, bucket), ([], []))
+            grams.append(weight_grams)
+            quotes.append(quote)
+
+    def __len__(self):
+        return sum(len(grams) for grams, _ in self._series.values())
+
+    def lookup(self, route, weight, dimensions, shipping_category):
+        """Grid quote for the request, or None when it has to be priced live"""
+        bucket = bucket_for(dimensions)
+        if bucket is None:
+            return None
+        series = self._series.get((route.id, shipping_category, bucket))
+        if not series:
+            return None
+        grams, quotes = series
+        weight_grams = kg_to_grams(weight)
+        i = bisect_left(grams, weight_grams)
+        if i < len(grams) and grams[i] == weight_grams:
+            quote = copy.deepcopy(quotes[i])
+            quote['price_source'] = 'grid'
+            return quote
+        if not settings.PRICE_GRID_INTERPOLATE or i == 0 or i == len(grams):
+            return None
+        return _interpolate(route.transport_mode.type, grams[i - 1], quotes[i - 1],
+                            grams[i], quotes[i], weight_grams)
+
+
+def _formula(mode_type, quote):
+    if mode_type == 'sea':
+        return 'sea_fcl' if quote.get('is_fcl') else 'sea_lcl'
+    return mode_type
+
+
+def _same_regime(mode_type, lo_grams, lo, hi_grams, hi):
+    """True when every weight between the two breaks is priced by the same linear formula"""
+    if mode_type == 'air':
+        # Both by actual weight (linear) or both by dimensional weight (constant)
+        return (lo['chargeable_weight'] == lo['actual_weight']) == (hi['chargeable_weight'] == hi['actual_weight'])
+    if mode_type == 'sea':
+        if lo.get('is_fcl') != hi.get('is_fcl'):
+            return False
+        if lo.get('is_fcl'):
+            return True
+        # LCL: max(volume, weight) must pick the same side at both ends
+        return (lo['cost_by_weight'] >= lo['cost_by_volume']) == (hi['cost_by_weight'] >= hi['cost_by_volume'])
+    if mode_type == 'truck':
+        return (lo_grams < TRUCK_FTL_THRESHOLD_GRAMS) == (hi_grams < TRUCK_FTL_THRESHOLD_GRAMS)
+    return mode_type == 'rail'
+
+
+def _lerp(lo_value, hi_value, fraction):
+    return lo_value + (hi_value - lo_value) * fraction
+
+
+def _interpolate(mode_type, lo_grams, lo, hi_grams, hi, weight_grams):
+    if not _same_regime(mode_type, lo_grams, lo, hi_grams, hi):
+        return None
+    fraction = (weight_grams - lo_grams) / (hi_grams - lo_grams)
+    quote = copy.deepcopy(lo)
+
+    def money(lo_amount, hi_amount):
+        lo_cents = Money.from_amount(lo_amount).cents
+        hi_cents = Money.from_amount(hi_amount).cents
+        return Money(round(_lerp(lo_cents, hi_cents, fraction)))
+
+    total = Money()
+    for key in TOTAL_COMPONENTS[_formula(mode_type, lo)]:
+        amount = money(lo.get(key, 0), hi.get(key, 0))
+        quote[key] = amount.to_json()
+        total = total + amount
+    for key in ('cost_by_volume', 'cost_by_weight'):
+        if key in lo:
+            quote[key] = money(lo[key], hi[key]).to_json()
+    for key, value in lo.get('breakdown', {}).items():
+        quote['breakdown'][key] = money(value, hi['breakdown'].get(key, 0)).to_json()
+    for key in WEIGHT_FIELDS:
+        if key in lo:
+            quote[key] = float(grams_to_kg(round(_lerp(kg_to_grams(lo[key]), kg_to_grams(hi[key]), fraction))))
+    if 'actual_weight' in quote:
+        quote['actual_weight'] = float(grams_to_kg(weight_grams))
+
+    quote['total'] = total.to_json()
+    quote['total_cents'] = total.cents
+    quote['price_source'] = 'grid_interpolated'
+    return quote
+
+
+def get_price_grid(version):
+    """Loaded grid for the rate card version, or None if the stored grid is for another version"""
+    global _grid
+    if get_price_grid_version() != version:
+        return None
+    grid = _grid
+    if grid is not None and grid.version == version:
+        return grid
+    with _grid_lock:
+        if _grid is None or _grid.version != version:
+            _grid = PriceGrid(version)
+            logger.info(f"Loaded price grid for rate card version {version}: {len(_grid)} entries")
+        return _grid
+
+
+def lookup_price_grid(route, weight, dimensions, shipping_category, version):
+    """Grid quote for a route, or None (no grid / stale grid / not on the grid)"""
+    if not settings.PRICE_GRID_ENABLED:
+        return None
+    grid = get_price_grid(version)
+    if grid is None:
+        return None
+    return grid.lookup(route, weight, dimensions, shipping_category)
@@ -6,30 +6,75 @@ from datetime import datetime, timedelta
 from django.conf import settings
 from django.utils import timezone
 import logging
-from logistics.models import (
-    ShippingRoute, TransportMode, 
-    ShippingCalculationSettings, Country, Warehouse, PickupCalculationSettings
-)
+from contextlib import contextmanager
+from logistics.models import ShippingCalculationSettings, Country
 from logistics.services.easyship_service import EasyShipService
-from django.db import models
+from logistics.services.rate_card import get_rate_card
+from logistics.services.pricing_context import PricingContext
+from logistics.services.money import Money, kg_to_grams, grams_to_kg, add_charge
+from logistics.services.quote_fingerprint import quote_fingerprint
+from logistics.services.price_grid import get_price_grid, lookup_price_grid
+from logistics.services.pricing_kernel import cell_key, price_matrix
+from django.core.cache import cache
 
 logger = logging.getLogger(__name__)
 
+# Transport modes quoted per shipping category (anything else: every mode)
+CATEGORY_MODES = {
+    'small_parcel': ['air'],
+    'heavy_parcel': ['air', 'sea'],
+    'ltl_freight': ['air', 'sea', 'rail', 'truck'],
+    'ftl_freight': ['air', 'sea', 'rail', 'truck'],
+    'vehicle': ['sea'],
+    'super_heavy': ['sea'],
+}
+ALL_MODES = ['air', 'sea', 'rail', 'truck']
+
 
 class PricingCalculator:
     """Calculate shipping costs for different transport modes"""
     
     def __init__(self):
         self.easyship = EasyShipService()
+        self.last_pricing_context = None
+        self._rate_card = None
+        self._price_grid = None
+        self._primed_freight = {}
         print("Initialized PricingCalculator.")
+    
+    @property
+    def rate_card(self):
+        """Current in-memory rate card snapshot (rebuilt when admins edit pricing models)"""
+        if self._rate_card is not None:
+            return self._rate_card
+        return get_rate_card()
+    
+    def pin_rate_card(self, rate_card=None):
+        """Price every following quote against one snapshot and its price grid (batch quoting, grid build)"""
+        self._rate_card = rate_card or get_rate_card()
+        self._price_grid = get_price_grid(self._rate_card.version) if settings.PRICE_GRID_ENABLED else None
+        return self._rate_card
+    
+    @contextmanager
+    def pinned_rate_card(self, rate_card=None):
+        """Pin a snapshot for the block, unless one is pinned already; unpins afterwards"""
+        if self._rate_card is not None:
+            yield self._rate_card
+            return
+        try:
+            yield self.pin_rate_card(rate_card)
+        finally:
+            self._rate_card = None
+            self._price_grid = None
 
     def get_warehouse_address(self, origin_country, shipping_category='all'):
         """Get warehouse address from database based on country and category"""
         print(f"Getting warehouse address for origin_country: {origin_country}, shipping_category: {shipping_category}")
+        rate_card = self.rate_card
         if isinstance(origin_country, str):
             # Get country object
             try:
-                origin_country = Country.objects.get(code=origin_country)
+                origin_country = rate_card.get_country(origin_country)
             except Country.DoesNotExist:
                 print(f"Country with code {origin_country} does not exist.")
                 return None
@@ -39,10 +84,7 @@ class PricingCalculator:
         
         # Try to find warehouse matching category
         # Check if warehouse supports the requested category (either has 'all' or the specific category)
-        warehouses = Warehouse.objects.filter(
-            country=origin_country,
-            is_active=True
-        ).order_by('-priority')
+        warehouses = rate_card.warehouses_for(origin_country)
         
         # Find warehouse that supports the requested category
         warehouse = None
@@ -129,53 +171,23 @@ class PricingCalculator:
             origin_state = origin_address.get('state_province', '')
             
             # Get country object
+            rate_card = self.rate_card
             try:
-                country_obj = Country.objects.get(code=origin_country)
+                country_obj = rate_card.get_country(origin_country)
                 print(f"Country object found: {country_obj}")
             except Country.DoesNotExist:
                 print(f"Country with code {origin_country} does not exist. Returning 0.0.")
                 return 0.0
             
-            # Get pickup settings - try specific state/category first, then fallback
-            settings = None
-            
-            # Try exact match: country + state + category
-            if origin_state:
-                settings = PickupCalculationSettings.objects.filter(
-                    country=country_obj,
-                    state=origin_state,
-                    shipping_category__in=[shipping_category, 'all'],
-                    is_active=True
-                ).order_by('-shipping_category').first()  # Prefer specific category over 'all'
-                print(f"PickupCalculationSettings with state: {settings}")
-            
-            # Fallback: country + category (no state)
-            if not settings:
-                settings = PickupCalculationSettings.objects.filter(
-                    country=country_obj,
-                    state='',
-                    shipping_category__in=[shipping_category, 'all'],
-                    is_active=True
-                ).order_by('-shipping_category').first()
-                print(f"PickupCalculationSettings with empty state: {settings}")
-            
-            # Fallback: country only (any category)
-            if not settings:
-                settings = PickupCalculationSettings.objects.filter(
-                    country=country_obj,
-                    shipping_category='all',
-                    is_active=True
-                ).first()
-                print(f"PickupCalculationSettings country only: {settings}")
+            # Get pickup settings - state + category, then country + category, then country 'all'
+            settings = rate_card.find_pickup_settings(country_obj, origin_state, shipping_category)
+            print(f"PickupCalculationSettings: {settings}")
             
             # If no settings found, get global fallback defaults
             if not settings:
                 logger.warning("No PickupCalculationSettings found; using global fallback defaults.")
                 # Try to get global fallback settings
-                fallback_settings = PickupCalculationSettings.objects.filter(
-                    is_global_fallback=True,
-                    is_active=True
-                ).first()
+                fallback_settings = rate_card.pickup_fallback
                 
                 if fallback_settings:
                     base_fee = Decimal(str(fallback_settings.base_pickup_fee))
@@ -191,7 +203,7 @@ class PricingCalculator:
                 
                 weight_decimal = Decimal(str(weight))
                 cost = base_fee + (weight_decimal * per_kg)
-                result = float(max(cost, minimum))
+                result = Money.from_amount(max(cost, minimum)).to_json()
                 logger.debug(f"Default pickup cost: {result}")
                 return result
             
@@ -247,7 +259,7 @@ class PricingCalculator:
                 print(f"Total cost {total_cost} is less than minimum {settings.minimum_pickup_fee}, using minimum.")
             total_cost = max(total_cost, settings.minimum_pickup_fee)
             
-            result = float(total_cost)
+            result = Money.from_amount(total_cost).to_json()
             print(f"Final pickup cost: {result}")
             return result
         except Exception as e:
@@ -260,37 +272,19 @@ class PricingCalculator:
         """Get calculation settings (route-specific or global default) filtered by category"""
         logger.debug(f"Fetching calculation settings for route {route}, mode {transport_mode}, category {shipping_category}")
         
-        # Try route-specific first (with category match)
-        if route:
-            settings_obj = ShippingCalculationSettings.objects.filter(
-                route=route,
-                transport_mode=transport_mode,
-                is_global_default=False
-            ).first()
-            
-            # Check if settings support this category
-            if settings_obj and settings_obj.supports_category(shipping_category):
-                logger.debug(f"Found route-specific settings: {settings_obj}")
-                return settings_obj
-        
-        # Fallback to global default (with category match)
-        logger.debug("No route-specific calculation settings found, looking for global default.")
-        global_settings = ShippingCalculationSettings.objects.filter(
-            transport_mode=transport_mode,
-            is_global_default=True
-        )
-        
-        # Find settings that support this category
-        for settings_obj in global_settings:
-            if settings_obj.supports_category(shipping_category):
-                logger.debug(f"Found global default settings: {settings_obj}")
-                return settings_obj
-        
-        # If no category-specific settings found, try settings with empty categories (applies to all)
-        for settings_obj in global_settings:
-            if not settings_obj.shipping_categories:  # Empty list means all categories
-                logger.debug(f"Found global default settings (all categories): {settings_obj}")
-                return settings_obj
+        # Route-specific settings first, then global default (both filtered by category);
+        # precomputed per lane/mode/category for available routes priced with their own mode
+        rate_card = self.rate_card
+        settings_obj = None
+        if route and transport_mode and transport_mode.id == route.transport_mode_id:
+            settings_obj = rate_card.settings_for(
+                route.origin_country_id, route.destination_country_id, transport_mode.code, shipping_category
+            )
+        if settings_obj is None:
+            settings_obj = rate_card.calculation_settings(route, transport_mode, shipping_category)
+        if settings_obj:
+            logger.debug(f"Found calculation settings: {settings_obj}")
+            return settings_obj
         
         # Create default if none exists
         logger.warning(f"No calculation settings found for {transport_mode} and category {shipping_category}, creating new one.")
@@ -349,58 +343,37 @@ class PricingCalculator:
         if not origin_country:
             return False, None
         
+        rate_card = self.rate_card
         try:
-            country_obj = Country.objects.get(code=origin_country)
+            country_obj = rate_card.get_country(origin_country)
         except Country.DoesNotExist:
             return False, None
         
-        # Try to find pickup settings - most specific first
-        settings = None
-        
-        # 1. Try exact match: country + state + category
-        if origin_state:
-            settings = PickupCalculationSettings.objects.filter(
-                country=country_obj,
-                state=origin_state,
-                shipping_category__in=[shipping_category, 'all'],
-                is_active=True
-            ).order_by('-shipping_category').first()
-        
-        # 2. Fallback: country + category (no state)
-        if not settings:
-            settings = PickupCalculationSettings.objects.filter(
-                country=country_obj,
-                state='',
-                shipping_category__in=[shipping_category, 'all'],
-                is_active=True
-            ).order_by('-shipping_category').first()
-        
-        # 3. Final fallback: country only, 'all' category
-        if not settings:
-            settings = PickupCalculationSettings.objects.filter(
-                country=country_obj,
-                shipping_category='all',
-                is_active=True
-            ).first()
+        # Most specific first: state + category, country + category, country 'all'
+        settings = rate_card.find_pickup_settings(country_obj, origin_state, shipping_category)
         
         return settings is not None, settings
     
     def get_international_parcel_quotes(self, origin_country, destination_country, weight, dimensions,
                                         declared_value=0, items=None, origin_address=None, 
-                                        warehouse_address=None, destination_address=None, shipping_category='small_parcel'):
+                                        warehouse_address=None, destination_address=None, shipping_category='small_parcel',
+                                        pricing_context=None):
         """
         Get quotes for international parcels using two-leg shipping:
         1. User drop-off → Warehouse (EasyShip)
         2. Warehouse → Destination (routes from DB)
         
         Returns combined quotes with breakdown showing both legs.
+        With a pricing_context the EasyShip leg runs in the background while the
+        routes are priced; if it misses the deadline the route quotes are returned
+        with missing_legs=['leg1_easyship'].
         """
         print(f"Getting international parcel quotes with two-leg shipping")
         quotes = []
         
-        # Step 1: Get EasyShip rates from origin to warehouse
+        # Step 1: Start EasyShip rates from origin to warehouse
         print(f"Step 1: Getting EasyShip rates from origin to warehouse")
-        easyship_rates = self.easyship.get_rates(
+        leg1_args = (
             origin_country, 
             warehouse_address.get('country', origin_country) if warehouse_address else origin_country,
             weight, 
@@ -410,10 +383,13 @@ class PricingCalculator:
             origin_address, 
             warehouse_address
         )
-        
-        if not easyship_rates:
-            logger.warning("No EasyShip rates found for origin to warehouse. Cannot provide international parcel quotes.")
-            return []  # Cannot proceed without EasyShip rates
+        if pricing_context:
+            pricing_context.prefetch_easyship_rates('leg1_easyship', *leg1_args)
+        else:
+            easyship_rates = self.easyship.get_rates(*leg1_args)
+            if not easyship_rates:
+                logger.warning("No EasyShip rates found for origin to warehouse. Cannot provide international parcel quotes.")
+                return []  # Cannot proceed without EasyShip rates
         
         # Step 2: Get routes from warehouse to destination
         print(f"Step 2: Getting routes from warehouse to destination")
@@ -424,9 +400,10 @@ class PricingCalculator:
             warehouse_country_code = origin_country
         
         # Get country objects
+        rate_card = self.rate_card
         if isinstance(destination_country, str):
             try:
-                destination_country_obj = Country.objects.get(code=destination_country)
+                destination_country_obj = rate_card.get_country(destination_country)
             except Country.DoesNotExist:
                 logger.error(f"Destination country {destination_country} not found in database")
                 return []
@@ -435,7 +412,7 @@ class PricingCalculator:
             
         if isinstance(warehouse_country_code, str):
             try:
-                warehouse_country_obj = Country.objects.get(code=warehouse_country_code)
+                warehouse_country_obj = rate_card.get_country(warehouse_country_code)
             except Country.DoesNotExist:
                 logger.error(f"Warehouse country {warehouse_country_code} not found in database")
                 return []
@@ -443,13 +420,9 @@ class PricingCalculator:
             warehouse_country_obj = warehouse_country_code
         
         # Get available routes from warehouse country to destination
-        routes = ShippingRoute.objects.filter(
-            origin_country=warehouse_country_obj,
-            destination_country=destination_country_obj,
-            is_available=True
-        ).select_related('transport_mode')
+        routes = rate_card.routes_for(warehouse_country_obj, destination_country_obj)
         
-        if not routes.exists():
+        if not routes:
             logger.warning(f"No routes found from warehouse ({warehouse_country_code}) to destination ({destination_country}). Cannot provide international parcel quotes.")
             return []  # Cannot proceed without routes
         
@@ -463,12 +436,51 @@ class PricingCalculator:
             allowed_modes = ['air', 'sea', 'rail', 'truck']
         
         print(f"Allowed transport modes for category {shipping_category}: {allowed_modes}")
-        print(f"Found {routes.count()} routes from warehouse to destination")
+        print(f"Found {len(routes)} routes from warehouse to destination")
+        
+        # Calculate route cost from warehouse to destination (once per route)
+        route_quotes = []
+        for route in routes:
+            mode_type = route.transport_mode.type
+            
+            if mode_type not in allowed_modes:
+                continue
+            
+            route_quote = self.calculate_route_freight(route, weight, dimensions, declared_value, shipping_category)
+            if route_quote is None:
+                continue
+            route_quotes.append((route, route_quote))
+        
+        if pricing_context:
+            easyship_rates = pricing_context.easyship_rates('leg1_easyship', *leg1_args)
+            if easyship_rates is None and 'leg1_easyship' in pricing_context.missing_legs:
+                # Deadline passed: return leg 2 quotes so the page can render, flagged as partial
+                for route, route_quote in route_quotes:
+                    route_quote.update({
+                        'transport_mode': route.transport_mode.code,
+                        'transport_mode_name': route.transport_mode.name,
+                        'route_id': route.id,
+                        'carrier': route.carrier or 'Multiple Carriers',
+                        'priority': route.priority,
+                        'shipping_category': shipping_category,
+                        'pickup_required': False,
+                        'is_local_shipping': False,
+                        'is_international_parcel': True,
+                        'requires_drop_off': True,
+                        'missing_legs': ['leg1_easyship'],
+                    })
+                    quotes.append(route_quote)
+                quotes.sort(key=lambda x: x.get('total', 0))
+                return quotes
+            if not easyship_rates:
+                logger.warning("No EasyShip rates found for origin to warehouse. Cannot provide international parcel quotes.")
+                return []  # Cannot proceed without EasyShip rates
         
         # Step 3: Combine EasyShip rates with route quotes
         logger.info(f"Processing {len(easyship_rates)} EasyShip rates for international parcel quotes")
         for idx, easyship_rate in enumerate(easyship_rates):
-            easyship_cost = float(easyship_rate.get('total_charge', 0))
+            easyship_money = Money.from_amount(easyship_rate.get('total_charge', 0))
+            easyship_cost = easyship_money.to_json()
             # Try multiple possible fields for rate ID
             easyship_rate_id = (
                 easyship_rate.get('id') or
@@ -486,26 +498,9 @@ class PricingCalculator:
             )
             
             # For each route from warehouse to destination
-            for route in routes:
-                mode_type = route.transport_mode.type
-                
-                if mode_type not in allowed_modes:
-                    continue
-                
-                # Calculate route cost from warehouse to destination
-                if mode_type == 'air':
-                    route_quote = self.calculate_air_freight(route, weight, dimensions, declared_value, shipping_category)
-                elif mode_type == 'sea':
-                    route_quote = self.calculate_sea_freight(route, weight, dimensions, declared_value, shipping_category)
-                elif mode_type == 'rail':
-                    route_quote = self.calculate_rail_freight(route, weight, dimensions, declared_value, shipping_category)
-                elif mode_type == 'truck':
-                    route_quote = self.calculate_truck_freight(route, weight, dimensions, declared_value, 70, shipping_category)
-                else:
-                    continue
-                
+            for route, route_quote in route_quotes:
                 # Combine both legs
-                combined_total = easyship_cost + route_quote['total']
+                combined_total = easyship_money + Money(route_quote['total_cents'])
                 combined_transit_days = (
                     transit_days_to_warehouse[0] + route_quote['transit_days'][0],
                     transit_days_to_warehouse[1] + route_quote['transit_days'][1]
@@ -566,7 +561,8 @@ class PricingCalculator:
                     },
                     
                     # Combined totals
-                    'total': combined_total,
+                    'total': combined_total.to_json(),
+                    'total_cents': combined_total.cents,
                     'transit_days': combined_transit_days,
                     'transit_days_min': combined_transit_days[0],
                     'transit_days_max': combined_transit_days[1],
@@ -575,7 +571,7 @@ class PricingCalculator:
                     'breakdown': {
                         'leg1_origin_to_warehouse': easyship_cost,
                         'leg2_warehouse_to_destination': route_quote['total'],
-                        'total': combined_total,
+                        'total': combined_total.to_json(),
                     },
                     
                     # Base rate for compatibility
@@ -638,7 +634,7 @@ class PricingCalculator:
             )
             if rates:
                 rate_info = {
-                    'cost': float(rates[0].get('total_charge', 0)),
+                    'cost': Money.from_amount(rates[0].get('total_charge', 0)).to_json(),
                     'rate_id': rates[0].get('id'),
                     'carrier': rates[0].get('courier', {}).get('name', ''),
                     'service': rates[0].get('service', {}).get('name', '')
@@ -657,54 +653,54 @@ class PricingCalculator:
         Air Freight: max(actual_weight, dimensional_weight) + fuel surcharge + security fees
         """
         logger.debug(f"Calculating air freight for route: {route}, weight: {weight}, dimensions: {dimensions}, declared_value: {declared_value}, category: {shipping_category}")
-        actual_weight = Decimal(str(weight))
+        actual_grams = kg_to_grams(weight)
         calc_settings = self.get_calculation_settings(route, route.transport_mode, shipping_category)
         
         # Calculate dimensional weight
-        dim_weight = self.calculate_dimensional_weight(
+        dim_grams = kg_to_grams(self.calculate_dimensional_weight(
             dimensions.get('length', 10),
             dimensions.get('width', 10),
             dimensions.get('height', 10),
-            float(calc_settings.dimensional_weight_divisor)
-        )
-        chargeable_weight = max(actual_weight, dim_weight)
-        print(f"Chargeable air freight weight: {chargeable_weight}")
+            calc_settings.dimensional_weight_divisor
+        ))
+        chargeable_grams = max(actual_grams, dim_grams)
+        print(f"Chargeable air freight weight: {chargeable_grams}g")
         
         # Get base rate and per kg rate from calculation settings
-        base_rate_value = Decimal(str(calc_settings.base_rate)) if calc_settings.base_rate else Decimal('0')
-        per_kg_rate_value = Decimal(str(calc_settings.per_kg_rate)) if calc_settings.per_kg_rate else Decimal('8.5')
+        base_rate_value = calc_settings.base_rate or Decimal('0')
+        per_kg_rate_value = calc_settings.per_kg_rate or Decimal('8.5')
         
         # Calculate base rate: base_rate + (chargeable_weight * per_kg_rate)
-        base_rate = base_rate_value + (chargeable_weight * per_kg_rate_value)
-        print(f"Air freight base rate: {base_rate} (base={base_rate_value}, per_kg={per_kg_rate_value}, weight={chargeable_weight})")
+        base_rate = Money.from_amount(base_rate_value + grams_to_kg(chargeable_grams) * per_kg_rate_value)
+        print(f"Air freight base rate: {base_rate} (base={base_rate_value}, per_kg={per_kg_rate_value}, weight={chargeable_grams}g)")
         
         # Get fuel surcharge and security fee from settings
-        fuel_surcharge_percent = Decimal(str(calc_settings.fuel_surcharge_percent))
-        security_fee = Decimal(str(calc_settings.security_fee))
-        
-        fuel_surcharge = base_rate * (fuel_surcharge_percent / Decimal('100'))
+        fuel_surcharge = base_rate.percent(calc_settings.fuel_surcharge_percent)
+        security_fee = Money.from_amount(calc_settings.security_fee)
         
         total = base_rate + fuel_surcharge + security_fee
         
         # Apply markup
-        markup = total * (Decimal(str(settings.SHIPPING_MARKUP_PERCENTAGE)) / Decimal('100'))
-        print(f"Air freight pricing breakdown: base_rate={base_rate}, fuel_surcharge={fuel_surcharge}, security_fee={security_fee}, markup={markup}, total={total+markup}")
+        markup = total.percent(settings.SHIPPING_MARKUP_PERCENTAGE)
+        total = total + markup
+        print(f"Air freight pricing breakdown: base_rate={base_rate}, fuel_surcharge={fuel_surcharge}, security_fee={security_fee}, markup={markup}, total={total}")
         
         return {
-            'base_rate': float(base_rate),
-            'fuel_surcharge': float(fuel_surcharge),
-            'security_fee': float(security_fee),
-            'markup': float(markup),
-            'total': float(total + markup),
-            'chargeable_weight': float(chargeable_weight),
-            'actual_weight': float(actual_weight),
-            'dimensional_weight': float(dim_weight),
+            'base_rate': base_rate.to_json(),
+            'fuel_surcharge': fuel_surcharge.to_json(),
+            'security_fee': security_fee.to_json(),
+            'markup': markup.to_json(),
+            'total': total.to_json(),
+            'total_cents': total.cents,
+            'chargeable_weight': float(grams_to_kg(chargeable_grams)),
+            'actual_weight': float(grams_to_kg(actual_grams)),
+            'dimensional_weight': float(grams_to_kg(dim_grams)),
             'transit_days': (1, 8),
             'breakdown': {
-                'base_rate': float(base_rate),
-                'fuel_surcharge': float(fuel_surcharge),
-                'security_fee': float(security_fee),
-                'markup': float(markup),
+                'base_rate': base_rate.to_json(),
+                'fuel_surcharge': fuel_surcharge.to_json(),
+                'security_fee': security_fee.to_json(),
+                'markup': markup.to_json(),
             }
         }
     
@@ -715,22 +711,22 @@ class PricingCalculator:
         FCL: container price + fees
         """
         logger.debug(f"Calculating sea freight for route: {route}, weight: {weight}, dimensions: {dimensions}, declared_value: {declared_value}, category: {shipping_category}")
-        weight_kg = Decimal(str(weight))
+        weight_grams = kg_to_grams(weight)
         # Convert dimensions from cm to meters
         length_m = Decimal(str(dimensions.get('length', 0))) / Decimal('100')
         width_m = Decimal(str(dimensions.get('width', 0))) / Decimal('100')
         height_m = Decimal(str(dimensions.get('height', 0))) / Decimal('100')
         
         volume_cbm = length_m * width_m * height_m
-        weight_ton = weight_kg / Decimal('1000')
+        weight_ton = Decimal(weight_grams) / Decimal('1000000')
         logger.debug(f"Volume (cbm): {volume_cbm}, Weight (ton): {weight_ton}")
         
         calc_settings = self.get_calculation_settings(route, route.transport_mode, shipping_category)
         
         # Determine if FCL or LCL
         # Check if volume fits in containers
-        container_20ft_cbm = Decimal(str(calc_settings.container_20ft_cbm))
-        container_40ft_cbm = Decimal(str(calc_settings.container_40ft_cbm))
+        container_20ft_cbm = calc_settings.container_20ft_cbm
+        container_40ft_cbm = calc_settings.container_40ft_cbm
         
         is_fcl = False
         container_type = None
@@ -747,59 +743,58 @@ class PricingCalculator:
         if is_fcl:
             # FCL pricing
             if container_type == '20ft':
-                ocean_freight_base = Decimal(str(calc_settings.container_20ft_price))
+                ocean_freight_base = Money.from_amount(calc_settings.container_20ft_price)
             else:
-                ocean_freight_base = Decimal(str(calc_settings.container_40ft_price))
+                ocean_freight_base = Money.from_amount(calc_settings.container_40ft_price)
             
-            origin_fees = Decimal(str(calc_settings.container_origin_fees))
-            destination_fees = Decimal(str(calc_settings.container_destination_fees))
-            customs = Decimal(str(calc_settings.container_customs_fee))
-            delivery = Decimal(str(calc_settings.container_delivery_fee))
+            origin_fees = Money.from_amount(calc_settings.container_origin_fees)
+            destination_fees = Money.from_amount(calc_settings.container_destination_fees)
+            customs = Money.from_amount(calc_settings.container_customs_fee)
+            delivery = Money.from_amount(calc_settings.container_delivery_fee)
             
             total = ocean_freight_base + origin_fees + destination_fees + customs + delivery
             
             # Apply markup
-            markup = total * (Decimal(str(settings.SHIPPING_MARKUP_PERCENTAGE)) / Decimal('100'))
-            print(f"FCL Pricing: base {ocean_freight_base}, origin {origin_fees}, dest {destination_fees}, customs {customs}, delivery {delivery}, markup {markup}, total {total + markup}")
+            markup = total.percent(settings.SHIPPING_MARKUP_PERCENTAGE)
+            total = total + markup
+            print(f"FCL Pricing: base {ocean_freight_base}, origin {origin_fees}, dest {destination_fees}, customs {customs}, delivery {delivery}, markup {markup}, total {total}")
             
             return {
-                'base_rate': float(ocean_freight_base),
-                'origin_fees': float(origin_fees),
-                'destination_fees': float(destination_fees),
-                'customs_fee': float(customs),
-                'delivery_fee': float(delivery),
-                'markup': float(markup),
-                'total': float(total + markup),
+                'base_rate': ocean_freight_base.to_json(),
+                'origin_fees': origin_fees.to_json(),
+                'destination_fees': destination_fees.to_json(),
+                'customs_fee': customs.to_json(),
+                'delivery_fee': delivery.to_json(),
+                'markup': markup.to_json(),
+                'total': total.to_json(),
+                'total_cents': total.cents,
                 'volume_cbm': float(volume_cbm),
                 'container_type': container_type,
                 'is_fcl': True,
                 'transit_days': (15, 45),
                 'breakdown': {
-                    'ocean_freight_base': float(ocean_freight_base),
-                    'origin_fees': float(origin_fees),
-                    'destination_fees': float(destination_fees),
-                    'customs_fee': float(customs),
-                    'delivery_fee': float(delivery),
-                    'markup': float(markup),
+                    'ocean_freight_base': ocean_freight_base.to_json(),
+                    'origin_fees': origin_fees.to_json(),
+                    'destination_fees': destination_fees.to_json(),
+                    'customs_fee': customs.to_json(),
+                    'delivery_fee': delivery.to_json(),
+                    'markup': markup.to_json(),
                 }
             }
         else:
             # LCL pricing
-            rate_per_cbm = Decimal(str(calc_settings.rate_per_cbm))
-            rate_per_ton = Decimal(str(calc_settings.rate_per_ton))
-            
-            cost_by_volume = volume_cbm * rate_per_cbm
-            cost_by_weight = weight_ton * rate_per_ton
+            cost_by_volume = Money.from_amount(volume_cbm * calc_settings.rate_per_cbm)
+            cost_by_weight = Money.from_amount(weight_ton * calc_settings.rate_per_ton)
             print(f"LCL cost by volume: {cost_by_volume}, cost by weight: {cost_by_weight}")
             
             base_shipping = max(cost_by_volume, cost_by_weight)
             
-            ocean_freight_base = Decimal(str(calc_settings.ocean_freight_base))
-            port_origin_handling = Decimal(str(calc_settings.port_origin_handling))
-            port_destination_handling = Decimal(str(calc_settings.port_destination_handling))
-            documentation = Decimal(str(calc_settings.documentation_fee))
-            customs_clearance = Decimal(str(calc_settings.customs_clearance_fee))
-            destination_delivery = Decimal(str(calc_settings.destination_delivery_fee))
+            ocean_freight_base = Money.from_amount(calc_settings.ocean_freight_base)
+            port_origin_handling = Money.from_amount(calc_settings.port_origin_handling)
+            port_destination_handling = Money.from_amount(calc_settings.port_destination_handling)
+            documentation = Money.from_amount(calc_settings.documentation_fee)
+            customs_clearance = Money.from_amount(calc_settings.customs_clearance_fee)
+            destination_delivery = Money.from_amount(calc_settings.destination_delivery_fee)
             
             total = (
                 ocean_freight_base + 
@@ -812,73 +807,77 @@ class PricingCalculator:
             )
             
             # Apply markup
-            markup = total * (Decimal(str(settings.SHIPPING_MARKUP_PERCENTAGE)) / Decimal('100'))
+            markup = total.percent(settings.SHIPPING_MARKUP_PERCENTAGE)
             print(f"LCL Pricing breakdown: total before markup {total}, markup {markup}, after {total + markup}")
+            total = total + markup
             
             return {
-                'base_rate': float(base_shipping),
-                'ocean_freight_base': float(ocean_freight_base),
-                'port_origin_handling': float(port_origin_handling),
-                'port_destination_handling': float(port_destination_handling),
-                'documentation_fee': float(documentation),
-                'customs_clearance_fee': float(customs_clearance),
-                'destination_delivery_fee': float(destination_delivery),
-                'markup': float(markup),
-                'total': float(total + markup),
+                'base_rate': base_shipping.to_json(),
+                'ocean_freight_base': ocean_freight_base.to_json(),
+                'port_origin_handling': port_origin_handling.to_json(),
+                'port_destination_handling': port_destination_handling.to_json(),
+                'documentation_fee': documentation.to_json(),
+                'customs_clearance_fee': customs_clearance.to_json(),
+                'destination_delivery_fee': destination_delivery.to_json(),
+                'markup': markup.to_json(),
+                'total': total.to_json(),
+                'total_cents': total.cents,
                 'volume_cbm': float(volume_cbm),
                 'weight_ton': float(weight_ton),
-                'cost_by_volume': float(cost_by_volume),
-                'cost_by_weight': float(cost_by_weight),
+                'cost_by_volume': cost_by_volume.to_json(),
+                'cost_by_weight': cost_by_weight.to_json(),
                 'is_fcl': False,
                 'transit_days': (15, 45),
                 'breakdown': {
-                    'ocean_freight_base': float(ocean_freight_base),
-                    'base_shipping': float(base_shipping),
-                    'port_origin_handling': float(port_origin_handling),
-                    'port_destination_handling': float(port_destination_handling),
-                    'documentation_fee': float(documentation),
-                    'customs_clearance_fee': float(customs_clearance),
-                    'destination_delivery_fee': float(destination_delivery),
-                    'markup': float(markup),
+                    'ocean_freight_base': ocean_freight_base.to_json(),
+                    'base_shipping': base_shipping.to_json(),
+                    'port_origin_handling': port_origin_handling.to_json(),
+                    'port_destination_handling': port_destination_handling.to_json(),
+                    'documentation_fee': documentation.to_json(),
+                    'customs_clearance_fee': customs_clearance.to_json(),
+                    'destination_delivery_fee': destination_delivery.to_json(),
+                    'markup': markup.to_json(),
                 }
             }
     
     def calculate_rail_freight(self, route, weight, dimensions, declared_value=0, shipping_category='small_parcel'):
         """Rail Freight: base route cost + per kg rate + terminal handling"""
         logger.debug(f"Calculating rail freight: route {route}, weight {weight}, dimensions {dimensions}, declared_value {declared_value}, category: {shipping_category}")
-        weight_kg = Decimal(str(weight))
+        weight_kg = grams_to_kg(kg_to_grams(weight))
         
         # Get rail freight settings
         transport_mode = route.transport_mode if route else None
         calc_settings = self.get_calculation_settings(route, transport_mode, shipping_category) if route and transport_mode else None
         
         if calc_settings:
-            base_route_cost = Decimal(str(calc_settings.base_rate_rail)) if calc_settings.base_rate_rail else Decimal('200')
-            per_kg_rate = Decimal(str(calc_settings.per_kg_rate_rail)) if calc_settings.per_kg_rate_rail else Decimal('2.5')
-            terminal_handling = Decimal(str(calc_settings.terminal_handling_fee)) if calc_settings.terminal_handling_fee else Decimal('100')
-            customs_fee = Decimal(str(calc_settings.customs_fee_rail)) if calc_settings.customs_fee_rail else Decimal('50')
+            base_route_cost = calc_settings.base_rate_rail or Decimal('200')
+            per_kg_rate = calc_settings.per_kg_rate_rail or Decimal('2.5')
+            terminal_handling = Money.from_amount(calc_settings.terminal_handling_fee or Decimal('100'))
+            customs_fee = Money.from_amount(calc_settings.customs_fee_rail or Decimal('50'))
         else:
             # Fallback defaults
             base_route_cost = Decimal('200')
             per_kg_rate = Decimal('2.5')
-            terminal_handling = Decimal('100')
-            customs_fee = Decimal('50')
+            terminal_handling = Money.from_amount('100')
+            customs_fee = Money.from_amount('50')
         
-        base_rate = base_route_cost + (weight_kg * per_kg_rate)
+        base_rate = Money.from_amount(base_route_cost + (weight_kg * per_kg_rate))
         print(f"Rail freight base rate: {base_rate} (base={base_route_cost}, per_kg={per_kg_rate}, weight={weight_kg})")
         
         total = base_rate + terminal_handling + customs_fee
         
         # Apply markup
-        markup = total * (Decimal(str(settings.SHIPPING_MARKUP_PERCENTAGE)) / Decimal('100'))
-        print(f"Rail freight Pricing: base_rate={base_rate}, terminal_handling={terminal_handling}, customs_fee={customs_fee}, markup={markup}, total={total + markup}")
+        markup = total.percent(settings.SHIPPING_MARKUP_PERCENTAGE)
+        total = total + markup
+        print(f"Rail freight Pricing: base_rate={base_rate}, terminal_handling={terminal_handling}, customs_fee={customs_fee}, markup={markup}, total={total}")
         
         return {
-            'base_rate': float(base_rate),
-            'terminal_handling': float(terminal_handling),
-            'customs_fee': float(customs_fee),
-            'markup': float(markup),
-            'total': float(total + markup),
+            'base_rate': base_rate.to_json(),
+            'terminal_handling': terminal_handling.to_json(),
+            'customs_fee': customs_fee.to_json(),
+            'markup': markup.to_json(),
+            'total': total.to_json(),
+            'total_cents': total.cents,
             'transit_days': (10, 20)
         }
     
@@ -887,11 +886,11 @@ class PricingCalculator:
         Truck/Road: LTL uses freight class system, FTL by distance
         """
         logger.debug(f"Calculating truck freight: route {route}, weight {weight}, dimensions {dimensions}, declared_value {declared_value}, freight_class {freight_class}, category: {shipping_category}")
-        weight_kg = Decimal(str(weight))
+        weight_kg = grams_to_kg(kg_to_grams(weight))
         weight_lbs = weight_kg * Decimal('2.20462')
         
         # Get truck freight settings
-        transport_mode = TransportMode.objects.filter(type='truck').first()
+        transport_mode = self.rate_card.first_mode_of_type('truck')
         if not transport_mode:
             transport_mode = route.transport_mode if route else None
         
@@ -903,54 +902,121 @@ class PricingCalculator:
             # LTL: (weight/100) × base_rate × freight_class_multiplier
             base_rate_per_cwt = Decimal('50')  # $50 per 100 lbs (default)
             if calc_settings and calc_settings.base_rate_truck:
-                base_rate_per_cwt = Decimal(str(calc_settings.base_rate_truck))
+                base_rate_per_cwt = calc_settings.base_rate_truck
             
             cwt = weight_lbs / Decimal('100')
             
             # Freight class multiplier (50-500, lower = cheaper)
             class_multiplier = Decimal(str(freight_class)) / Decimal('100')
             
-            base_rate = cwt * base_rate_per_cwt * class_multiplier
-            fuel_surcharge = base_rate * Decimal('0.15')  # 15% fuel surcharge (default)
+            base_rate = Money.from_amount(cwt * base_rate_per_cwt * class_multiplier)
+            fuel_surcharge = base_rate.percent(15)  # 15% fuel surcharge (default)
             if calc_settings and calc_settings.fuel_surcharge_percent:
-                fuel_surcharge = base_rate * (Decimal(str(calc_settings.fuel_surcharge_percent)) / Decimal('100'))
+                fuel_surcharge = base_rate.percent(calc_settings.fuel_surcharge_percent)
             
-            accessorials = Decimal('50')  # Standard accessorials (default)
+            accessorials = Money.from_amount('50')  # Standard accessorials (default)
             if calc_settings and calc_settings.handling_fee:
-                accessorials = Decimal(str(calc_settings.handling_fee))
+                accessorials = Money.from_amount(calc_settings.handling_fee)
             
             total = base_rate + fuel_surcharge + accessorials
         else:
             print("Truck FTL calculation.")
             # FTL: Distance-based flat rate
-            base_rate = Decimal('2000')  # Base FTL rate (default)
+            base_rate = Money.from_amount('2000')  # Base FTL rate (default)
             if calc_settings and calc_settings.base_rate_truck:
-                base_rate = Decimal(str(calc_settings.base_rate_truck)) * Decimal('40')  # Scale for FTL
-            fuel_surcharge = base_rate * Decimal('0.20')  # 20% fuel surcharge (default)
+                base_rate = Money.from_amount(calc_settings.base_rate_truck * Decimal('40'))  # Scale for FTL
+            fuel_surcharge = base_rate.percent(20)  # 20% fuel surcharge (default)
             if calc_settings and calc_settings.fuel_surcharge_percent:
-                fuel_surcharge = base_rate * (Decimal(str(calc_settings.fuel_surcharge_percent)) / Decimal('100'))
-            accessorials = Decimal('0')
+                fuel_surcharge = base_rate.percent(calc_settings.fuel_surcharge_percent)
+            accessorials = Money()
             total = base_rate + fuel_surcharge
         
         # Apply markup
-        markup = total * (Decimal(str(settings.SHIPPING_MARKUP_PERCENTAGE)) / Decimal('100'))
-        print(f"Truck freight pricing: base_rate={base_rate}, fuel_surcharge={fuel_surcharge}, accessorials={accessorials}, markup={markup}, total={total + markup}")
+        markup = total.percent(settings.SHIPPING_MARKUP_PERCENTAGE)
+        total = total + markup
+        print(f"Truck freight pricing: base_rate={base_rate}, fuel_surcharge={fuel_surcharge}, accessorials={accessorials}, markup={markup}, total={total}")
         
         return {
-            'base_rate': float(base_rate),
-            'fuel_surcharge': float(fuel_surcharge),
-            'accessorials': float(accessorials),
-            'markup': float(markup),
-            'total': float(total + markup),
+            'base_rate': base_rate.to_json(),
+            'fuel_surcharge': fuel_surcharge.to_json(),
+            'accessorials': accessorials.to_json(),
+            'markup': markup.to_json(),
+            'total': total.to_json(),
+            'total_cents': total.cents,
             'transit_days': (2, 10)
         }
     
-    def get_local_shipping_quotes(self, origin_country, destination_country, weight, dimensions, declared_value=0, items=None, origin_address=None, destination_address=None):
+    def calculate_route_freight(self, route, weight, dimensions, declared_value=0, shipping_category='small_parcel',
+                                freight_class=70, use_price_grid=True):
+        """
+        Freight quote for a route: from the precomputed price grid or a primed
+        pricing_kernel matrix when possible, else priced live.
+        use_price_grid=False always prices live (the kernel's reference path).
+        """
+        if use_price_grid:
+            if self._rate_card is not None:
+                quote = self._price_grid.lookup(route, weight, dimensions, shipping_category) if self._price_grid else None
+            else:
+                quote = lookup_price_grid(route, weight, dimensions, shipping_category, self.rate_card.version)
+            if quote is not None:
+                logger.debug(f"Price grid {quote['price_source']} for route {route}, weight {weight}")
+                return quote
+            primed = self._primed_freight and self._primed_freight.get(
+                cell_key(route, weight, dimensions, shipping_category, freight_class)
+            )
+            if primed:
+                matrix, route_index, shipment_index = primed
+                return matrix.quote(route_index, shipment_index)
+        
+        mode_type = route.transport_mode.type
+        if mode_type == 'air':
+            return self.calculate_air_freight(route, weight, dimensions, declared_value, shipping_category)
+        elif mode_type == 'sea':
+            return self.calculate_sea_freight(route, weight, dimensions, declared_value, shipping_category)
+        elif mode_type == 'rail':
+            return self.calculate_rail_freight(route, weight, dimensions, declared_value, shipping_category)
+        elif mode_type == 'truck':
+            return self.calculate_truck_freight(route, weight, dimensions, declared_value, freight_class, shipping_category)
+        return None
+    
+    def prime_lane_freight(self, origin_country, destination_country, shipments, shipping_category='small_parcel',
+                           warehouse_address=None, freight_class=70):
+        """
+        Price the lane's routes for many shipments in one pricing_kernel pass
+        (batch quoting). Routes from the origin and from the warehouse country
+        are primed, since get_all_quotes prices from either; calculate_route_freight
+        then serves these cells from the matrix. Returns the PriceMatrix or None.
+        """
+        rate_card = self.rate_card
+        origin_codes = [origin_country]
+        if isinstance(warehouse_address, dict) and warehouse_address.get('country') not in (None, origin_country):
+            origin_codes.append(warehouse_address['country'])
+        allowed_modes = CATEGORY_MODES.get(shipping_category, ALL_MODES)
+        routes = [
+            route for code in origin_codes for route in rate_card.routes_for(code, destination_country)
+            if route.transport_mode.type in allowed_modes and rate_card.has_calculation_settings(route)
+        ]
+        if not routes or not shipments:
+            return None
+        matrix = price_matrix(self, routes, shipments, shipping_category, freight_class)
+        for route_index, route in enumerate(matrix.routes):
+            for shipment_index, shipment in enumerate(matrix.shipments):
+                key = cell_key(route, shipment['weight'], shipment['dimensions'], shipping_category, freight_class)
+                self._primed_freight[key] = (matrix, route_index, shipment_index)
+        return matrix
+    
+    def get_local_shipping_quotes(self, origin_country, destination_country, weight, dimensions, declared_value=0, items=None, origin_address=None, destination_address=None, pricing_context=None):
         """Get EasyShip quotes for local shipping (skip warehouse) - returns all available rates with detailed information"""
         print(f"Getting EasyShip quotes for local shipping: {origin_country} to {destination_country}, weight: {weight}, dimensions: {dimensions}, declared_value: {declared_value}, items: {items}")
-        easyship_rates = self.easyship.get_rates(
-            origin_country, destination_country, weight, dimensions, declared_value, items, origin_address, destination_address
-        )
+        if pricing_context:
+            # Bounded by the request deadline
+            easyship_rates = pricing_context.easyship_rates(
+                'local_easyship', origin_country, destination_country, weight, dimensions, declared_value, items, origin_address, destination_address
+            )
+        else:
+            easyship_rates = self.easyship.get_rates(
+                origin_country, destination_country, weight, dimensions, declared_value, items, origin_address, destination_address
+            )
         
         # If no rates found, return empty list (will be validated later)
         if not easyship_rates:
@@ -981,7 +1047,8 @@ class PricingCalculator:
             transit_days_max = rate.get('max_delivery_time', rate.get('estimated_delivery_days_max', 3))
             
             # Get cost breakdown from new format
-            total_charge = float(rate.get('total_charge', 0))
+            total_money = Money.from_amount(rate.get('total_charge', 0))
+            total_charge = total_money.to_json()
             shipment_charge = float(rate.get('shipment_charge', total_charge))
             insurance_fee = float(rate.get('insurance_fee', 0))
             fuel_surcharge = float(rate.get('fuel_surcharge', 0))
@@ -999,6 +1066,7 @@ class PricingCalculator:
                 'priority': rate.get('cost_rank', 0),  # Use cost rank as priority
                 'base_rate': shipment_charge,
                 'total': total_charge,
+                'total_cents': total_money.cents,
                 'markup': 0.0,
                 'currency': rate.get('currency', 'USD'),
                 'transit_days': (transit_days_min, transit_days_max),
@@ -1061,7 +1129,7 @@ class PricingCalculator:
     def get_all_quotes(self, origin_country, destination_country, weight, dimensions, 
                        declared_value=0, items=None, shipping_category='small_parcel', 
                        origin_address=None, warehouse_address=None, destination_address=None, 
-                       skip_origin_to_warehouse=False):
+                       skip_origin_to_warehouse=False, pricing_context=None):
         """
         Get quotes for all available transport modes based on shipping category
         
@@ -1074,14 +1142,64 @@ class PricingCalculator:
         - Buy-and-ship (skip_origin_to_warehouse=True): Only Leg 2 (Warehouse → Destination)
           * Marketplace ships to warehouse, so no leg1 calculation needed
         - Otherwise: Standard calculation
+        
+        Warehouse lookups, pickup cost and the origin -> warehouse EasyShip leg are
+        computed once per request through pricing_context (created if not passed);
+        it is kept on self.last_pricing_context for callers that report its stats.
+        Every route is priced against the context's rate card snapshot.
         """
+        if pricing_context is None:
+            pricing_context = PricingContext(self)
+        self.last_pricing_context = pricing_context
+        with self.pinned_rate_card(pricing_context.rate_card):
+            return self._get_all_quotes_cached(
+                origin_country, destination_country, weight, dimensions, declared_value, items,
+                shipping_category, origin_address, warehouse_address, destination_address,
+                skip_origin_to_warehouse, pricing_context
+            )
+    
+    def _get_all_quotes_cached(self, origin_country, destination_country, weight, dimensions,
+                               declared_value, items, shipping_category, origin_address,
+                               warehouse_address, destination_address, skip_origin_to_warehouse,
+                               pricing_context):
+        """get_all_quotes through the shared quote result cache"""
+        # Serve repeat quotes (same checkout session, popular lanes) from the shared result cache.
+        # The rate card version is part of the key, so admin pricing edits invalidate old entries.
+        fingerprint = quote_fingerprint(
+            origin_country, destination_country, weight, dimensions, declared_value, items,
+            shipping_category, origin_address, warehouse_address, destination_address, skip_origin_to_warehouse
+        )
+        cache_key = f"quote_result_{self.rate_card.version}_{fingerprint}"
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.debug(f"Quote result cache hit for {fingerprint}")
+            pricing_context.result_cache = 'hit'
+            return cached
+        pricing_context.result_cache = 'miss'
+        
+        quotes = self._get_all_quotes_uncached(
+            origin_country, destination_country, weight, dimensions, declared_value, items,
+            shipping_category, origin_address, warehouse_address, destination_address,
+            skip_origin_to_warehouse, pricing_context
+        )
+        # Partial (deadline) and empty results are not cached: EasyShip may just have been slow/down
+        if quotes and not pricing_context.missing_legs:
+            cache.set(cache_key, quotes, settings.QUOTE_RESULT_CACHE_TIMEOUT)
+        return quotes
+    
+    def _get_all_quotes_uncached(self, origin_country, destination_country, weight, dimensions,
+                                 declared_value, items, shipping_category, origin_address,
+                                 warehouse_address, destination_address, skip_origin_to_warehouse,
+                                 pricing_context):
+        """get_all_quotes without the result cache"""
         print(f"Getting all quotes for origin: {origin_country}, destination: {destination_country}, weight: {weight}, dimensions: {dimensions}, declared_value: {declared_value}, shipping_category: {shipping_category}, origin_address: {origin_address}, warehouse_address: {warehouse_address}")
         # Check if local shipping - YuuSell just provides EasyShip quotes
         if self.is_local_shipping(origin_country, destination_country):
             print("Local shipping detected, using EasyShip quotes only.")
             # For local shipping, we need full addresses for EasyShip API
             local_quotes = self.get_local_shipping_quotes(
-                origin_country, destination_country, weight, dimensions, declared_value, items, origin_address, destination_address
+                origin_country, destination_country, weight, dimensions, declared_value, items, origin_address, destination_address,
+                pricing_context=pricing_context
             )
             # If no EasyShip rates found, return empty list (frontend will handle validation)
             if not local_quotes:
@@ -1105,7 +1223,8 @@ class PricingCalculator:
             print("International parcel detected, using two-leg shipping (EasyShip to warehouse + route from warehouse).")
             return self.get_international_parcel_quotes(
                 origin_country, destination_country, weight, dimensions, declared_value, items,
-                origin_address, warehouse_address, destination_address, shipping_category
+                origin_address, warehouse_address, destination_address, shipping_category,
+                pricing_context=pricing_context
             )
         
         # For buy-and-ship (skip_origin_to_warehouse=True), skip leg1 and only calculate warehouse to destination
@@ -1148,42 +1267,26 @@ class PricingCalculator:
             pickup_required = True if is_yuusell_handled else self.determine_pickup_required(weight, shipping_category)
         print(f"pickup_required: {pickup_required}")
         
+        # Start the EasyShip to warehouse leg now so it runs while routes are priced
+        if not is_yuusell_handled and not pickup_required and not skip_origin_to_warehouse and origin_country:
+            pricing_context.prefetch_easyship_to_warehouse(
+                origin_country, weight, dimensions, origin_address, warehouse_address
+            )
+        
         # Get available routes with hierarchical matching
-        if isinstance(route_origin_country_code, str):
-            route_origin_country_obj = Country.objects.get(code=route_origin_country_code)
-        else:
-            route_origin_country_obj = route_origin_country_code
-            
-        if isinstance(destination_country, str):
-            destination_country_obj = Country.objects.get(code=destination_country)
-        else:
-            destination_country_obj = destination_country
+        rate_card = self.rate_card
+        route_origin_country_obj = rate_card.get_country(route_origin_country_code)
+        destination_country_obj = rate_card.get_country(destination_country)
         
         # Get routes from warehouse country (or origin for non-big items) to destination
-        routes = ShippingRoute.objects.filter(
-            origin_country=route_origin_country_obj,
-            destination_country=destination_country_obj,
-            is_available=True
-        ).select_related('transport_mode')
+        routes = rate_card.routes_for(route_origin_country_obj, destination_country_obj)
         
-        print(f"Found {routes.count()} available routes from {route_origin_country_code} to {destination_country}.")
+        print(f"Found {len(routes)} available routes from {route_origin_country_code} to {destination_country}.")
         
         # Filter routes that have ShippingCalculationSettings (required for pricing)
         valid_routes = []
         for route in routes:
-            calc_settings = ShippingCalculationSettings.objects.filter(
-                route=route,
-                transport_mode=route.transport_mode
-            ).first()
-            
-            if not calc_settings:
-                # Try global default
-                calc_settings = ShippingCalculationSettings.objects.filter(
-                    transport_mode=route.transport_mode,
-                    is_global_default=True
-                ).first()
-            
-            if calc_settings:
+            if rate_card.has_calculation_settings(route):
                 valid_routes.append(route)
             else:
                 logger.warning(f"Route {route} has no ShippingCalculationSettings, skipping")
@@ -1196,19 +1299,7 @@ class PricingCalculator:
         quotes = []
         
         # Filter transport modes based on category
-        allowed_modes = []
-        if shipping_category == 'small_parcel':
-            allowed_modes = ['air']
-        elif shipping_category == 'heavy_parcel':
-            allowed_modes = ['air', 'sea']
-        elif shipping_category in ['ltl_freight', 'ftl_freight']:
-            allowed_modes = ['air', 'sea', 'rail', 'truck']
-        elif shipping_category == 'vehicle':
-            allowed_modes = ['sea']
-        elif shipping_category == 'super_heavy':
-            allowed_modes = ['sea']
-        else:
-            allowed_modes = ['air', 'sea', 'rail', 'truck']
+        allowed_modes = CATEGORY_MODES.get(shipping_category, ALL_MODES)
         print(f"Allowed modes for category {shipping_category}: {allowed_modes}")
         
         for idx, route in enumerate(valid_routes):
@@ -1219,22 +1310,9 @@ class PricingCalculator:
                 print(f"Mode {mode_type} not in allowed_modes, skipping.")
                 continue
             
-            if mode_type == 'air':
-                logger.debug("Calculating air freight.")
-                quote = self.calculate_air_freight(route, weight, dimensions, declared_value, shipping_category)
-            elif mode_type == 'sea':
-                logger.debug("Calculating sea freight.")
-                quote = self.calculate_sea_freight(route, weight, dimensions, declared_value, shipping_category)
-            elif mode_type == 'rail':
-                logger.debug("Calculating rail freight.")
-                quote = self.calculate_rail_freight(route, weight, dimensions, declared_value, shipping_category)
-            elif mode_type == 'truck':
-                logger.debug("Calculating truck freight.")
-                freight_class = 70  # Default
-                if shipping_category == 'ltl_freight':
-                    freight_class = 70
-                quote = self.calculate_truck_freight(route, weight, dimensions, declared_value, freight_class, shipping_category)
-            else:
+            freight_class = 70  # Default (trucks)
+            quote = self.calculate_route_freight(route, weight, dimensions, declared_value, shipping_category, freight_class)
+            if quote is None:
                 print(f"Unknown mode type {mode_type}, skipping.")
                 continue
             
@@ -1252,10 +1330,10 @@ class PricingCalculator:
                 # Add pickup cost (required for YuuSell-handled shipments)
                 pickup_cost = 0.0
                 if origin_address and warehouse_address:
-                    pickup_cost = self.calculate_pickup_cost(origin_address, warehouse_address, weight, dimensions, shipping_category)
+                    pickup_cost = pricing_context.pickup_cost(origin_address, warehouse_address, weight, dimensions, shipping_category)
                     print(f"Pickup cost: {pickup_cost}")
                     quote['pickup_cost'] = pickup_cost
-                    quote['total'] = quote['total'] + pickup_cost
+                    add_charge(quote, pickup_cost)
                 quote['is_yuusell_handled'] = True
                 quote['pickup_required'] = True
             else:
@@ -1263,10 +1341,10 @@ class PricingCalculator:
                 pickup_cost = 0.0
                 if pickup_required and origin_address and warehouse_address:
                     print("Standard handling: Adding pickup cost.")
-                    pickup_cost = self.calculate_pickup_cost(origin_address, warehouse_address, weight, dimensions, shipping_category)
+                    pickup_cost = pricing_context.pickup_cost(origin_address, warehouse_address, weight, dimensions, shipping_category)
                     print(f"Pickup cost: {pickup_cost}")
                     quote['pickup_cost'] = pickup_cost
-                    quote['total'] = quote['total'] + pickup_cost
+                    add_charge(quote, pickup_cost)
                 
                 # Add EasyShip to warehouse cost for non-pickup heavy items
                 # BUT skip if skip_origin_to_warehouse is True (buy-and-ship: marketplace ships to warehouse)
@@ -1274,14 +1352,16 @@ class PricingCalculator:
                 if not pickup_required and not skip_origin_to_warehouse:
                     if origin_country:
                         print("Heavy or super heavy without pickup: Getting Easyship to warehouse cost.")
-                        easyship_result = self.calculate_easyship_to_warehouse(
+                        easyship_result = pricing_context.easyship_to_warehouse(
                             origin_country, weight, dimensions, origin_address, warehouse_address
                         )
                         if easyship_result:
                             easyship_to_warehouse_cost = easyship_result['cost']
                             print("Easyship to warehouse", easyship_to_warehouse_cost)
                             quote['easyship_to_warehouse'] = easyship_result
-                            quote['total'] = quote['total'] + easyship_to_warehouse_cost
+                            add_charge(quote, easyship_to_warehouse_cost)
+                        elif 'easyship_to_warehouse' in pricing_context.missing_legs:
+                            quote['missing_legs'] = ['easyship_to_warehouse']
             
             quote.update({
                 'transport_mode': route.transport_mode.code,
@@ -0,0 +1,208 @@
+"""
+Per-request pricing context.
+
+get_all_quotes prices every route on a lane with the same origin, weight and
+addresses, so the warehouse lookup, pickup cost and the origin -> warehouse
+EasyShip leg are the same for each route. The context computes each of them
+once and counts how many repeated (and external) calls it saved.
+
+External EasyShip calls are started on a shared thread pool as soon as they are
+known to be needed, so they run while the route-based quotes are priced. All of
+them share one deadline (EASYSHIP_QUOTE_DEADLINE_SECONDS); a leg that is not
+back in time is recorded in missing_legs and the quotes are returned without it.
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Thread pool shared by all requests of this process for EasyShip calls"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.EASYSHIP_MAX_WORKERS,
+                    thread_name_prefix='easyship'
+                )
+    return _executor
+
+
+def _run_in_worker(func):
+    """Run func in a pool thread and release the thread's DB connection afterwards"""
+    try:
+        return func()
+    finally:
+        close_old_connections()
+
+
+def _make_key(*parts):
+    """Hashable key for dicts/lists/Decimals passed to the calculator"""
+    return json.dumps(parts, sort_keys=True, default=str)
+
+
+class PricingContext:
+    """Memoizes shared legs for one quote request. Not shared between requests."""
+
+    def __init__(self, calculator, deadline_seconds=None):
+        self.calculator = calculator
+        # Every get_all_quotes call with this context prices against one snapshot
+        self.rate_card = calculator.rate_card
+        if deadline_seconds is None:
+            deadline_seconds = settings.EASYSHIP_QUOTE_DEADLINE_SECONDS
+        self.deadline = time.monotonic() + deadline_seconds
+        self._results = {}
+        self._futures = {}
+        self.missing_legs = []
+        self.result_cache = None
+        self.prefetching = False
+        self.calls = 0
+        self.saved_calls = 0
+        self.external_calls = 0
+        self.saved_external_calls = 0
+
+    def remaining(self):
+        """Seconds left before the request's deadline"""
+        return max(0.0, self.deadline - time.monotonic())
+
+    def _memoize(self, name, key, func):
+        cache_key = (name, key)
+        if cache_key in self._results:
+            self.saved_calls += 1
+            logger.debug(f"Pricing context reused {name}")
+            return self._results[cache_key]
+
+        result = func()
+        self._results[cache_key] = result
+        self.calls += 1
+        return result
+
+    def _submit(self, name, key, func):
+        """Start an external call in the background unless it is already running/done"""
+        cache_key = (name, key)
+        if cache_key in self._results or cache_key in self._futures:
+            return
+        self._futures[cache_key] = get_executor().submit(_run_in_worker, func)
+        self.calls += 1
+        self.external_calls += 1
+
+    def _external(self, name, key, func):
+        """Result of an external call, waiting at most until the deadline"""
+        cache_key = (name, key)
+        if cache_key in self._results:
+            self.saved_calls += 1
+            self.saved_external_calls += 1
+            logger.debug(f"Pricing context reused {name}")
+            return self._results[cache_key]
+
+        self._submit(name, key, func)
+        future = self._futures[cache_key]
+        try:
+            result = future.result(timeout=self.remaining())
+        except FutureTimeoutError:
+            # Keep the call running; a later pass with a new deadline can still collect it
+            if name not in self.missing_legs:
+                if not self.prefetching:
+                    logger.warning(f"EasyShip call {name} missed the quote deadline; continuing without it")
+                self.missing_legs.append(name)
+            return None
+        except Exception as e:
+            logger.error(f"EasyShip call {name} failed: {str(e)}")
+            result = None
+        del self._futures[cache_key]
+        self._results[cache_key] = result
+        return result
+
+    def extend_deadline(self, seconds):
+        """Give legs that are still running another budget (used by the streaming endpoint)"""
+        self.deadline = time.monotonic() + seconds
+        self.missing_legs = []
+        self.prefetching = False
+
+    def start_prefetch(self):
+        """
+        Expire the deadline so a pricing pass only submits its external calls.
+
+        Batch quoting runs every row once in this mode to get all EasyShip legs
+        in flight, then calls extend_deadline and prices the rows again,
+        collecting the legs that are already running. The streaming endpoint
+        does the same for its routes-only first pass.
+        """
+        self.deadline = time.monotonic()
+        self.prefetching = True
+
+    def warehouse_address(self, origin_country, shipping_category='all'):
+        return self._memoize(
+            'warehouse_address',
+            _make_key(origin_country, shipping_category),
+            lambda: self.calculator.get_warehouse_address(origin_country, shipping_category),
+        )
+
+    def pickup_cost(self, origin_address, warehouse_address, weight, dimensions, shipping_category='small_parcel'):
+        return self._memoize(
+            'pickup_cost',
+            _make_key(origin_address, warehouse_address, weight, dimensions, shipping_category),
+            lambda: self.calculator.calculate_pickup_cost(
+                origin_address, warehouse_address, weight, dimensions, shipping_category
+            ),
+        )
+
+    def _easyship_to_warehouse_call(self, origin_country, weight, dimensions, origin_address, warehouse_address):
+        key = _make_key(origin_country, weight, dimensions, origin_address, warehouse_address)
+        func = lambda: self.calculator.calculate_easyship_to_warehouse(
+            origin_country, weight, dimensions, origin_address, warehouse_address
+        )
+        return 'easyship_to_warehouse', key, func
+
+    def prefetch_easyship_to_warehouse(self, origin_country, weight, dimensions, origin_address=None, warehouse_address=None):
+        self._submit(*self._easyship_to_warehouse_call(origin_country, weight, dimensions, origin_address, warehouse_address))
+
+    def easyship_to_warehouse(self, origin_country, weight, dimensions, origin_address=None, warehouse_address=None):
+        return self._external(*self._easyship_to_warehouse_call(origin_country, weight, dimensions, origin_address, warehouse_address))
+
+    def _easyship_rates_call(self, leg, origin_country, destination_country, weight, dimensions,
+                             declared_value, items, origin_address, destination_address):
+        key = _make_key(origin_country, destination_country, weight, dimensions, declared_value,
+                        items, origin_address, destination_address)
+        func = lambda: self.calculator.easyship.get_rates(
+            origin_country, destination_country, weight, dimensions, declared_value,
+            items, origin_address, destination_address
+        )
+        return leg, key, func
+
+    def prefetch_easyship_rates(self, leg, origin_country, destination_country, weight, dimensions,
+                                declared_value=0, items=None, origin_address=None, destination_address=None):
+        self._submit(*self._easyship_rates_call(
+            leg, origin_country, destination_country, weight, dimensions,
+            declared_value, items, origin_address, destination_address
+        ))
+
+    def easyship_rates(self, leg, origin_country, destination_country, weight, dimensions,
+                       declared_value=0, items=None, origin_address=None, destination_address=None):
+        """EasyShip rates for a leg ('local_easyship', 'leg1_easyship'), or None past the deadline"""
+        return self._external(*self._easyship_rates_call(
+            leg, origin_country, destination_country, weight, dimensions,
+            declared_value, items, origin_address, destination_address
+        ))
+
+    def stats(self):
+        """Call counters returned to the client with the quotes"""
+        return {
+            'calls': self.calls,
+            'saved_calls': self.saved_calls,
+            'external_calls': self.external_calls,
+            'saved_external_calls': self.saved_external_calls,
+            'missing_legs': list(self.missing_legs),
+            'result_cache': self.result_cache,
+        }
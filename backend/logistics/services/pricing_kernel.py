@@ -0,0 +1,412 @@
+"""
+Vectorized freight pricing kernel.
+
+Prices a whole (routes x shipments) matrix with NumPy instead of one Decimal
+calculation per cell. The price grid build prices each shipping category as one
+matrix, and batch quoting primes the calculator with one matrix per lane (see
+PricingCalculator.prime_lane_freight), so calculate_route_freight serves those
+cells without running the Decimal path.
+
+The kernel follows the rounding rules in logistics.services.money: weights are
+rounded to grams and every line item to cents before it is summed. Float math
+can land on the other side of a half cent/gram (or of the LCL/FCL and LTL/FTL
+thresholds) than the Decimal path in PricingCalculator. Those cells are detected
+and re-priced with the Decimal path, so every quote matches
+calculate_route_freight to the cent.
+"""
+import logging
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+
+from logistics.services.money import Money, grams_to_kg
+
+logger = logging.getLogger(__name__)
+
+# Relative tolerance for "too close to call" cells (half cents/grams and thresholds)
+AMBIGUITY_TOLERANCE = 1e-9
+
+LBS_PER_KG = 2.20462
+LTL_MAX_LBS = 10000.0
+
+DIMENSION_KEYS = ('length', 'width', 'height')
+
+
+def cell_key(route, weight, dimensions, shipping_category, freight_class):
+    """Key of one (route, shipment) cell as calculate_route_freight sees it"""
+    return (
+        route.id, shipping_category, freight_class, str(weight),
+        tuple(str(dimensions.get(key)) for key in DIMENSION_KEYS),
+    )
+
+
+def _f(value, default=0.0):
+    """Settings field as float, using default when the field is empty/zero (like the Decimal path)"""
+    return float(value) if value else default
+
+
+def _cents(value, default=None):
+    """Fixed fee in whole cents (rounded like Money.from_amount)"""
+    if default is not None and not value:
+        value = default
+    return float(Money.from_amount(value).cents)
+
+
+def _json(cents):
+    """Cents -> dollars float, as Money.to_json()"""
+    return int(cents) / 100
+
+
+class _Rounder:
+    """Half-up rounding that remembers which cells were too close to call"""
+
+    def __init__(self, shape):
+        self.ambiguous = np.zeros(shape, dtype=bool)
+
+    def __call__(self, values):
+        values = np.broadcast_to(values, self.ambiguous.shape)
+        fraction = values - np.floor(values)
+        self.ambiguous |= np.abs(fraction - 0.5) <= AMBIGUITY_TOLERANCE * np.maximum(np.abs(values), 1.0)
+        return np.floor(values + 0.5)
+
+    def flag_near(self, values, thresholds):
+        scale = np.maximum(np.abs(thresholds), 1.0)
+        self.ambiguous |= np.broadcast_to(np.abs(values - thresholds) <= AMBIGUITY_TOLERANCE * scale, self.ambiguous.shape)
+
+
+def _dimension_arrays(shipments, default):
+    return tuple(
+        np.array([float(s.get('dimensions', {}).get(key, default)) for s in shipments])
+        for key in DIMENSION_KEYS
+    )
+
+
+def _markup(subtotal, markup_percent, rnd):
+    return rnd(subtotal * (markup_percent / 100.0))
+
+
+def _air(params, grams, shipments, markup_percent, rnd):
+    base, per_kg, divisor, fuel_pct, security_fee = (params[:, i:i + 1] for i in range(5))
+    length, width, height = _dimension_arrays(shipments, 10)
+    # (L/100 * W/100 * H/100) * 1000 / divisor kg, in grams
+    dim_grams = rnd((length * width * height)[None, :] / divisor)
+    chargeable = np.maximum(grams[None, :], dim_grams)
+    base_rate = rnd((base + chargeable / 1000.0 * per_kg) * 100.0)
+    fuel_surcharge = rnd(base_rate * (fuel_pct / 100.0))
+    security_fee = np.broadcast_to(security_fee, base_rate.shape)
+    subtotal = base_rate + fuel_surcharge + security_fee
+    markup = _markup(subtotal, markup_percent, rnd)
+    return {
+        'base_rate': base_rate, 'fuel_surcharge': fuel_surcharge, 'security_fee': security_fee,
+        'markup': markup, 'total': subtotal + markup,
+        'chargeable_grams': chargeable, 'dim_grams': dim_grams,
+    }
+
+
+def _sea(params, grams, shipments, markup_percent, rnd):
+    (cbm_20, cbm_40, price_20, price_40, origin_fees, destination_fees, customs_fee, delivery_fee,
+     rate_cbm, rate_ton, lcl_fees) = (params[:, i:i + 1] for i in range(11))
+    length, width, height = _dimension_arrays(shipments, 0)
+    volume = ((length / 100.0) * (width / 100.0) * (height / 100.0))[None, :]
+    rnd.flag_near(volume, cbm_20)
+    rnd.flag_near(volume, cbm_40)
+    fits_20 = np.broadcast_to(volume <= cbm_20, rnd.ambiguous.shape)
+    is_fcl = fits_20 | (volume <= cbm_40)
+    fcl_subtotal = np.where(fits_20, price_20, price_40) + origin_fees + destination_fees + customs_fee + delivery_fee
+    cost_by_volume = rnd(volume * rate_cbm * 100.0)
+    cost_by_weight = rnd((grams / 1000000.0)[None, :] * rate_ton * 100.0)
+    base_shipping = np.maximum(cost_by_volume, cost_by_weight)
+    lcl_subtotal = lcl_fees + base_shipping
+    subtotal = np.where(is_fcl, fcl_subtotal, lcl_subtotal)
+    markup = _markup(subtotal, markup_percent, rnd)
+    return {
+        'is_fcl': is_fcl, 'fits_20': fits_20, 'markup': markup, 'total': subtotal + markup,
+        'cost_by_volume': cost_by_volume, 'cost_by_weight': cost_by_weight, 'base_shipping': base_shipping,
+    }
+
+
+def _rail(params, grams, shipments, markup_percent, rnd):
+    base, per_kg, terminal_handling, customs_fee = (params[:, i:i + 1] for i in range(4))
+    base_rate = rnd((base + (grams / 1000.0)[None, :] * per_kg) * 100.0)
+    subtotal = base_rate + terminal_handling + customs_fee
+    markup = _markup(subtotal, markup_percent, rnd)
+    return {'base_rate': base_rate, 'markup': markup, 'total': subtotal + markup}
+
+
+def _truck(params, grams, shipments, markup_percent, rnd, freight_class):
+    (ltl_rate, ltl_fuel_pct, ltl_accessorials, ftl_base, ftl_fuel_pct) = (params[:, i:i + 1] for i in range(5))
+    weight_lbs = (grams / 1000.0 * LBS_PER_KG)[None, :]
+    rnd.flag_near(weight_lbs, LTL_MAX_LBS)
+    is_ftl = np.broadcast_to(weight_lbs >= LTL_MAX_LBS, rnd.ambiguous.shape)
+    ltl_base = rnd(weight_lbs / 100.0 * ltl_rate * (freight_class / 100.0) * 100.0)
+    ltl_fuel = rnd(ltl_base * (ltl_fuel_pct / 100.0))
+    ftl_base = np.broadcast_to(ftl_base, rnd.ambiguous.shape)
+    ftl_fuel = rnd(ftl_base * (ftl_fuel_pct / 100.0))
+    base_rate = np.where(is_ftl, ftl_base, ltl_base)
+    fuel_surcharge = np.where(is_ftl, ftl_fuel, ltl_fuel)
+    accessorials = np.where(is_ftl, 0.0, ltl_accessorials)
+    subtotal = base_rate + fuel_surcharge + accessorials
+    markup = _markup(subtotal, markup_percent, rnd)
+    return {
+        'base_rate': base_rate, 'fuel_surcharge': fuel_surcharge, 'accessorials': accessorials,
+        'markup': markup, 'total': subtotal + markup,
+    }
+
+
+def _route_params(calculator, route, mode_type, shipping_category):
+    """
+    Pull the settings for one route into a float vector (defaults as in the
+    Decimal path) plus the fixed fees in cents the quote dict reports.
+    """
+    if mode_type == 'air':
+        s = calculator.get_calculation_settings(route, route.transport_mode, shipping_category)
+        return [
+            _f(s.base_rate), _f(s.per_kg_rate, 8.5), _f(s.dimensional_weight_divisor),
+            _f(s.fuel_surcharge_percent), _cents(s.security_fee),
+        ]
+    if mode_type == 'sea':
+        s = calculator.get_calculation_settings(route, route.transport_mode, shipping_category)
+        lcl_fees = sum(_cents(v) for v in (
+            s.ocean_freight_base, s.port_origin_handling, s.port_destination_handling,
+            s.documentation_fee, s.customs_clearance_fee, s.destination_delivery_fee,
+        ))
+        return [
+            _f(s.container_20ft_cbm), _f(s.container_40ft_cbm),
+            _cents(s.container_20ft_price), _cents(s.container_40ft_price),
+            _cents(s.container_origin_fees), _cents(s.container_destination_fees),
+            _cents(s.container_customs_fee), _cents(s.container_delivery_fee),
+            _f(s.rate_per_cbm), _f(s.rate_per_ton), lcl_fees,
+            # LCL fees itemized in the quote
+            _cents(s.ocean_freight_base), _cents(s.port_origin_handling), _cents(s.port_destination_handling),
+            _cents(s.documentation_fee), _cents(s.customs_clearance_fee), _cents(s.destination_delivery_fee),
+        ]
+    if mode_type == 'rail':
+        s = calculator.get_calculation_settings(route, route.transport_mode, shipping_category)
+        return [
+            _f(s.base_rate_rail, 200.0), _f(s.per_kg_rate_rail, 2.5),
+            _cents(s.terminal_handling_fee, '100'), _cents(s.customs_fee_rail, '50'),
+        ]
+    if mode_type == 'truck':
+        # calculate_truck_freight prices with the first truck mode's settings
+        transport_mode = calculator.rate_card.first_mode_of_type('truck') or route.transport_mode
+        s = calculator.get_calculation_settings(route, transport_mode, shipping_category)
+        truck_rate = s.base_rate_truck if s and s.base_rate_truck else None
+        fuel_pct = _f(s.fuel_surcharge_percent) if s else 0.0
+        return [
+            _f(truck_rate, 50.0),
+            fuel_pct or 15.0,
+            _cents(s.handling_fee if s else None, '50'),
+            _cents(truck_rate * Decimal('40') if truck_rate else None, '2000'),
+            fuel_pct or 20.0,
+        ]
+    return None
+
+
+class PriceMatrix:
+    """
+    Result of price_matrix. total_cents is -1 for cells with an unknown
+    transport mode; quote() builds the same dict calculate_route_freight returns.
+    """
+
+    def __init__(self, routes, shipments, grams, volumes):
+        self.routes = routes
+        self.shipments = shipments
+        self.total_cents = np.full((len(routes), len(shipments)), -1, dtype=np.int64)
+        self.reconciled = 0
+        self._grams = grams
+        self._volumes = volumes
+        self._modes = {}  # route index -> (mode type, row in the mode's arrays, route params)
+        self._arrays = {}  # mode type -> component arrays (cents / grams)
+        self._exact = {}  # (route index, shipment index) -> quote from the Decimal path
+
+    def quote(self, route_index, shipment_index):
+        """Freight quote for one cell (a new dict on every call), or None"""
+        exact = self._exact.get((route_index, shipment_index))
+        if exact is not None:
+            return _copy_quote(exact)
+        if route_index not in self._modes:
+            return None
+        mode_type, row, params = self._modes[route_index]
+        cell = {name: values[row, shipment_index] for name, values in self._arrays[mode_type].items()}
+        return getattr(self, f'_{mode_type}_quote')(cell, params, shipment_index)
+
+    def _air_quote(self, cell, params, shipment_index):
+        base_rate, fuel_surcharge, security_fee, markup = (
+            _json(cell[name]) for name in ('base_rate', 'fuel_surcharge', 'security_fee', 'markup')
+        )
+        return {
+            'base_rate': base_rate,
+            'fuel_surcharge': fuel_surcharge,
+            'security_fee': security_fee,
+            'markup': markup,
+            'total': _json(cell['total']),
+            'total_cents': int(cell['total']),
+            'chargeable_weight': float(grams_to_kg(int(cell['chargeable_grams']))),
+            'actual_weight': float(grams_to_kg(self._grams[shipment_index])),
+            'dimensional_weight': float(grams_to_kg(int(cell['dim_grams']))),
+            'transit_days': (1, 8),
+            'breakdown': {
+                'base_rate': base_rate,
+                'fuel_surcharge': fuel_surcharge,
+                'security_fee': security_fee,
+                'markup': markup,
+            }
+        }
+
+    def _sea_quote(self, cell, params, shipment_index):
+        markup = _json(cell['markup'])
+        volume_cbm = float(self._volumes[shipment_index])
+        if cell['is_fcl']:
+            ocean_freight_base = _json(params[2] if cell['fits_20'] else params[3])
+            origin_fees, destination_fees, customs, delivery = (_json(value) for value in params[4:8])
+            return {
+                'base_rate': ocean_freight_base,
+                'origin_fees': origin_fees,
+                'destination_fees': destination_fees,
+                'customs_fee': customs,
+                'delivery_fee': delivery,
+                'markup': markup,
+                'total': _json(cell['total']),
+                'total_cents': int(cell['total']),
+                'volume_cbm': volume_cbm,
+                'container_type': '20ft' if cell['fits_20'] else '40ft',
+                'is_fcl': True,
+                'transit_days': (15, 45),
+                'breakdown': {
+                    'ocean_freight_base': ocean_freight_base,
+                    'origin_fees': origin_fees,
+                    'destination_fees': destination_fees,
+                    'customs_fee': customs,
+                    'delivery_fee': delivery,
+                    'markup': markup,
+                }
+            }
+        base_shipping = _json(cell['base_shipping'])
+        (ocean_freight_base, port_origin_handling, port_destination_handling, documentation,
+         customs_clearance, destination_delivery) = (_json(value) for value in params[11:17])
+        return {
+            'base_rate': base_shipping,
+            'ocean_freight_base': ocean_freight_base,
+            'port_origin_handling': port_origin_handling,
+            'port_destination_handling': port_destination_handling,
+            'documentation_fee': documentation,
+            'customs_clearance_fee': customs_clearance,
+            'destination_delivery_fee': destination_delivery,
+            'markup': markup,
+            'total': _json(cell['total']),
+            'total_cents': int(cell['total']),
+            'volume_cbm': volume_cbm,
+            'weight_ton': float(Decimal(self._grams[shipment_index]) / Decimal('1000000')),
+            'cost_by_volume': _json(cell['cost_by_volume']),
+            'cost_by_weight': _json(cell['cost_by_weight']),
+            'is_fcl': False,
+            'transit_days': (15, 45),
+            'breakdown': {
+                'ocean_freight_base': ocean_freight_base,
+                'base_shipping': base_shipping,
+                'port_origin_handling': port_origin_handling,
+                'port_destination_handling': port_destination_handling,
+                'documentation_fee': documentation,
+                'customs_clearance_fee': customs_clearance,
+                'destination_delivery_fee': destination_delivery,
+                'markup': markup,
+            }
+        }
+
+    def _rail_quote(self, cell, params, shipment_index):
+        return {
+            'base_rate': _json(cell['base_rate']),
+            'terminal_handling': _json(params[2]),
+            'customs_fee': _json(params[3]),
+            'markup': _json(cell['markup']),
+            'total': _json(cell['total']),
+            'total_cents': int(cell['total']),
+            'transit_days': (10, 20)
+        }
+
+    def _truck_quote(self, cell, params, shipment_index):
+        return {
+            'base_rate': _json(cell['base_rate']),
+            'fuel_surcharge': _json(cell['fuel_surcharge']),
+            'accessorials': _json(cell['accessorials']),
+            'markup': _json(cell['markup']),
+            'total': _json(cell['total']),
+            'total_cents': int(cell['total']),
+            'transit_days': (2, 10)
+        }
+
+
+def _copy_quote(quote):
+    quote = dict(quote)
+    if 'breakdown' in quote:
+        quote['breakdown'] = dict(quote['breakdown'])
+    return quote
+
+
+def _volume_cbm(dimensions):
+    """Volume as calculate_sea_freight computes it (Decimal)"""
+    length, width, height = (Decimal(str(dimensions.get(key, 0))) / Decimal('100') for key in DIMENSION_KEYS)
+    return length * width * height
+
+
+def price_matrix(calculator, routes, shipments, shipping_category='small_parcel', freight_class=70):
+    """
+    Price every route for every shipment.
+
+    Args:
+        calculator: PricingCalculator (settings lookups and the Decimal reference path)
+        routes: ShippingRoute list (rows)
+        shipments: list of {'weight': kg, 'dimensions': {'length', 'width', 'height'}} (columns)
+
+    Returns:
+        PriceMatrix
+    """
+    routes = list(routes)
+    shipments = [{'weight': s['weight'], 'dimensions': s.get('dimensions') or {}} for s in shipments]
+    markup_percent = float(Decimal(str(settings.SHIPPING_MARKUP_PERCENTAGE)))
+
+    weight_rounder = _Rounder((1, len(shipments)))
+    grams = weight_rounder(np.array([float(s['weight']) for s in shipments])[None, :] * 1000.0)[0]
+    volumes = [_volume_cbm(s['dimensions']) if any(r.transport_mode.type == 'sea' for r in routes) else None
+               for s in shipments]
+    matrix = PriceMatrix(routes, shipments, [int(g) for g in grams], volumes)
+    ambiguous = np.zeros(matrix.total_cents.shape, dtype=bool)
+
+    # Group routes by mode so each mode is one broadcast over (routes, shipments)
+    by_mode = {}
+    for index, route in enumerate(routes):
+        by_mode.setdefault(route.transport_mode.type, []).append(index)
+
+    kernels = {'air': _air, 'sea': _sea, 'rail': _rail}
+    for mode_type, indexes in by_mode.items():
+        rows = [_route_params(calculator, routes[i], mode_type, shipping_category) for i in indexes]
+        if rows[0] is None:
+            logger.warning(f"price_matrix: unknown transport mode {mode_type}, skipping {len(indexes)} routes")
+            continue
+        params = np.array(rows, dtype=float)
+        rnd = _Rounder((len(indexes), len(shipments)))
+        if mode_type == 'truck':
+            arrays = _truck(params, grams, shipments, markup_percent, rnd, float(freight_class))
+        else:
+            arrays = kernels[mode_type](params, grams, shipments, markup_percent, rnd)
+        matrix._arrays[mode_type] = arrays
+        for row, route_index in enumerate(indexes):
+            matrix._modes[route_index] = (mode_type, row, params[row])
+        matrix.total_cents[indexes] = arrays['total'].astype(np.int64)
+        ambiguous[indexes] = rnd.ambiguous | weight_rounder.ambiguous
+
+    # Exact-cents reconciliation with the Decimal path for cells the floats could not decide
+    for route_index, shipment_index in zip(*np.nonzero(ambiguous)):
+        shipment = shipments[shipment_index]
+        quote = calculator.calculate_route_freight(
+            routes[route_index], shipment['weight'], shipment['dimensions'], 0, shipping_category, freight_class,
+            use_price_grid=False
+        )
+        matrix._exact[(route_index, shipment_index)] = quote
+        matrix.total_cents[route_index, shipment_index] = quote['total_cents']
+        matrix.reconciled += 1
+
+    logger.info(f"price_matrix: priced {len(routes)}x{len(shipments)} cells, "
+                f"reconciled {matrix.reconciled} with the Decimal path")
+    return matrix
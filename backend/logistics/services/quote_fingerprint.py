@@ -0,0 +1,84 @@
+"""
+Canonical fingerprint of a quote request.
+
+Two requests that would be priced the same get the same fingerprint, no matter
+how the client formatted addresses, numbers or key order. Used to key the
+get_all_quotes result cache (together with the rate card version) and the
+EasyShip rate cache.
+"""
+import hashlib
+import json
+
+from logistics.services.money import Money, kg_to_grams
+
+# Address fields that can change a price (EasyShip rates, pickup distance/residential fee)
+ADDRESS_FIELDS = (
+    'country', 'country_alpha2', 'state_province', 'state', 'city', 'postal_code',
+    'street_address', 'line_1', 'line_2', 'company',
+)
+
+
+def _text(value):
+    return ' '.join(str(value).split()).lower() if value is not None else ''
+
+
+def normalize_address(address):
+    """Address dict -> dict of the price-relevant fields, whitespace/case normalized"""
+    if not address:
+        return None
+    if not isinstance(address, dict):
+        return _text(address)
+    normalized = {}
+    for field in ADDRESS_FIELDS:
+        value = _text(address.get(field))
+        if value:
+            normalized[field] = value
+    if 'country' in normalized:
+        normalized['country'] = normalized['country'].upper()
+    if 'postal_code' in normalized:
+        normalized['postal_code'] = normalized['postal_code'].replace(' ', '').upper()
+    return normalized
+
+
+def _length_mm(value):
+    """cm -> integer mm"""
+    return kg_to_grams(value or 0) // 10
+
+
+def normalize_dimensions(dimensions):
+    if not isinstance(dimensions, dict):
+        return None
+    return {key: _length_mm(dimensions.get(key)) for key in ('length', 'width', 'height') if key in dimensions}
+
+
+def normalize_items(items):
+    if not items:
+        return None
+    return json.loads(json.dumps(items, sort_keys=True, default=str))
+
+
+def _country(value):
+    if isinstance(value, dict):
+        value = value.get('country', '')
+    return str(value or '').strip().upper()
+
+
+def quote_fingerprint(origin_country, destination_country, weight, dimensions, declared_value=0, items=None,
+                      shipping_category=None, origin_address=None, warehouse_address=None,
+                      destination_address=None, skip_origin_to_warehouse=False):
+    """sha256 of the canonical form of a get_all_quotes request"""
+    canonical = {
+        'origin_country': _country(origin_country),
+        'destination_country': _country(destination_country),
+        'weight_grams': kg_to_grams(weight or 0),
+        'dimensions_mm': normalize_dimensions(dimensions),
+        'declared_value_cents': Money.from_amount(declared_value or 0).cents,
+        'items': normalize_items(items),
+        'shipping_category': shipping_category or '',
+        'origin_address': normalize_address(origin_address),
+        'warehouse_address': normalize_address(warehouse_address),
+        'destination_address': normalize_address(destination_address),
+        'skip_origin_to_warehouse': bool(skip_origin_to_warehouse),
+    }
+    payload = json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
@@ -0,0 +1,274 @@
+"""
+In-memory rate card snapshot for the pricing calculator.
+
+Countries, transport modes, routes, calculation settings, warehouses and pickup
+settings change a few times a day at most, but a single quote used to read them
+with dozens of queries. The snapshot loads them once per process and is rebuilt
+only when the shared rate card version changes (see logistics.signals).
+"""
+import logging
+import threading
+import time
+from types import MappingProxyType
+
+from django.core.cache import cache
+from django.db import transaction
+
+from logistics.models import (
+    Country, TransportMode, ShippingRoute,
+    ShippingCalculationSettings, Warehouse, PickupCalculationSettings
+)
+
+logger = logging.getLogger(__name__)
+
+RATE_CARD_VERSION_KEY = 'logistics_rate_card_version'
+
+# Shipping categories the settings index is precomputed for
+SHIPPING_CATEGORIES = [code for code, _ in ShippingCalculationSettings.SHIPPING_CATEGORIES]
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def _new_version():
+    return int(time.time() * 1000)
+
+
+def get_rate_card_version():
+    """Current rate card version shared by all workers through the cache"""
+    return cache.get_or_set(RATE_CARD_VERSION_KEY, _new_version, None)
+
+
+def bump_rate_card_version():
+    """Invalidate every worker's snapshot; called when rate card models change"""
+    global _snapshot
+    try:
+        version = cache.incr(RATE_CARD_VERSION_KEY)
+    except ValueError:
+        version = _new_version()
+        cache.set(RATE_CARD_VERSION_KEY, version, None)
+    _snapshot = None
+    logger.info(f"Rate card version bumped to {version}")
+    return version
+
+
+def schedule_rate_card_bump():
+    """Bump the version once the current transaction commits"""
+    transaction.on_commit(bump_rate_card_version)
+
+
+def get_rate_card():
+    """Return the snapshot for the current rate card version, rebuilding it if stale"""
+    global _snapshot
+    version = get_rate_card_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = RateCardSnapshot.build(version)
+        return _snapshot
+
+
+class PickupSettingsIndex:
+    """
+    Pickup settings resolved ahead of time: country -> state -> category.
+
+    Each (country, state) table has the whole fallback chain baked in, so a
+    lookup is two dict reads instead of up to three filtered queries/scans:
+    state + category, state + 'all', country + category, country + 'all',
+    then the first 'all' row of any state in the country.
+    PickupCalculationSettings is unique per (country, state, category).
+    """
+    # None resolves categories that have no row of their own (only 'all' rows match)
+    CATEGORIES = [code for code, _ in PickupCalculationSettings.SHIPPING_CATEGORIES] + [None]
+
+    def __init__(self, pickup_settings):
+        rows_by_country = {}
+        for settings_obj in pickup_settings:
+            rows_by_country.setdefault(settings_obj.country_id, {}).setdefault(
+                (settings_obj.state, settings_obj.shipping_category), settings_obj
+            )
+
+        index = {}
+        for country_code, rows in rows_by_country.items():
+            # PickupCalculationSettings.Meta.ordering: state, then category
+            any_state_all = next((rows[key] for key in sorted(rows) if key[1] == 'all'), None)
+            country_table = self._resolve(rows, '', {category: any_state_all for category in self.CATEGORIES})
+            tables = {'': country_table}
+            for state in {state for state, _ in rows if state}:
+                tables[state] = self._resolve(rows, state, country_table)
+            index[country_code] = MappingProxyType(tables)
+        self._index = MappingProxyType(index)
+
+    def _resolve(self, rows, state, fallback):
+        return MappingProxyType({
+            category: rows.get((state, category)) or rows.get((state, 'all')) or fallback[category]
+            for category in self.CATEGORIES
+        })
+
+    def resolve(self, country_code, state, shipping_category):
+        tables = self._index.get(country_code)
+        if not tables:
+            return None
+        table = (tables.get(state) if state else None) or tables['']
+        return table.get(shipping_category, table[None])
+
+
+class RateCardSnapshot:
+    """
+    Immutable view of the rate card for one version.
+
+    Model instances are shared between requests and must be treated as read-only.
+    Related objects (route countries, settings routes, etc.) are wired to the
+    snapshot's own instances so that no attribute access hits the database.
+    """
+
+    def __init__(self, version, countries, transport_modes, routes, calculation_settings,
+                 warehouses, pickup_settings):
+        self.version = version
+        self.built_at = time.time()
+
+        self.countries = MappingProxyType({c.code: c for c in countries})
+        self.transport_modes = MappingProxyType({m.id: m for m in transport_modes})
+
+        # TransportMode has no default ordering, so .first() is the lowest pk
+        modes_by_type = {}
+        for mode in sorted(transport_modes, key=lambda m: m.id):
+            modes_by_type.setdefault(mode.type, mode)
+        self._first_mode_by_type = MappingProxyType(modes_by_type)
+
+        for route in routes:
+            route.origin_country = self.countries[route.origin_country_id]
+            route.destination_country = self.countries[route.destination_country_id]
+            route.transport_mode = self.transport_modes[route.transport_mode_id]
+        routes_by_id = {r.id: r for r in routes}
+
+        # Available routes per lane, in ShippingRoute.Meta.ordering
+        lanes = {}
+        for route in routes:
+            if route.is_available:
+                lanes.setdefault((route.origin_country_id, route.destination_country_id), []).append(route)
+        self._lanes = MappingProxyType({k: tuple(v) for k, v in lanes.items()})
+
+        # ShippingCalculationSettings.Meta.ordering is preserved by the build query
+        route_specific = {}
+        any_for_route = {}
+        global_defaults = {}
+        for settings_obj in calculation_settings:
+            settings_obj.transport_mode = self.transport_modes[settings_obj.transport_mode_id]
+            if settings_obj.route_id:
+                settings_obj.route = routes_by_id.get(settings_obj.route_id)
+                key = (settings_obj.route_id, settings_obj.transport_mode_id)
+                any_for_route.setdefault(key, settings_obj)
+                if not settings_obj.is_global_default:
+                    route_specific.setdefault(key, settings_obj)
+            else:
+                settings_obj.route = None
+            if settings_obj.is_global_default:
+                global_defaults.setdefault(settings_obj.transport_mode_id, []).append(settings_obj)
+        self._route_settings = MappingProxyType(route_specific)
+        self._any_route_settings = MappingProxyType(any_for_route)
+        self._global_settings = MappingProxyType({k: tuple(v) for k, v in global_defaults.items()})
+
+        # (origin, destination, mode code, category) -> settings used to price that route
+        settings_index = {}
+        for (origin, destination), lane_routes in self._lanes.items():
+            for route in lane_routes:
+                for category in SHIPPING_CATEGORIES:
+                    settings_obj = self.calculation_settings(route, route.transport_mode, category)
+                    if settings_obj:
+                        settings_index[(origin, destination, route.transport_mode.code, category)] = settings_obj
+        self._settings_index = MappingProxyType(settings_index)
+
+        warehouses_by_country = {}
+        for warehouse in warehouses:
+            warehouse.country = self.countries[warehouse.country_id]
+            warehouses_by_country.setdefault(warehouse.country_id, []).append(warehouse)
+        self._warehouses = MappingProxyType({k: tuple(v) for k, v in warehouses_by_country.items()})
+
+        pickup_fallback = None
+        for settings_obj in pickup_settings:
+            settings_obj.country = self.countries[settings_obj.country_id]
+            if settings_obj.is_global_fallback and pickup_fallback is None:
+                pickup_fallback = settings_obj
+        self._pickup_index = PickupSettingsIndex(pickup_settings)
+        self.pickup_fallback = pickup_fallback
+
+    @classmethod
+    def build(cls, version):
+        """Load the whole rate card with one query per model"""
+        started = time.monotonic()
+        snapshot = cls(
+            version,
+            countries=list(Country.objects.all()),
+            transport_modes=list(TransportMode.objects.all()),
+            routes=list(ShippingRoute.objects.all()),
+            calculation_settings=list(ShippingCalculationSettings.objects.order_by('transport_mode', '-is_global_default', 'id')),
+            warehouses=list(Warehouse.objects.filter(is_active=True).order_by('-priority')),
+            pickup_settings=list(PickupCalculationSettings.objects.filter(is_active=True)),
+        )
+        logger.info(f"Built rate card snapshot v{version} in {(time.monotonic() - started) * 1000:.1f}ms")
+        return snapshot
+
+    def get_country(self, code):
+        """Country by ISO code; raises Country.DoesNotExist like Country.objects.get"""
+        if isinstance(code, Country):
+            code = code.code
+        try:
+            return self.countries[code]
+        except KeyError:
+            raise Country.DoesNotExist(f"Country with code {code} does not exist.")
+
+    def first_mode_of_type(self, mode_type):
+        return self._first_mode_by_type.get(mode_type)
+
+    def routes_for(self, origin_country, destination_country):
+        """Available routes for a lane, highest priority first"""
+        origin_code = origin_country.code if isinstance(origin_country, Country) else origin_country
+        destination_code = destination_country.code if isinstance(destination_country, Country) else destination_country
+        return self._lanes.get((origin_code, destination_code), ())
+
+    def available_routes(self):
+        """All available routes, lane by lane"""
+        return [route for lane_routes in self._lanes.values() for route in lane_routes]
+
+    def has_calculation_settings(self, route):
+        """True if the route has its own settings or a global default exists for its mode"""
+        key = (route.id, route.transport_mode_id)
+        return key in self._any_route_settings or bool(self._global_settings.get(route.transport_mode_id))
+
+    def calculation_settings(self, route, transport_mode, shipping_category='small_parcel'):
+        """Route-specific settings supporting the category, else the matching global default"""
+        if transport_mode is None:
+            return None
+        if route:
+            settings_obj = self._route_settings.get((route.id, transport_mode.id))
+            if settings_obj and settings_obj.supports_category(shipping_category):
+                return settings_obj
+
+        global_settings = self._global_settings.get(transport_mode.id, ())
+        for settings_obj in global_settings:
+            if settings_obj.supports_category(shipping_category):
+                return settings_obj
+        for settings_obj in global_settings:
+            if not settings_obj.shipping_categories:
+                return settings_obj
+        return None
+
+    def settings_for(self, origin_country, destination_country, mode_code, shipping_category):
+        """Pricing settings for a lane/mode/category, or None"""
+        return self._settings_index.get((origin_country, destination_country, mode_code, shipping_category))
+
+    def warehouses_for(self, country):
+        """Active warehouses in a country, highest priority first"""
+        country_code = country.code if isinstance(country, Country) else country
+        return self._warehouses.get(country_code, ())
+
+    def find_pickup_settings(self, country, state, shipping_category):
+        """
+        Most specific active pickup settings:
+        state + category, country + category, then country 'all'.
+        """
+        country_code = country.code if isinstance(country, Country) else country
+        return self._pickup_index.resolve(country_code, state, shipping_category)
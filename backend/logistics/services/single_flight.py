@@ -0,0 +1,113 @@
+"""
+Single-flight coalescing of identical upstream calls.
+
+Only one call per key runs at a time:
+- inside a process, concurrent callers for the same key wait on the running
+  call and share its result;
+- across workers, the caller that wins a lock in the shared cache (Redis when
+  USE_REDIS_CACHE is on) makes the call and the others poll the shared cache
+  for its result (shared_result), falling back to their own call if it does
+  not show up in time.
+
+Counters (calls, coalesced_local, coalesced_remote, wait_timeouts) are kept in
+the shared cache per flight name; see SingleFlight.stats().
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+LOCK_TIMEOUT = 60  # seconds; a crashed leader's lock expires after this
+POLL_INTERVAL = 0.05
+COUNTERS = ('calls', 'coalesced_local', 'coalesced_remote', 'wait_timeouts')
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key"""
+
+    def __init__(self, name):
+        self.name = name
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, shared_result=None):
+        """
+        Result of func() for key, calling it at most once across concurrent callers.
+
+        shared_result() returns the result another worker's call left in the
+        shared cache, or None while it is not there yet.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self._flights[key] = _Flight()
+
+        if not is_leader:
+            if flight.event.wait(settings.SINGLE_FLIGHT_WAIT_SECONDS) and not flight.failed:
+                self._count('coalesced_local')
+                return flight.result
+            self._count('wait_timeouts')
+            return func()
+
+        try:
+            flight.result = self._call_shared(key, func, shared_result)
+            return flight.result
+        except Exception:
+            flight.failed = True
+            raise
+        finally:
+            flight.event.set()
+            with self._lock:
+                self._flights.pop(key, None)
+
+    def _call_shared(self, key, func, shared_result):
+        lock_key = f'single_flight_{self.name}_{key}'
+        if cache.add(lock_key, True, LOCK_TIMEOUT):
+            self._count('calls')
+            try:
+                return func()
+            finally:
+                cache.delete(lock_key)
+
+        # Another worker is making this call: wait for its result
+        logger.debug(f"Single flight {self.name}: waiting for another worker's call")
+        deadline = time.monotonic() + settings.SINGLE_FLIGHT_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            result = shared_result() if shared_result else None
+            if result is not None:
+                self._count('coalesced_remote')
+                return result
+            if cache.get(lock_key) is None:
+                break  # the other call finished without leaving a result (failed)
+        self._count('wait_timeouts')
+        return func()
+
+    def _counter_key(self, counter):
+        return f'single_flight_{self.name}_{counter}'
+
+    def _count(self, counter):
+        key = self._counter_key(counter)
+        try:
+            cache.add(key, 0, None)
+            cache.incr(key)
+        except ValueError:
+            pass  # evicted between add and incr; losing one count is fine
+        if counter != 'calls':
+            logger.info(f"Single flight {self.name}: {counter}")
+
+    def stats(self):
+        """Counters shared by all workers (per process with the local memory cache)"""
+        return {counter: cache.get(self._counter_key(counter), 0) for counter in COUNTERS}
@@ -0,0 +1,121 @@
+"""
+Rendered public tracking responses.
+
+track_by_number used to serialize the shipment, its packages and every
+tracking update on each hit. The rendered JSON is now cached per shipment
+with a strong ETag (SHA-256 of the body) and a Last-Modified time, and the
+identifier -> shipment lookup is cached too, so a repeat or conditional
+request (If-None-Match / If-Modified-Since -> 304) is served from the cache
+without a database query.
+
+Responses are keyed by a per-shipment version that logistics.signals bump
+(after commit) when the shipment, its packages, pickup, payment or tracking
+updates change; store_checkpoints bumps it for its bulk inserts. A response
+built while a write was committing is stored under the old version and never
+served. TRACKING_RESPONSE_CACHE_TTL only bounds memory use.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework.renderers import JSONRenderer
+
+from logistics.services.tracking_identifiers import resolve
+
+
+def _identifier_key(identifier):
+    return 'tracking_identifier_' + hashlib.sha256(identifier.strip().encode('utf-8')).hexdigest()
+
+
+def _version_key(shipment_id):
+    return f'tracking_response_version_{shipment_id}'
+
+
+def _new_version():
+    return int(time.time() * 1000)
+
+
+def shipment_id_for(identifier):
+    """Shipment id for a public tracking identifier, or None (misses are not cached)"""
+    key = _identifier_key(identifier)
+    shipment_id = cache.get(key)
+    if shipment_id is None:
+        shipment = resolve(identifier)
+        if shipment is None:
+            return None
+        shipment_id = shipment.id
+        cache.set(key, shipment_id, settings.TRACKING_RESPONSE_CACHE_TTL)
+    return shipment_id
+
+
+def forget_identifier(identifier):
+    """Drop a cached identifier lookup once the current transaction commits"""
+    transaction.on_commit(lambda: cache.delete(_identifier_key(identifier)))
+
+
+def invalidate_shipment(shipment_id):
+    """Make the cached response of a shipment stale"""
+    try:
+        cache.incr(_version_key(shipment_id))
+    except ValueError:
+        cache.set(_version_key(shipment_id), _new_version(), None)
+
+
+def schedule_invalidation(*shipment_ids):
+    """Invalidate once the current transaction commits (at once outside a transaction)"""
+    for shipment_id in {shipment_id for shipment_id in shipment_ids if shipment_id}:
+        transaction.on_commit(lambda shipment_id=shipment_id: invalidate_shipment(shipment_id))
+
+
+def get_entry(shipment_id, build):
+    """
+    Cached {'content', 'etag', 'last_modified'} for the shipment; on a miss
+    build(shipment_id) -> (data, last_modified datetime) is rendered and stored.
+    """
+    version = cache.get_or_set(_version_key(shipment_id), _new_version, None)
+    key = f'tracking_response_{shipment_id}_{version}'
+    entry = cache.get(key)
+    if entry is None:
+        data, last_modified = build(shipment_id)
+        content = JSONRenderer().render(data)
+        entry = {
+            'content': content,
+            'etag': f'"{hashlib.sha256(content).hexdigest()}"',
+            'last_modified': int(last_modified.timestamp()),
+        }
+        cache.set(key, entry, settings.TRACKING_RESPONSE_CACHE_TTL)
+    return entry
+
+
+def _etag_matches(header, etag):
+    """If-None-Match uses weak comparison, so W/"x" matches "x" """
+    if header.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in header.split(',')]
+    return any(tag.removeprefix('W/') == etag for tag in candidates)
+
+
+def not_modified(request, entry):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        # If-Modified-Since is ignored when If-None-Match is present (RFC 9110)
+        return _etag_matches(if_none_match, entry['etag'])
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and entry['last_modified'] <= if_modified_since
+
+
+def entry_response(request, entry):
+    """200 with the cached body, or 304 if the client already has it"""
+    if not_modified(request, entry):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(entry['content'], content_type='application/json')
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    # Clients may keep the body but must revalidate; a 304 costs no database work
+    response['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,101 @@
+"""
+Real-time tracking push (Server-Sent Events over Redis pub/sub).
+
+Writes publish small JSON events on a per-shipment Redis channel once their
+transaction commits (logistics.signals: shipment status changes, tracking
+updates, pickup changes; store_checkpoints for webhook and polled
+checkpoints). The track_events view streams a shipment's channel to the
+browser, so an open tracking page or dashboard keeps one connection instead
+of polling track_shipment/track_by_number.
+
+Publishing never breaks a write: with Redis down or TRACKING_PUSH_ENABLED off
+events are dropped and clients fall back to polling.
+"""
+import json
+import logging
+import time
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'tracking_events:'
+HEARTBEAT_SECONDS = 15
+
+_client = None
+
+
+def channel_name(shipment_id):
+    return f'{CHANNEL_PREFIX}{shipment_id}'
+
+
+def _redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.REDIS_URL, socket_connect_timeout=1, socket_timeout=1)
+    return _client
+
+
+def publish(shipment_id, event, data):
+    """Send an event to the shipment's subscribers now"""
+    if not settings.TRACKING_PUSH_ENABLED or not shipment_id:
+        return
+    message = json.dumps({'event': event, 'data': data}, cls=DjangoJSONEncoder)
+    try:
+        _redis().publish(channel_name(shipment_id), message)
+    except redis.RedisError as e:
+        logger.warning(f"Could not publish tracking event {event} for shipment {shipment_id}: {str(e)}")
+
+
+def schedule_publish(shipment_id, event, data):
+    """Publish once the current transaction commits, so subscribers never see rolled back writes"""
+    transaction.on_commit(lambda: publish(shipment_id, event, data))
+
+
+def shipment_event(shipment):
+    return {
+        'shipment_number': shipment.shipment_number,
+        'status': shipment.status,
+        'tracking_number': shipment.tracking_number,
+        'updated_at': shipment.updated_at,
+    }
+
+
+def tracking_update_event(update):
+    return {
+        'status': update.status,
+        'location': update.location,
+        'timestamp': update.timestamp,
+        'source': update.source,
+        'carrier_tracking_number': update.carrier_tracking_number,
+    }
+
+
+async def subscribe(shipment_id):
+    """
+    Yield (event, data) for the shipment until the client goes away or
+    TRACKING_STREAM_MAX_SECONDS pass (EventSource then reconnects);
+    ('heartbeat', None) every HEARTBEAT_SECONDS keeps proxies from closing the stream.
+    """
+    client = aioredis.Redis.from_url(settings.REDIS_URL)
+    pubsub = client.pubsub()
+    deadline = time.monotonic() + settings.TRACKING_STREAM_MAX_SECONDS
+    try:
+        await pubsub.subscribe(channel_name(shipment_id))
+        while time.monotonic() < deadline:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=HEARTBEAT_SECONDS)
+            if message is None:
+                yield 'heartbeat', None
+                continue
+            try:
+                payload = json.loads(message['data'])
+            except (TypeError, ValueError):
+                continue
+            yield payload['event'], payload['data']
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
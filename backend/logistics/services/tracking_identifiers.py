@@ -0,0 +1,130 @@
+"""
+Tracking identifier index.
+
+Public tracking accepts a carrier tracking number, a shipment number, a local
+carrier number, a package reference or a buying request reference.
+TrackingIdentifier maps each of them to its shipment, so resolve() is a single
+unique-index probe instead of an OR across LogisticsShipment columns plus a
+Package fallback.
+
+Rows are written by the logistics.signals handlers when shipments, packages
+and buying requests are saved, and rebuilt by the
+backfill_tracking_identifiers command. When two shipments claim the same
+identifier the old lookup order is kept: shipment columns beat references,
+then the newest shipment wins.
+"""
+import logging
+
+from django.db import IntegrityError, transaction
+
+from logistics.models import LogisticsShipment, TrackingIdentifier
+
+logger = logging.getLogger(__name__)
+
+# LogisticsShipment field -> TrackingIdentifier.kind
+SHIPMENT_FIELDS = (
+    ('tracking_number', 'carrier'),
+    ('shipment_number', 'shipment_number'),
+    ('local_carrier_tracking_number', 'local_carrier'),
+)
+SHIPMENT_KINDS = {kind for _, kind in SHIPMENT_FIELDS}
+
+
+def _clean(value):
+    # shipment_number is still a uuid.UUID when a new shipment is saved
+    return str(value).strip() if value else ''
+
+
+def _outranks(kind, shipment, current):
+    """Whether (kind, shipment) should take over the identifier row `current`"""
+    new_is_shipment_field = kind in SHIPMENT_KINDS
+    current_is_shipment_field = current.kind in SHIPMENT_KINDS
+    if current.shipment_id == shipment.id:
+        return new_is_shipment_field and not current_is_shipment_field
+    if new_is_shipment_field != current_is_shipment_field:
+        return new_is_shipment_field
+    return (shipment.created_at, shipment.id) > (current.shipment.created_at, current.shipment_id)
+
+
+def _claim(identifier, kind, shipment):
+    current = TrackingIdentifier.objects.select_related('shipment').filter(identifier=identifier).first()
+    if current is None:
+        try:
+            with transaction.atomic():
+                TrackingIdentifier.objects.create(identifier=identifier, kind=kind, shipment=shipment)
+            return
+        except IntegrityError:
+            # Created concurrently; compare with the winner
+            current = TrackingIdentifier.objects.select_related('shipment').get(identifier=identifier)
+    if _outranks(kind, shipment, current):
+        current.kind = kind
+        current.shipment = shipment
+        current.save(update_fields=['kind', 'shipment', 'updated_at'])
+
+
+def sync_shipment_identifiers(shipment):
+    """Index the shipment's own numbers and drop the ones it no longer has"""
+    wanted = {}
+    for field, kind in SHIPMENT_FIELDS:
+        value = _clean(getattr(shipment, field))
+        if value and value not in wanted:
+            wanted[value] = kind
+    TrackingIdentifier.objects.filter(shipment=shipment, kind__in=SHIPMENT_KINDS).exclude(
+        identifier__in=list(wanted)
+    ).delete()
+    for identifier, kind in wanted.items():
+        _claim(identifier, kind, shipment)
+
+
+def package_shipment(package):
+    """Shipment a package reference tracks: its newest linked shipment, else its primary shipment"""
+    return package.shipments.order_by('-created_at').first() or package.shipment
+
+
+def sync_package_identifiers(package):
+    reference = _clean(package.reference_number)
+    if not reference:
+        return
+    shipment = package_shipment(package)
+    if shipment is None:
+        TrackingIdentifier.objects.filter(identifier=reference, kind='package_reference').delete()
+        return
+    _claim(reference, 'package_reference', shipment)
+
+
+def sync_buying_request_identifiers(buying_request):
+    reference = _clean(buying_request.reference_number)
+    if not reference:
+        return
+    if buying_request.shipment_id is None:
+        TrackingIdentifier.objects.filter(identifier=reference, kind='buying_reference').delete()
+        return
+    _claim(reference, 'buying_reference', buying_request.shipment)
+
+
+def resolve(identifier):
+    """Shipment (with transport mode) for a public tracking identifier, or None"""
+    identifier = _clean(identifier)
+    if not identifier:
+        return None
+    try:
+        return TrackingIdentifier.objects.select_related('shipment__transport_mode').get(
+            identifier=identifier
+        ).shipment
+    except TrackingIdentifier.DoesNotExist:
+        return None
+
+
+def backfill():
+    """Index every shipment, package and buying request; returns the number of rows afterwards"""
+    from buying.models import BuyingRequest
+    from logistics.models import Package
+
+    for shipment in LogisticsShipment.objects.order_by('created_at').iterator():
+        sync_shipment_identifiers(shipment)
+    packages = Package.objects.filter(shipments__isnull=False) | Package.objects.filter(shipment__isnull=False)
+    for package in packages.distinct().iterator():
+        sync_package_identifiers(package)
+    for buying_request in BuyingRequest.objects.filter(shipment__isnull=False).select_related('shipment').iterator():
+        sync_buying_request_identifiers(buying_request)
+    return TrackingIdentifier.objects.count()
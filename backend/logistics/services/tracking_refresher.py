@@ -0,0 +1,208 @@
+"""
+Batch EasyShip tracking refresher.
+
+Tracking pages read tracking from the database (LogisticsShipment.tracking_data
+and TrackingUpdate rows, with tracking_refreshed_at as the freshness stamp)
+instead of calling EasyShip on every view. The refresh_tracking beat task
+polls the shipments that are due, in batches, with BACKGROUND priority so it
+never takes quota from label purchases or quotes.
+
+How often a shipment is polled depends on its status
+(TRACKING_REFRESH_INTERVALS, e.g. hourly in transit, every 10 minutes out for
+delivery); delivered and cancelled shipments are not polled. Checkpoints are
+normalized the same way as webhook checkpoints and stored once per
+(timestamp, status), so polled and webhook updates don't duplicate each other.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from logistics.models import LogisticsShipment, TrackingUpdate
+from logistics.services.easyship_rate_limiter import BACKGROUND
+from logistics.services.easyship_service import EasyShipService
+from logistics.services import tracking_cache, tracking_events
+from logistics.services.pricing_context import get_executor
+
+logger = logging.getLogger(__name__)
+
+# EasyShip checkpoint primary_status -> LogisticsShipment.status
+CHECKPOINT_STATUS_MAPPING = {
+    'Label Created': 'processing',
+    'Picked Up': 'dispatched',
+    'In Transit to Customer': 'in_transit',
+    'In Transit': 'in_transit',
+    'Out for Delivery': 'out_for_delivery',
+    'Delivered': 'delivered',
+}
+
+# Seconds between polls per shipment status; statuses not listed are not polled
+DEFAULT_REFRESH_INTERVALS = {
+    'processing': 3 * 3600,
+    'dispatched': 3600,
+    'in_transit': 3600,
+    'customs_clearance': 2 * 3600,
+    'out_for_delivery': 600,
+}
+
+REFRESH_LOCK_KEY = 'tracking_refresh_running'
+FAILED_RETRY_SECONDS = 600
+
+
+def refresh_intervals():
+    return {**DEFAULT_REFRESH_INTERVALS, **settings.TRACKING_REFRESH_INTERVALS}
+
+
+def normalize_checkpoint(checkpoint):
+    """EasyShip checkpoint -> (status, location, timestamp) as stored in TrackingUpdate"""
+    checkpoint_time = checkpoint.get('checkpoint_time')
+    checkpoint_timestamp = timezone.now()
+    if checkpoint_time:
+        try:
+            checkpoint_timestamp = datetime.fromisoformat(checkpoint_time.replace('Z', '+00:00'))
+        except (TypeError, ValueError):
+            pass
+
+    location_parts = [
+        checkpoint.get(field) for field in ('city', 'state', 'postal_code', 'country_name') if checkpoint.get(field)
+    ]
+    location = ', '.join(location_parts) if location_parts else checkpoint.get('location', '')
+    status = checkpoint.get('primary_status', '').lower().replace(' ', '_') or 'checkpoint'
+    return status, location, checkpoint_timestamp
+
+
+def latest_checkpoint_status(checkpoints):
+    """Shipment status for the newest checkpoint, or None if it doesn't map to one"""
+    if not checkpoints:
+        return None
+    latest = max(checkpoints, key=lambda x: x.get('order_number', 0))
+    return CHECKPOINT_STATUS_MAPPING.get(latest.get('primary_status', ''))
+
+
+def store_checkpoints(shipment, checkpoints, tracking_number, source, event_type=None):
+    """Create TrackingUpdate rows for checkpoints not stored yet; returns how many were created"""
+    existing = set(
+        TrackingUpdate.objects.filter(shipment=shipment).values_list('timestamp', 'status')
+    )
+    updates = []
+    for checkpoint in checkpoints:
+        status, location, checkpoint_timestamp = normalize_checkpoint(checkpoint)
+        if (checkpoint_timestamp, status) in existing:
+            continue
+        existing.add((checkpoint_timestamp, status))
+        raw_data = {
+            'checkpoint': checkpoint,
+            'message': checkpoint.get('message', ''),
+            'handler': checkpoint.get('handler', ''),
+        }
+        if event_type:
+            raw_data['event_type'] = event_type
+        updates.append(TrackingUpdate(
+            shipment=shipment,
+            carrier_tracking_number=tracking_number,
+            status=status,
+            location=location,
+            timestamp=checkpoint_timestamp,
+            source=source,
+            raw_data=raw_data,
+        ))
+    TrackingUpdate.objects.bulk_create(updates)
+    if updates:
+        # bulk_create sends no post_save; drop the cached public tracking response and push the checkpoints ourselves
+        tracking_cache.schedule_invalidation(shipment.id)
+        for update in updates:
+            tracking_events.schedule_publish(shipment.id, 'tracking_update', tracking_events.tracking_update_event(update))
+    return len(updates)
+
+
+def tracking_checkpoints(tracking_data):
+    """Checkpoints from a track/v1/status response (flat or nested under 'tracking')"""
+    if not tracking_data:
+        return []
+    return tracking_data.get('checkpoints') or (tracking_data.get('tracking') or {}).get('checkpoints') or []
+
+
+def schedule_next_refresh(shipment, now=None):
+    interval = refresh_intervals().get(shipment.status)
+    now = now or timezone.now()
+    shipment.tracking_next_refresh_at = now + timedelta(seconds=interval) if interval else None
+
+
+def due_shipments(limit):
+    """Shipments with a tracking number whose next poll is due, most overdue first"""
+    now = timezone.now()
+    return list(
+        LogisticsShipment.objects.filter(status__in=list(refresh_intervals()))
+        .exclude(tracking_number='')
+        .exclude(easyship_shipment_id='')
+        .filter(Q(tracking_next_refresh_at__isnull=True) | Q(tracking_next_refresh_at__lte=now))
+        .order_by('tracking_next_refresh_at', 'id')[:limit]
+    )
+
+
+def _fetch(tracking_number):
+    try:
+        return EasyShipService().get_tracking(tracking_number, priority=BACKGROUND)
+    finally:
+        close_old_connections()
+
+
+def apply_tracking(shipment, tracking_data, now=None):
+    """Store a tracking response on the shipment: checkpoints, status, freshness and next poll"""
+    now = now or timezone.now()
+    checkpoints = tracking_checkpoints(tracking_data)
+    created = store_checkpoints(shipment, checkpoints, shipment.tracking_number, source='poll')
+    new_status = latest_checkpoint_status(checkpoints)
+    if new_status:
+        shipment.status = new_status
+    shipment.tracking_data = tracking_data
+    shipment.tracking_refreshed_at = now
+    schedule_next_refresh(shipment, now)
+    shipment.save(update_fields=['status', 'tracking_data', 'tracking_refreshed_at', 'tracking_next_refresh_at', 'updated_at'])
+    return created
+
+
+def refresh_batch(batch_size=None):
+    """
+    Poll one batch of due shipments concurrently and store the results.
+    Returns (refreshed, failed). Overlapping runs are skipped.
+    """
+    batch_size = batch_size or settings.TRACKING_REFRESH_BATCH_SIZE
+    if not cache.add(REFRESH_LOCK_KEY, True, 300):
+        logger.info("Tracking refresh already running; skipping")
+        return 0, 0
+
+    try:
+        shipments = due_shipments(batch_size)
+        if not shipments:
+            return 0, 0
+        futures = {shipment.id: get_executor().submit(_fetch, shipment.tracking_number) for shipment in shipments}
+
+        refreshed = failed = 0
+        now = timezone.now()
+        for shipment in shipments:
+            try:
+                tracking_data = futures[shipment.id].result()
+            except Exception as e:
+                logger.error(f"Tracking refresh for shipment {shipment.id} failed: {str(e)}")
+                tracking_data = None
+
+            if tracking_data is None:
+                # EasyShip error or quota shed: try again later, not on the next tick
+                failed += 1
+                interval = refresh_intervals().get(shipment.status, FAILED_RETRY_SECONDS)
+                shipment.tracking_next_refresh_at = now + timedelta(seconds=min(interval, FAILED_RETRY_SECONDS))
+                shipment.save(update_fields=['tracking_next_refresh_at'])
+                continue
+
+            apply_tracking(shipment, tracking_data, now)
+            refreshed += 1
+
+        logger.info(f"Tracking refresh: {refreshed} refreshed, {failed} failed")
+        return refreshed, failed
+    finally:
+        cache.delete(REFRESH_LOCK_KEY)
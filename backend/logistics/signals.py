@@ -0,0 +1,143 @@
+"""
+Signal handlers for the logistics app
+"""
+import logging
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from logistics.models import (
+    Country, TransportMode, ShippingRoute,
+    ShippingCalculationSettings, Warehouse, PickupCalculationSettings,
+    LogisticsShipment, Package, PickupRequest, TrackingIdentifier, TrackingUpdate
+)
+from logistics.services import tracking_cache, tracking_events, tracking_identifiers
+from logistics.services.rate_card import schedule_rate_card_bump
+
+logger = logging.getLogger(__name__)
+
+RATE_CARD_MODELS = (
+    Country, TransportMode, ShippingRoute,
+    ShippingCalculationSettings, Warehouse, PickupCalculationSettings,
+)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_rate_card(sender, **kwargs):
+    """Rebuild pricing snapshots when any rate card model changes (admin edits, imports)"""
+    if sender in RATE_CARD_MODELS:
+        schedule_rate_card_bump()
+
+
+def _index(sync, instance):
+    """Update the tracking identifier index; a failure is logged, never breaks the save"""
+    try:
+        with transaction.atomic():
+            sync(instance)
+    except Exception as e:
+        logger.error(f"Tracking identifier sync failed for {instance.__class__.__name__} {instance.pk}: {str(e)}")
+
+
+def _touches(update_fields, fields):
+    return update_fields is None or bool(set(update_fields) & set(fields))
+
+
+@receiver(post_save, sender=LogisticsShipment)
+def index_shipment_identifiers(sender, instance, update_fields=None, **kwargs):
+    if _touches(update_fields, [field for field, _ in tracking_identifiers.SHIPMENT_FIELDS]):
+        _index(tracking_identifiers.sync_shipment_identifiers, instance)
+
+
+@receiver(post_save, sender=Package)
+def index_package_identifiers(sender, instance, update_fields=None, **kwargs):
+    if _touches(update_fields, ['reference_number', 'shipment']):
+        _index(tracking_identifiers.sync_package_identifiers, instance)
+
+
+@receiver(post_save, sender='buying.BuyingRequest')
+def index_buying_request_identifiers(sender, instance, update_fields=None, **kwargs):
+    if _touches(update_fields, ['reference_number', 'shipment']):
+        _index(tracking_identifiers.sync_buying_request_identifiers, instance)
+
+
+@receiver(m2m_changed, sender=LogisticsShipment.packages.through)
+def index_shipment_packages(sender, instance, action, reverse, pk_set, **kwargs):
+    """Package references follow the packages' newest shipment"""
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    if reverse:
+        # instance is a Package
+        if action != 'pre_clear':
+            _index(tracking_identifiers.sync_package_identifiers, instance)
+        return
+    if action == 'pre_clear':
+        # Remember which packages lose this shipment; pk_set is empty on post_clear
+        instance._cleared_package_ids = list(instance.packages.values_list('id', flat=True))
+        return
+    package_ids = pk_set if action != 'post_clear' else getattr(instance, '_cleared_package_ids', [])
+    for package in Package.objects.filter(id__in=package_ids or []):
+        _index(tracking_identifiers.sync_package_identifiers, package)
+
+
+@receiver(post_save, sender=LogisticsShipment)
+@receiver(post_delete, sender=LogisticsShipment)
+def invalidate_shipment_tracking(sender, instance, **kwargs):
+    """Cached public tracking responses go stale with any shipment write"""
+    tracking_cache.schedule_invalidation(instance.id)
+
+
+@receiver(post_save, sender=TrackingUpdate)
+@receiver(post_delete, sender=TrackingUpdate)
+@receiver(post_save, sender=PickupRequest)
+@receiver(post_delete, sender=PickupRequest)
+@receiver(post_save, sender='payments.Payment')
+def invalidate_related_tracking(sender, instance, **kwargs):
+    tracking_cache.schedule_invalidation(instance.shipment_id)
+
+
+@receiver(post_init, sender=Package)
+def remember_package_shipment(sender, instance, **kwargs):
+    instance._loaded_shipment_id = instance.shipment_id
+
+
+@receiver(post_save, sender=Package)
+@receiver(post_delete, sender=Package)
+def invalidate_package_tracking(sender, instance, **kwargs):
+    """The package's shipment, and the one it moved away from"""
+    tracking_cache.schedule_invalidation(instance.shipment_id, getattr(instance, '_loaded_shipment_id', None))
+    instance._loaded_shipment_id = instance.shipment_id
+
+
+@receiver(post_save, sender=TrackingIdentifier)
+@receiver(post_delete, sender=TrackingIdentifier)
+def forget_tracking_identifier(sender, instance, **kwargs):
+    tracking_cache.forget_identifier(instance.identifier)
+
+
+@receiver(post_init, sender=LogisticsShipment)
+def remember_shipment_status(sender, instance, **kwargs):
+    instance._loaded_status = instance.status
+
+
+@receiver(post_save, sender=LogisticsShipment)
+def push_shipment_status(sender, instance, created, **kwargs):
+    """Live tracking subscribers hear about status changes (package cascade, webhooks, admin)"""
+    if created or instance.status != getattr(instance, '_loaded_status', None):
+        tracking_events.schedule_publish(instance.id, 'shipment', tracking_events.shipment_event(instance))
+    instance._loaded_status = instance.status
+
+
+@receiver(post_save, sender=TrackingUpdate)
+def push_tracking_update(sender, instance, created, **kwargs):
+    if created:
+        tracking_events.schedule_publish(instance.shipment_id, 'tracking_update', tracking_events.tracking_update_event(instance))
+
+
+@receiver(post_save, sender=PickupRequest)
+def push_pickup_status(sender, instance, **kwargs):
+    tracking_events.schedule_publish(instance.shipment_id, 'pickup', {
+        'status': instance.status,
+        'scheduled_datetime': instance.scheduled_datetime,
+    })
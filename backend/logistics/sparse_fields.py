@@ -0,0 +1,82 @@
+"""
+Sparse fieldsets for API serializers (logistics, buying, vehicles).
+
+GET requests to views using these serializers accept:
+- ?fields=id,status,packages -> only the listed fields
+- ?expand=packages,tracking_updates -> nested/heavy fields (Meta.expandable_fields)
+  to include; with expand but no fields, every other field is returned plus
+  the listed expansions (?expand= alone drops all of them)
+Without either parameter the full representation is returned, as before.
+
+Only the top-level serializer follows the query string; nested serializers
+render in full. Views pass requested_fields() to the serializer's
+setup_eager_loading() so only the needed columns (only_requested(), using
+Meta.field_dependencies for method fields) and relations are loaded.
+"""
+from rest_framework import serializers
+
+
+def _split(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class SparseFieldsMixin:
+    """
+    Meta.expandable_fields: fields left out when the client picks fields/expand
+    Meta.field_dependencies: {method field: model fields it reads}
+    """
+
+    @classmethod
+    def requested_fields(cls, request):
+        """Field names the client asked for, or None for the full representation"""
+        if request is None or request.method != 'GET':
+            return None
+        params = request.query_params
+        if 'fields' not in params and 'expand' not in params:
+            return None
+        expand = _split(params.get('expand', ''))
+        if 'fields' in params:
+            return _split(params['fields']) | expand
+        expandable = set(getattr(cls.Meta, 'expandable_fields', ()))
+        return (set(cls().fields) - expandable) | expand
+
+    @staticmethod
+    def wants(fields, name):
+        return fields is None or name in fields
+
+    @classmethod
+    def only_requested(cls, queryset, fields):
+        """Load only the columns the selected fields read (no-op for the full representation)"""
+        if fields is None:
+            return queryset
+        model = cls.Meta.model
+        concrete = {field.name for field in model._meta.concrete_fields}
+        dependencies = getattr(cls.Meta, 'field_dependencies', {})
+        serializer_fields = cls().fields
+        columns = {model._meta.pk.name}
+        for name in fields:
+            if name in dependencies:
+                columns.update(dependencies[name])
+            elif name in serializer_fields:
+                source = serializer_fields[name].source.split('.')[0]
+                if source in concrete:
+                    columns.add(source)
+        # Relations joined by setup_eager_loading() must stay loaded
+        if isinstance(queryset.query.select_related, dict):
+            columns.update(queryset.query.select_related)
+        return queryset.only(*columns)
+
+    def _is_top_level(self):
+        parent = getattr(self, 'parent', None)
+        return parent is None or (
+            isinstance(parent, serializers.ListSerializer) and getattr(parent, 'parent', None) is None
+        )
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self._is_top_level():
+            return fields
+        selected = self.requested_fields(self.context.get('request'))
+        if selected is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in selected}
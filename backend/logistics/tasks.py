@@ -0,0 +1,54 @@
+"""
+Celery tasks for logistics
+"""
+import logging
+from celery import shared_task
+from logistics.services.rate_card import get_rate_card_version
+from logistics.services.price_grid import build_price_grid, get_price_grid_version
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def rebuild_price_grid(force=False):
+    """Rebuild the price grid when the rate card changed since it was built"""
+    version = get_rate_card_version()
+    if not force and get_price_grid_version() == version:
+        logger.debug(f"Price grid is current (rate card version {version})")
+        return 0
+    return build_price_grid()
+
+
+@shared_task(ignore_result=True)
+def purchase_label(job_id):
+    """Buy an EasyShip label for a LabelPurchaseJob (retries are scheduled by the job itself)"""
+    from logistics.services.label_purchase import run_label_purchase
+    return run_label_purchase(job_id)
+
+
+@shared_task(ignore_result=True)
+def retry_label_jobs():
+    """Re-dispatch label purchase jobs whose task was lost"""
+    from logistics.services.label_purchase import requeue_stalled_jobs
+    return requeue_stalled_jobs()
+
+
+@shared_task(ignore_result=True)
+def refresh_tracking():
+    """Poll EasyShip tracking for one batch of due shipments"""
+    from logistics.services.tracking_refresher import refresh_batch
+    return refresh_batch()
+
+
+@shared_task(ignore_result=True)
+def process_easyship_webhooks(easyship_shipment_id):
+    """Apply pending EasyShip webhook events for one shipment, in order"""
+    from logistics.services.easyship_webhooks import process_shipment_events
+    return process_shipment_events(easyship_shipment_id)
+
+
+@shared_task(ignore_result=True)
+def process_pending_easyship_webhooks():
+    """Queue shipments whose webhook events are still pending (retries, lost dispatches)"""
+    from logistics.services.easyship_webhooks import process_pending_events
+    return process_pending_events()
@@ -0,0 +1,297 @@
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from accounts.models import User
+from logistics.models import (
+    Country, LabelPurchaseJob, LogisticsShipment, Package, PriceGridEntry, ShippingCalculationSettings, ShippingRoute,
+    TrackingUpdate, TransportMode
+)
+from logistics.services import easyship_transport, price_grid, pricing_calculator
+from logistics.services.easyship_rate_limiter import EasyShipRateLimited
+from logistics.services.price_grid import build_price_grid
+from logistics.services.pricing_calculator import PricingCalculator
+from logistics.services.pricing_kernel import price_matrix
+from logistics.services.rate_card import bump_rate_card_version
+from payments.models import Payment
+
+
+class ShipmentListQueryCountTests(APITestCase):
+    """The shipment list is serialized in a fixed number of queries (LogisticsShipmentSerializer.setup_eager_loading)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='shipper@example.com', password='test-password')
+        self.client.force_authenticate(self.user)
+        self.url = reverse('shipment-list')
+
+    def create_shipments(self, count):
+        for _ in range(count):
+            shipment = LogisticsShipment.objects.create(
+                user=self.user,
+                source_type='ship_my_items',
+                actual_weight=Decimal('2.50'),
+                chargeable_weight=Decimal('3.00'),
+                shipping_cost=Decimal('40.00'),
+                total_cost=Decimal('45.00'),
+                status='payment_received',
+            )
+            for _ in range(2):
+                Package.objects.create(user=self.user, shipment=shipment, weight=Decimal('1.25'))
+            now = timezone.now()
+            for minutes in range(3):
+                TrackingUpdate.objects.create(
+                    shipment=shipment, status='in_transit', timestamp=now + timedelta(minutes=minutes), source='poll'
+                )
+            Payment.objects.create(
+                user=self.user, shipment=shipment, amount=Decimal('45.00'), payment_type='shipping', status='completed'
+            )
+
+    def list_shipments(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_query_count_does_not_grow_with_shipments(self):
+        with self.assertNoLogs('logistics', level='ERROR'):
+            self.create_shipments(1)
+        with CaptureQueriesContext(connection) as single:
+            results = self.list_shipments()
+        self.assertEqual(len(results), 1)
+
+        self.create_shipments(9)
+        with self.assertNumQueries(len(single.captured_queries)):
+            results = self.list_shipments()
+        self.assertEqual(len(results), 10)
+        for shipment in results:
+            self.assertEqual(len(shipment['packages']), 2)
+            self.assertEqual(len(shipment['tracking_updates']), 3)
+            self.assertTrue(shipment['is_paid'])
+
+
+class TrackByNumberTests(APITestCase):
+    """Public tracking finds shipments through the tracking identifier index"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='tracker@example.com', password='test-password')
+
+    def test_shipment_created_without_shipment_number_is_tracked(self):
+        # shipment_number falls back to its uuid4 default, as in the vehicle branch of stripe_events
+        shipment = LogisticsShipment.objects.create(
+            user=self.user,
+            source_type='ship_my_items',
+            actual_weight=Decimal('2.50'),
+            chargeable_weight=Decimal('3.00'),
+            shipping_cost=Decimal('40.00'),
+            total_cost=Decimal('45.00'),
+            status='payment_received',
+            tracking_number='1Z999AA10123456784',
+        )
+        shipment.refresh_from_db()
+
+        for identifier in (shipment.tracking_number, str(shipment.shipment_number)):
+            response = self.client.get(reverse('track-by-number', args=[identifier]))
+            self.assertEqual(response.status_code, 200, identifier)
+            self.assertEqual(response.json()['shipment']['id'], shipment.id)
+
+
+class CircuitBreakerTrialTests(SimpleTestCase):
+    """A half-open trial call shed by the quota limiter must not wedge the breaker"""
+
+    def test_rate_limited_trial_releases_the_slot(self):
+        breaker = easyship_transport.CircuitBreaker(failure_threshold=1, reset_seconds=0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.OPEN)
+
+        session = mock.Mock()
+        session.request.return_value = mock.Mock(status_code=200)
+        with mock.patch.object(easyship_transport, 'circuit_breaker', breaker), \
+                mock.patch.object(easyship_transport, 'get_session', return_value=session), \
+                mock.patch.object(easyship_transport, 'acquire', side_effect=EasyShipRateLimited('no quota')):
+            with self.assertRaises(EasyShipRateLimited):
+                easyship_transport.easyship_request('GET', 'rates', 'https://easyship.test/rates')
+        session.request.assert_not_called()
+        self.assertEqual(breaker.state, breaker.HALF_OPEN)
+
+        with mock.patch.object(easyship_transport, 'circuit_breaker', breaker), \
+                mock.patch.object(easyship_transport, 'get_session', return_value=session), \
+                mock.patch.object(easyship_transport, 'acquire'):
+            response = easyship_transport.easyship_request('GET', 'rates', 'https://easyship.test/rates')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(breaker.state, breaker.CLOSED)
+
+
+def create_rate_card():
+    """US -> GB routes for every transport mode with deliberately awkward rates"""
+    origin = Country.objects.create(code='US', name='United States', continent='North America')
+    destination = Country.objects.create(code='GB', name='United Kingdom', continent='Europe')
+    for mode_type in ('air', 'sea', 'rail', 'truck'):
+        mode = TransportMode.objects.create(code=mode_type, type=mode_type, name=mode_type.title())
+        ShippingRoute.objects.create(origin_country=origin, destination_country=destination, transport_mode=mode)
+        ShippingCalculationSettings.objects.create(
+            transport_mode=mode, is_global_default=True, shipping_categories=['all'],
+            base_rate=Decimal('12.35'), per_kg_rate=Decimal('7.3333'), fuel_surcharge_percent=Decimal('12.35'),
+            security_fee=Decimal('19.99'), dimensional_weight_divisor=Decimal('6000'),
+            rate_per_cbm=Decimal('61.37'), rate_per_ton=Decimal('143.11'),
+            per_kg_rate_rail=Decimal('2.4567'), base_rate_truck=Decimal('47.13'), handling_fee=Decimal('33.33'),
+        )
+    # Rate card models bump the version on commit, which TestCase never reaches
+    bump_rate_card_version()
+
+
+@override_settings(SHIPPING_MARKUP_PERCENTAGE=17.5, PRICE_GRID_ENABLED=False)
+class PricingKernelTests(TestCase):
+    """The NumPy kernel returns the same quotes as calculate_route_freight, to the cent"""
+
+    SHIPMENTS = [
+        {'weight': 0.1, 'dimensions': {}},
+        {'weight': '0.5', 'dimensions': {'length': 35, 'width': 25, 'height': 3}},
+        {'weight': 2.345, 'dimensions': {'length': '30.5', 'width': 20, 'height': 15}},
+        {'weight': 17.0005, 'dimensions': {'length': 60, 'width': 40, 'height': 40}},
+        {'weight': 99.99, 'dimensions': {'length': 120, 'width': 80, 'height': 75}},
+        {'weight': 1234.567, 'dimensions': {'length': 400, 'width': 350, 'height': 200}},  # exactly 28 CBM
+        {'weight': 4535.92, 'dimensions': {'length': 500, 'width': 300, 'height': 250}},  # ~10,000 lbs
+        {'weight': 8000, 'dimensions': {'length': 1200, 'width': 240, 'height': 260}},
+        {'weight': 30000, 'dimensions': {'length': 1300, 'width': 240, 'height': 260}},  # past 40ft: LCL
+    ]
+
+    def setUp(self):
+        create_rate_card()
+        self.calculator = PricingCalculator()
+        self.routes = list(self.calculator.pin_rate_card().routes_for('US', 'GB'))
+
+    def assert_matches_live(self, matrix, shipping_category):
+        for route_index, route in enumerate(matrix.routes):
+            for shipment_index, shipment in enumerate(self.SHIPMENTS):
+                live = self.calculator.calculate_route_freight(
+                    route, shipment['weight'], shipment['dimensions'], 0, shipping_category, use_price_grid=False
+                )
+                self.assertEqual(matrix.quote(route_index, shipment_index), live, (route, shipment))
+                self.assertEqual(matrix.total_cents[route_index, shipment_index], live['total_cents'])
+
+    def test_every_mode_matches_calculate_route_freight(self):
+        matrix = price_matrix(self.calculator, self.routes, self.SHIPMENTS, 'ltl_freight')
+        self.assertEqual(len(matrix.routes), 4)
+        self.assert_matches_live(matrix, 'ltl_freight')
+        # Only the cells on a threshold or half cent go through the Decimal path
+        self.assertLess(matrix.reconciled, len(self.routes) * len(self.SHIPMENTS) // 2)
+
+    def test_primed_lane_is_served_from_the_matrix(self):
+        shipments = self.SHIPMENTS[:4]
+        matrix = self.calculator.prime_lane_freight('US', 'GB', shipments, 'heavy_parcel')
+        self.assertEqual({route.transport_mode.type for route in matrix.routes}, {'air', 'sea'})
+        with mock.patch.object(self.calculator, 'calculate_air_freight') as air, \
+                mock.patch.object(self.calculator, 'calculate_sea_freight') as sea:
+            quotes = [
+                self.calculator.calculate_route_freight(route, s['weight'], s['dimensions'], 0, 'heavy_parcel')
+                for route in matrix.routes for s in shipments
+            ]
+        air.assert_not_called()
+        sea.assert_not_called()
+        self.assertEqual(quotes, [
+            matrix.quote(route_index, shipment_index)
+            for route_index in range(len(matrix.routes)) for shipment_index in range(len(shipments))
+        ])
+
+    def test_price_grid_entries_match_live_pricing(self):
+        written = build_price_grid()
+        self.assertEqual(written, PriceGridEntry.objects.count())
+        self.assertGreater(written, 0)
+        buckets = {'envelope': {'length': 35, 'width': 25, 'height': 3}}
+        for entry in PriceGridEntry.objects.filter(dimension_bucket='envelope').select_related('route__transport_mode'):
+            live = self.calculator.calculate_route_freight(
+                entry.route, Decimal(entry.weight_grams) / 1000, buckets['envelope'], 0, entry.shipping_category,
+                use_price_grid=False
+            )
+            self.assertEqual(entry.quote, json.loads(json.dumps(live)))
+            self.assertEqual(entry.total_cents, live['total_cents'])
+
+
+class RateCardSettingsTests(TestCase):
+    """Calculation settings come from the precomputed lane/mode/category index"""
+
+    def setUp(self):
+        create_rate_card()
+        self.calculator = PricingCalculator()
+        self.rate_card = self.calculator.pin_rate_card()
+
+    def test_route_settings_are_read_from_the_index(self):
+        route = next(route for route in self.rate_card.routes_for('US', 'GB') if route.transport_mode.type == 'air')
+        expected = self.rate_card.calculation_settings(route, route.transport_mode, 'small_parcel')
+        with mock.patch.object(self.rate_card, 'calculation_settings') as calculation_settings:
+            settings_obj = self.calculator.get_calculation_settings(route, route.transport_mode, 'small_parcel')
+        calculation_settings.assert_not_called()
+        self.assertIs(settings_obj, expected)
+
+    def test_settings_without_a_route_fall_back_to_the_global_default(self):
+        mode = self.rate_card.first_mode_of_type('sea')
+        settings_obj = self.calculator.get_calculation_settings(None, mode, 'heavy_parcel')
+        self.assertTrue(settings_obj.is_global_default)
+        self.assertEqual(settings_obj.transport_mode_id, mode.id)
+
+
+class QuoteSnapshotTests(TestCase):
+    """get_all_quotes reads the shared rate card and grid versions once per quote"""
+
+    def setUp(self):
+        create_rate_card()
+
+    def test_one_snapshot_per_quote(self):
+        calculator = PricingCalculator()
+        with mock.patch.object(pricing_calculator, 'get_rate_card', wraps=pricing_calculator.get_rate_card) as rate_card, \
+                mock.patch.object(price_grid, 'get_price_grid_version', wraps=price_grid.get_price_grid_version) as grid_version:
+            quotes = calculator.get_all_quotes(
+                'US', 'GB', 12.5, {'length': 50, 'width': 40, 'height': 30}, shipping_category='ltl_freight',
+                warehouse_address={'country': 'US'}, skip_origin_to_warehouse=True
+            )
+        self.assertEqual(len(quotes), 4)
+        self.assertEqual(rate_card.call_count, 1)
+        self.assertEqual(grid_version.call_count, 1)
+        # Unpinned again afterwards, so the next quote sees admin edits
+        self.assertIsNone(calculator._rate_card)
+
+
+class WarehouseLabelIdempotencyTests(APITestCase):
+    """Without an Idempotency-Key header, label jobs are keyed by what is bought"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='sender@example.com', password='test-password')
+        self.client.force_authenticate(self.user)
+        # warehouse.urls reuses the 'create-warehouse-label' name for its own view
+        self.url = '/api/v1/logistics/warehouse/labels/create/'
+
+    def post_label(self, weight, headers=None):
+        return self.client.post(self.url, {
+            'pickup_address': {'full_name': 'Sam Sender', 'street_address': '1 Main St', 'city': 'Austin',
+                               'state_province': 'TX', 'postal_code': '73301', 'country': 'US'},
+            'package_details': {'weight': weight, 'length': 30, 'width': 20, 'height': 15},
+            'carrier': 'UPS',
+            'rate_id': 'courier-service-1',
+        }, format='json', headers=headers or {})
+
+    def job_ids(self, *responses):
+        for response in responses:
+            self.assertEqual(response.status_code, 202, response.content)
+        return [response.data['job']['job_id'] for response in responses]
+
+    def test_different_packages_with_the_same_rate_get_their_own_jobs(self):
+        first, second = self.job_ids(self.post_label(2), self.post_label(7))
+        self.assertNotEqual(first, second)
+        self.assertEqual(LabelPurchaseJob.objects.count(), 2)
+
+    def test_resubmitting_the_same_package_reuses_the_job(self):
+        first, second = self.job_ids(self.post_label(2), self.post_label(2))
+        self.assertEqual(first, second)
+
+    def test_client_key_wins(self):
+        first, second = self.job_ids(
+            self.post_label(2, {'Idempotency-Key': 'form-1'}), self.post_label(7, {'Idempotency-Key': 'form-1'})
+        )
+        self.assertEqual(first, second)
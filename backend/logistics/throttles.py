@@ -0,0 +1,21 @@
+"""
+Throttles for public logistics endpoints that are expensive per request.
+"""
+from rest_framework.throttling import AnonRateThrottle, SimpleRateThrottle, UserRateThrottle
+
+
+class BatchQuoteAnonThrottle(AnonRateThrottle):
+    """Batch quotes fan out to EasyShip per row, so anonymous callers get a tight budget"""
+    scope = 'batch_quote_anon'
+
+
+class BatchQuoteUserThrottle(UserRateThrottle):
+    scope = 'batch_quote_user'
+
+
+class TrackingStreamThrottle(SimpleRateThrottle):
+    """Live tracking stream connections per client IP (plain async view: no request.user lookup)"""
+    scope = 'tracking_stream'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
@@ -9,14 +9,18 @@ router.register(r'shipments', views.ShipmentViewSet, basename='shipment')
 urlpatterns = [
     path('', include(router.urls)),
     path('calculate-shipping/', views.calculate_shipping, name='calculate-shipping'),
+    path('calculate-shipping/batch/', views.calculate_shipping_batch, name='calculate-shipping-batch'),
+    path('calculate-shipping/stream/', views.calculate_shipping_stream, name='calculate-shipping-stream'),
     path('proceed-with-quote/', views.proceed_with_quote, name='proceed-with-quote'),
     path('create-payment-session/', views.create_payment_session, name='create-payment-session'),
     path('shipments/<int:shipment_id>/generate-label/', views.generate_shipment_label, name='generate-shipment-label'),
     path('warehouse/address/', views.get_warehouse_address, name='get-warehouse-address'),
     path('warehouse/rates/', views.get_warehouse_rates, name='get-warehouse-rates'),
     path('warehouse/labels/create/', views.create_warehouse_label, name='create-warehouse-label'),
+    path('label-jobs/<str:job_id>/', views.label_job_status, name='label-job-status'),
     path('shipments/<int:shipment_id>/track/', views.track_shipment, name='track-shipment'),
     path('track/<str:tracking_number>/', views.track_by_number, name='track-by-number'),
+    path('track/<str:tracking_number>/events/', views.track_events, name='track-events'),
     path('countries/', views.countries_list, name='countries-list'),
     path('transport-modes/', views.transport_modes_list, name='transport-modes-list'),
     path('available-transport-modes/', views.available_transport_modes, name='available-transport-modes'),
@@ -1,30 +1,43 @@
 from rest_framework import viewsets, status, generics
-from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.decorators import api_view, permission_classes, throttle_classes, action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.utils import timezone
 from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.core.serializers.json import DjangoJSONEncoder
+from asgiref.sync import sync_to_async
 from datetime import timedelta
 from decimal import Decimal
 import json
 import logging
 from .models import (
     Package, LogisticsShipment, Country, TransportMode,
-    QuoteRequest, TrackingUpdate, ShippingRoute, PickupRequest
+    QuoteRequest, TrackingUpdate, ShippingRoute, PickupRequest, LabelPurchaseJob
 )
 from .serializers import (
     PackageSerializer, 
     LogisticsShipmentSerializer, 
     CountrySerializer,
-    TransportModeSerializer
+    TransportModeSerializer,
+    LabelPurchaseJobSerializer
 )
+from .throttles import BatchQuoteAnonThrottle, BatchQuoteUserThrottle, TrackingStreamThrottle
 from .services.pricing_calculator import PricingCalculator
+from .services.pricing_context import PricingContext
 from .services.easyship_service import EasyShipService
+from .services.label_purchase import enqueue_label_purchase, request_idempotency_key, shipment_idempotency_key
+from .services.easyship_webhooks import event_shipment_id, receive_event
 from django.utils import timezone
 from datetime import timedelta
 import uuid
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 
 def is_shipment_paid(shipment):
     """Check if a shipment has a completed payment"""
@@ -41,7 +54,8 @@ class PackageViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Package.objects.filter(user=self.request.user).select_related('shipment', 'user').order_by('-created_at')
+        fields = PackageSerializer.requested_fields(self.request)
+        return PackageSerializer.setup_eager_loading(Package.objects.filter(user=self.request.user).order_by('-created_at'), fields)
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -49,8 +63,8 @@ class PackageViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def my_packages(self, request):
         """Get all packages for the current user with details"""
-        packages = Package.objects.filter(user=request.user).select_related('shipment', 'user').order_by('-created_at')
-        serializer = PackageSerializer(packages, many=True)
+        packages = self.get_queryset()
+        serializer = self.get_serializer(packages, many=True)
         return Response({
             'packages': serializer.data,
             'count': packages.count()
@@ -63,7 +77,8 @@ class ShipmentViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return LogisticsShipment.objects.filter(user=self.request.user).prefetch_related('primary_packages')
+        fields = LogisticsShipmentSerializer.requested_fields(self.request)
+        return LogisticsShipmentSerializer.setup_eager_loading(LogisticsShipment.objects.filter(user=self.request.user), fields)
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -72,77 +87,60 @@ class ShipmentViewSet(viewsets.ModelViewSet):
     def packages(self, request, pk=None):
         """Get packages for a shipment"""
         shipment = self.get_object()
-        packages = Package.objects.filter(shipment=shipment)
-        serializer = PackageSerializer(packages, many=True)
+        fields = PackageSerializer.requested_fields(request)
+        packages = PackageSerializer.setup_eager_loading(Package.objects.filter(shipment=shipment), fields)
+        serializer = PackageSerializer(packages, many=True, context=self.get_serializer_context())
         return Response(serializer.data)
 
 
-@api_view(['POST'])
-@permission_classes([AllowAny])
-def calculate_shipping(request):
-    """Calculate shipping quotes for all available modes (public access for quotes)"""
-    origin_country = request.data.get('origin_country')
-    destination_country = request.data.get('destination_country')
-    weight = float(request.data.get('weight', 0))
-    dimensions = request.data.get('dimensions', {})
-    declared_value = float(request.data.get('declared_value', 0))
-    items = request.data.get('items')
-    shipping_category = request.data.get('shipping_category')
-    origin_address = request.data.get('origin_address')  # Optional for pickup calculation
-    destination_address = request.data.get('destination_address')  # Required for local shipping
+def _parse_quote_input(data):
+    """Validate calculate_shipping input. Returns (params, error message)"""
+    params = {
+        'origin_country': data.get('origin_country'),
+        'destination_country': data.get('destination_country'),
+        'weight': float(data.get('weight', 0)),
+        'dimensions': data.get('dimensions', {}),
+        'declared_value': float(data.get('declared_value', 0)),
+        'items': data.get('items'),
+        'shipping_category': data.get('shipping_category'),
+        'origin_address': data.get('origin_address'),  # Optional for pickup calculation
+        'destination_address': data.get('destination_address'),  # Required for local shipping
+    }
     
-    if not all([origin_country, destination_country, weight]):
-        return Response(
-            {'error': 'Missing required fields: origin_country, destination_country, weight'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+    if not all([params['origin_country'], params['destination_country'], params['weight']]):
+        return None, 'Missing required fields: origin_country, destination_country, weight'
     
     # For local shipping, addresses are required for EasyShip API
-    is_local = origin_country == destination_country
+    origin_address = params['origin_address']
+    destination_address = params['destination_address']
+    is_local = params['origin_country'] == params['destination_country']
     if is_local:
         if not origin_address or not destination_address:
-            return Response(
-                {'error': 'Origin and destination addresses are required for local shipping'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            return None, 'Origin and destination addresses are required for local shipping'
         # Validate required address fields for EasyShip
         required_fields = ['city', 'state_province', 'postal_code', 'country']
         for field in required_fields:
             if not origin_address.get(field):
-                return Response(
-                    {'error': f'Origin address missing required field: {field}'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+                return None, f'Origin address missing required field: {field}'
             if not destination_address.get(field):
-                return Response(
-                    {'error': f'Destination address missing required field: {field}'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+                return None, f'Destination address missing required field: {field}'
     
     # Determine category based on weight if not provided or auto
-    if not shipping_category or shipping_category == 'auto':
-        if weight < 30:
-            shipping_category = 'small_parcel'
-        elif weight < 100:
-            shipping_category = 'heavy_parcel'
-        elif weight < 4000:
-            shipping_category = 'ltl_freight'
-        else:
-            shipping_category = 'ftl_freight'
-    
-    calculator = PricingCalculator()
+    if not params['shipping_category'] or params['shipping_category'] == 'auto':
+        params['shipping_category'] = _auto_shipping_category(params['weight'])
     
-    # Get warehouse address from database based on origin country and category
-    warehouse_address = None
-    print(f"Origin country: {origin_country}")
-    if origin_country:
-        # origin_country_code = origin_country.get('country', 'US')
-        warehouse_address = calculator.get_warehouse_address(origin_country, shipping_category)
-    print(f"Warehouse address: {warehouse_address}")
-    quotes = calculator.get_all_quotes(
-        origin_country, destination_country, weight, dimensions, 
-        declared_value, items, shipping_category, origin_address, warehouse_address, destination_address
-    )
+    return params, None
+
+
+def _store_quote_request(request, calculator, params, quotes, warehouse_address):
+    """
+    Create or update the session's QuoteRequest for calculated quotes.
+    Returns (quote_request, metadata); quote_request is None for an invalid country code.
+    """
+    origin_country = params['origin_country']
+    destination_country = params['destination_country']
+    weight = params['weight']
+    shipping_category = params['shipping_category']
     
     # Store quote request with session ID
     session_id = request.session.session_key or str(uuid.uuid4())
@@ -169,6 +167,12 @@ def calculate_shipping(request):
         is_yuusell_handled = True
         pickup_required = True  # Force pickup for YuuSell-handled shipments
     
+    metadata = {
+        'pickup_required': pickup_required,
+        'is_local_shipping': is_local,
+        'is_yuusell_handled': is_yuusell_handled,
+    }
+    
     # Extract country codes as strings for database lookup
     origin_country_code = origin_country if isinstance(origin_country, str) else (origin_country.get('country', 'US') if isinstance(origin_country, dict) else 'US')
     destination_country_code = destination_country if isinstance(destination_country, str) else (destination_country.get('country', 'US') if isinstance(destination_country, dict) else 'US')
@@ -189,10 +193,7 @@ def calculate_shipping(request):
         origin_country_obj = Country.objects.get(code=origin_country_code)
         destination_country_obj = Country.objects.get(code=destination_country_code)
     except Country.DoesNotExist:
-        return Response(
-            {'error': 'Invalid country code'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+        return None, metadata
     
     quote_request, created = QuoteRequest.objects.update_or_create(
         session_id=session_id,
@@ -200,24 +201,66 @@ def calculate_shipping(request):
             'origin_country': origin_country_obj,
             'destination_country': destination_country_obj,
             'weight': weight,
-            'dimensions': dimensions,
-            'declared_value': declared_value,
+            'dimensions': params['dimensions'],
+            'declared_value': params['declared_value'],
             'shipping_category': shipping_category,
             'pickup_required': pickup_required,
             'quote_data': quote_data,  # Store quotes, warehouse_address, and other metadata
             'expires_at': expires_at,
         }
     )
+    return quote_request, metadata
+
+
+def _calculate_quotes(calculator, pricing_context, params):
+    """Warehouse address + get_all_quotes for parsed calculate_shipping params"""
+    origin_country = params['origin_country']
+    shipping_category = params['shipping_category']
+    
+    # Get warehouse address from database based on origin country and category
+    warehouse_address = None
+    print(f"Origin country: {origin_country}")
+    if origin_country:
+        warehouse_address = pricing_context.warehouse_address(origin_country, shipping_category)
+    print(f"Warehouse address: {warehouse_address}")
+    quotes = calculator.get_all_quotes(
+        origin_country, params['destination_country'], params['weight'], params['dimensions'], 
+        params['declared_value'], params['items'], shipping_category, params['origin_address'],
+        warehouse_address, params['destination_address'],
+        pricing_context=pricing_context
+    )
+    return quotes, warehouse_address
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def calculate_shipping(request):
+    """Calculate shipping quotes for all available modes (public access for quotes)"""
+    params, error = _parse_quote_input(request.data)
+    if error:
+        return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+    shipping_category = params['shipping_category']
+    
+    calculator = PricingCalculator()
+    pricing_context = PricingContext(calculator)
+    quotes, warehouse_address = _calculate_quotes(calculator, pricing_context, params)
+    
+    quote_request, metadata = _store_quote_request(request, calculator, params, quotes, warehouse_address)
+    if quote_request is None:
+        return Response(
+            {'error': 'Invalid country code'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
     # Include category-specific metadata in response
     # For local shipping, validate that we have EasyShip rates
-    if is_local and not quotes:
+    if metadata['is_local_shipping'] and not quotes:
         return Response(
             {
                 'error': 'No shipping rates available for this route. Please ensure addresses are complete and try again.',
                 'quotes': [],
                 'shipping_category': shipping_category,
-                'quote_request_id': quote_request.id if 'quote_request' in locals() else None,
+                'quote_request_id': quote_request.id,
                 'pickup_required': False,
                 'is_local_shipping': True,
                 'is_yuusell_handled': False,
@@ -229,15 +272,257 @@ def calculate_shipping(request):
         'quotes': quotes,
         'shipping_category': shipping_category,
         'quote_request_id': quote_request.id,
-        'pickup_required': pickup_required,
-        'is_local_shipping': is_local,
-        'is_yuusell_handled': is_yuusell_handled,  # Indicates if YuuSell handles vs EasyShip only
+        'pickup_required': metadata['pickup_required'],
+        'is_local_shipping': metadata['is_local_shipping'],
+        'is_yuusell_handled': metadata['is_yuusell_handled'],  # Indicates if YuuSell handles vs EasyShip only
         'sorted_by': 'price',
+        'pricing_stats': pricing_context.stats(),  # Shared legs computed once, repeats saved
     }
     
     return Response(response_data)
 
 
+def _sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+@csrf_exempt
+async def calculate_shipping_stream(request):
+    """
+    Streaming variant of calculate_shipping (Server-Sent Events, public access).
+    
+    Same JSON body as calculate_shipping. Events:
+    - quotes {phase: 'routes'}: DB-priced route quotes, sent immediately; quotes that
+      need an EasyShip leg carry missing_legs
+    - quotes {phase: 'final'}: complete set once carrier-backed/two-leg quotes resolve
+      (or the EASYSHIP_QUOTE_DEADLINE_SECONDS budget runs out); replaces 'routes'
+    - done: quote_request_id and metadata, as in the calculate_shipping response
+    - error: {error}
+    
+    Async view: under ASGI (config.asgi) a stream does not hold a worker while
+    waiting on EasyShip; DB and pricing work runs in sync_to_async threads.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    try:
+        data = json.loads(request.body or b'{}')
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    params, error = _parse_quote_input(data)
+    if error:
+        return JsonResponse({'error': error}, status=400)
+    
+    # Create the session before the response starts so its cookie goes out with the headers
+    def ensure_session():
+        if not request.session.session_key:
+            request.session.create()
+    await sync_to_async(ensure_session)()
+    
+    async def events():
+        calculator = PricingCalculator()
+        # First pass with no EasyShip budget: routes only, EasyShip legs keep running
+        pricing_context = PricingContext(calculator)
+        pricing_context.start_prefetch()
+        try:
+            quotes, warehouse_address = await sync_to_async(_calculate_quotes)(calculator, pricing_context, params)
+            if quotes:
+                yield _sse_event('quotes', {'phase': 'routes', 'quotes': quotes})
+            
+            pricing_context.extend_deadline(settings.EASYSHIP_QUOTE_DEADLINE_SECONDS)
+            quotes, warehouse_address = await sync_to_async(_calculate_quotes)(calculator, pricing_context, params)
+            yield _sse_event('quotes', {'phase': 'final', 'quotes': quotes})
+            
+            quote_request, metadata = await sync_to_async(_store_quote_request)(
+                request, calculator, params, quotes, warehouse_address
+            )
+        except Exception as e:
+            logger.error(f"Streaming quote failed: {str(e)}")
+            yield _sse_event('error', {'error': 'Failed to calculate quotes'})
+            return
+        if quote_request is None:
+            yield _sse_event('error', {'error': 'Invalid country code'})
+            return
+        
+        yield _sse_event('done', {
+            'quote_request_id': quote_request.id,
+            'shipping_category': params['shipping_category'],
+            'sorted_by': 'price',
+            'pricing_stats': pricing_context.stats(),
+            **metadata,
+        })
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+    return response
+
+
+def _auto_shipping_category(weight):
+    """Determine category based on weight (same thresholds as calculate_shipping)"""
+    if weight < 30:
+        return 'small_parcel'
+    elif weight < 100:
+        return 'heavy_parcel'
+    elif weight < 4000:
+        return 'ltl_freight'
+    return 'ftl_freight'
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+@throttle_classes([BatchQuoteAnonThrottle, BatchQuoteUserThrottle])
+def calculate_shipping_batch(request):
+    """
+    Price many shipments in one request (catalog items, bulk B2B orders).
+    
+    Body: {"rows": [{"origin_country", "destination_country", "weight", "dimensions",
+                     "shipping_category", "declared_value", "origin_address", "destination_address"}, ...]}
+    
+    Unlike calculate_shipping no QuoteRequest/session is created. All rows are priced
+    against one rate card snapshot, and rows are grouped by lane so the warehouse
+    address and shared legs are resolved once per lane; route freight for all of a
+    lane's rows is priced as one pricing_kernel matrix. Every row's EasyShip legs are
+    started before any is awaited, so the batch shares one quote deadline instead of
+    later rows inheriting what earlier rows used up; rows whose legs still miss it
+    carry missing_legs. Results come back in input order.
+    
+    Every row can fan out to EasyShip, so anonymous callers are throttled harder and
+    limited to BATCH_QUOTE_ANON_MAX_ROWS rows.
+    """
+    rows = request.data.get('rows')
+    if not isinstance(rows, list) or not rows:
+        return Response(
+            {'error': 'rows must be a non-empty list'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if request.user.is_authenticated:
+        max_rows = settings.BATCH_QUOTE_MAX_ROWS
+    else:
+        max_rows = settings.BATCH_QUOTE_ANON_MAX_ROWS
+    if len(rows) > max_rows:
+        return Response(
+            {'error': f'Too many rows: {len(rows)} (max {max_rows})'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    calculator = PricingCalculator()
+    rate_card = calculator.pin_rate_card()
+    results = [None] * len(rows)
+    
+    # Validate rows and group them by lane
+    lanes = {}
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            results[index] = {'index': index, 'error': 'Row must be an object'}
+            continue
+        origin_country = row.get('origin_country')
+        destination_country = row.get('destination_country')
+        try:
+            weight = float(row.get('weight', 0))
+            declared_value = float(row.get('declared_value', 0))
+        except (TypeError, ValueError):
+            results[index] = {'index': index, 'error': 'weight and declared_value must be numbers'}
+            continue
+        if not all([origin_country, destination_country, weight]):
+            results[index] = {'index': index, 'error': 'Missing required fields: origin_country, destination_country, weight'}
+            continue
+        if origin_country not in rate_card.countries or destination_country not in rate_card.countries:
+            results[index] = {'index': index, 'error': 'Invalid country code'}
+            continue
+        
+        shipping_category = row.get('shipping_category')
+        if not shipping_category or shipping_category == 'auto':
+            shipping_category = _auto_shipping_category(weight)
+        
+        lane = (origin_country, destination_country, shipping_category)
+        lanes.setdefault(lane, []).append((index, row, weight, declared_value))
+    
+    # One context per lane: the warehouse address and shared legs are resolved once per lane
+    lane_jobs = []
+    for (origin_country, destination_country, shipping_category), lane_rows in lanes.items():
+        pricing_context = PricingContext(calculator)
+        lane_job = {
+            'origin_country': origin_country,
+            'destination_country': destination_country,
+            'shipping_category': shipping_category,
+            'pricing_context': pricing_context,
+            'warehouse_address': pricing_context.warehouse_address(origin_country, shipping_category),
+            'is_local': calculator.is_local_shipping(origin_country, destination_country),
+            'rows': [],
+        }
+        for index, row, weight, declared_value in lane_rows:
+            if lane_job['is_local'] and (not row.get('origin_address') or not row.get('destination_address')):
+                results[index] = {'index': index, 'error': 'Origin and destination addresses are required for local shipping'}
+                continue
+            lane_job['rows'].append((index, row, weight, declared_value))
+        lane_jobs.append(lane_job)
+    
+    # Route freight for every row of a lane is priced as one pricing_kernel matrix
+    for lane_job in lane_jobs:
+        if lane_job['is_local'] or not lane_job['rows']:
+            continue
+        shipments = [{'weight': weight, 'dimensions': row.get('dimensions') or {}}
+                     for _, row, weight, _ in lane_job['rows']]
+        try:
+            calculator.prime_lane_freight(
+                lane_job['origin_country'], lane_job['destination_country'], shipments,
+                lane_job['shipping_category'], lane_job['warehouse_address']
+            )
+        except Exception as e:
+            # Rows are still priced one by one by calculate_route_freight
+            logger.error(f"Batch quote lane {lane_job['origin_country']}->{lane_job['destination_country']} "
+                         f"matrix pricing failed: {str(e)}")
+    
+    def quote_row(lane_job, row, weight, declared_value):
+        return calculator.get_all_quotes(
+            lane_job['origin_country'], lane_job['destination_country'], weight, row.get('dimensions') or {},
+            declared_value, row.get('items'), lane_job['shipping_category'], row.get('origin_address'),
+            lane_job['warehouse_address'], row.get('destination_address'),
+            pricing_context=lane_job['pricing_context']
+        )
+    
+    # Pass 1: start every row's EasyShip legs without waiting, so all rows run concurrently
+    for lane_job in lane_jobs:
+        lane_job['pricing_context'].start_prefetch()
+        for index, row, weight, declared_value in lane_job['rows']:
+            try:
+                quote_row(lane_job, row, weight, declared_value)
+            except Exception as e:
+                logger.error(f"Batch quote row {index} prefetch failed: {str(e)}")
+    
+    # Pass 2: collect the legs; the whole batch shares one EASYSHIP_QUOTE_DEADLINE_SECONDS budget
+    for lane_job in lane_jobs:
+        lane_job['pricing_context'].extend_deadline(settings.EASYSHIP_QUOTE_DEADLINE_SECONDS)
+    external_calls_saved = 0
+    for lane_job in lane_jobs:
+        pricing_context = lane_job['pricing_context']
+        for index, row, weight, declared_value in lane_job['rows']:
+            pricing_context.missing_legs = []
+            try:
+                quotes = quote_row(lane_job, row, weight, declared_value)
+            except Exception as e:
+                logger.error(f"Batch quote row {index} failed: {str(e)}")
+                results[index] = {'index': index, 'error': 'Failed to calculate quotes'}
+                continue
+            results[index] = {
+                'index': index,
+                'quotes': quotes,
+                'shipping_category': lane_job['shipping_category'],
+                'is_local_shipping': lane_job['is_local'],
+            }
+            if pricing_context.missing_legs:
+                results[index]['missing_legs'] = list(pricing_context.missing_legs)
+        external_calls_saved += pricing_context.saved_external_calls
+    
+    return Response({
+        'results': results,
+        'rate_card_version': rate_card.version,
+        'lanes': len(lanes),
+        'external_calls_saved': external_calls_saved,
+    })
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def proceed_with_quote(request):
@@ -532,6 +817,35 @@ def create_payment_session(request):
         )
 
 
+def label_job_response(request, job, message):
+    """202 with the label purchase job and where to poll it"""
+    status_url = request.build_absolute_uri(reverse('label-job-status', args=[job.job_id]))
+    return Response(
+        {
+            'job': LabelPurchaseJobSerializer(job).data,
+            'status_url': status_url,
+            'message': message,
+        },
+        status=status.HTTP_202_ACCEPTED,
+        headers={'Location': status_url}
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def label_job_status(request, job_id):
+    """Poll a background label purchase (see generate_shipment_label / create_warehouse_label)"""
+    try:
+        job = LabelPurchaseJob.objects.get(job_id=job_id, user=request.user)
+    except LabelPurchaseJob.DoesNotExist:
+        return Response({'error': 'Label job not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    data = LabelPurchaseJobSerializer(job).data
+    if job.status == 'succeeded' and job.shipment_id:
+        data['shipment_data'] = LogisticsShipmentSerializer(job.shipment).data
+    return Response(data)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def generate_shipment_label(request, shipment_id):
@@ -566,8 +880,6 @@ def generate_shipment_label(request, shipment_id):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        easyship = EasyShipService()
-        
         # Prepare parcels data - use dimensions from origin_address or default
         dimensions = shipment.origin_address.get('dimensions', {})
         if not dimensions:
@@ -832,43 +1144,22 @@ def generate_shipment_label(request, shipment_id):
             package_reference_number = package.reference_number
             logger.info(f"Using package reference number {package_reference_number} as contact_name for EasyShip")
         
-        # Create shipment in EasyShip
-        easyship_result = easyship.create_shipment(
-            rate_id=rate_id,
-            origin_address=shipment.origin_address,
-            destination_address=easyship_destination_address,
-            parcels=parcels,
-            courier_name=courier_name,
-            package_reference_number=package_reference_number
+        # Buy the label in the background; the client polls the job
+        job, created = enqueue_label_purchase(
+            shipment_idempotency_key(shipment),
+            {
+                'rate_id': rate_id,
+                'origin_address': shipment.origin_address,
+                'destination_address': easyship_destination_address,
+                'parcels': parcels,
+                'courier_name': courier_name,
+                'package_reference_number': package_reference_number,
+            },
+            user=request.user,
+            shipment=shipment,
         )
         
-        if not easyship_result:
-            return Response(
-                {'error': 'Failed to create shipment in EasyShip'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
-        
-        # Update shipment with EasyShip data
-        shipment.easyship_shipment_id = easyship_result.get('shipment_id', '')
-        shipment.tracking_number = easyship_result.get('tracking_number', '')
-        
-        # If label was created synchronously, set it; otherwise wait for webhook
-        if easyship_result.get('label_url'):
-            shipment.easyship_label_url = easyship_result.get('label_url', '')
-            shipment.status = 'processing'
-        else:
-            # Label generation is asynchronous, wait for webhook
-            shipment.status = 'label_generating'
-        
-        shipment.save()
-        
-        serializer = LogisticsShipmentSerializer(shipment)
-        return Response({
-            'shipment': serializer.data,
-            'label_url': easyship_result.get('label_url'),
-            'tracking_number': easyship_result.get('tracking_number'),
-            'message': 'Label generated successfully'
-        })
+        return label_job_response(request, job, 'Label purchase queued' if created else 'Label purchase already in progress')
         
     except LogisticsShipment.DoesNotExist:
         return Response({'error': 'Shipment not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -1076,8 +1367,6 @@ def create_warehouse_label(request):
                 'phone': warehouse_address.get('phone', '')
             }
         
-        easyship = EasyShipService()
-        
         # Prepare parcels
         parcels = [{
             'total_actual_weight': float(package_details.get('weight', 1)),
@@ -1108,26 +1397,25 @@ def create_warehouse_label(request):
             'phone': pickup_address.get('phone', '')
         }
         
-        # Create shipment in EasyShip
-        easyship_result = easyship.create_shipment(
-            rate_id=rate_id,
-            origin_address=pickup_address_formatted,
-            destination_address=warehouse_address_data,
-            parcels=parcels
+        # Buy the label in the background; the client polls the job for label_url/tracking_number
+        create_kwargs = {
+            'rate_id': rate_id,
+            'origin_address': pickup_address_formatted,
+            'destination_address': warehouse_address_data,
+            'parcels': parcels,
+        }
+        idempotency_key = request_idempotency_key(
+            'warehouse', request.user, create_kwargs, request.headers.get('Idempotency-Key')
+        )
+        job, created = enqueue_label_purchase(
+            idempotency_key,
+            create_kwargs,
+            user=request.user,
+            kind='warehouse',
+            tracking_fields=(),
         )
         
-        if not easyship_result:
-            return Response(
-                {'error': 'Failed to create label in EasyShip'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
-        
-        return Response({
-            'label_url': easyship_result.get('label_url'),
-            'tracking_number': easyship_result.get('tracking_number'),
-            'shipment_id': easyship_result.get('shipment_id'),
-            'message': 'Warehouse label created successfully'
-        })
+        return label_job_response(request, job, 'Warehouse label purchase queued' if created else 'Warehouse label purchase already in progress')
         
     except Exception as e:
         return Response(
@@ -1141,18 +1429,14 @@ def create_warehouse_label(request):
 def track_shipment(request, shipment_id):
     """Track shipment status"""
     try:
-        shipment = LogisticsShipment.objects.get(id=shipment_id, user=request.user)
+        shipment = LogisticsShipmentSerializer.setup_eager_loading(LogisticsShipment.objects).get(id=shipment_id, user=request.user)
         
-        # Get tracking from EasyShip if available
-        tracking_data = None
-        if shipment.tracking_number and shipment.easyship_shipment_id:
-            easyship = EasyShipService()
-            tracking_data = easyship.get_tracking(shipment.tracking_number)
-        
-        serializer = LogisticsShipmentSerializer(shipment)
+        # Tracking is kept up to date by the tracking refresher (logistics.tasks.refresh_tracking)
+        serializer = LogisticsShipmentSerializer(shipment, context={'request': request})
         return Response({
             'shipment': serializer.data,
-            'tracking': tracking_data
+            'tracking': shipment.tracking_data or None,
+            'tracking_refreshed_at': shipment.tracking_refreshed_at
         })
     except LogisticsShipment.DoesNotExist:
         return Response({'error': 'Shipment not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -1176,63 +1460,49 @@ def transport_modes_list(request):
     return Response(serializer.data)
 
 
+def _tracking_payload(shipment_id):
+    """Public tracking body for a shipment and when it last changed (cached by tracking_cache)"""
+    shipment = LogisticsShipmentSerializer.setup_eager_loading(LogisticsShipment.objects).get(id=shipment_id)
+    serializer = LogisticsShipmentSerializer(shipment)
+    
+    # Get packages for this shipment
+    packages = shipment.primary_packages.all()
+    package_serializer = PackageSerializer(packages, many=True)
+    
+    # Use tracking_updates from serializer (includes full data with raw_data)
+    tracking_updates_data = serializer.data.get('tracking_updates', [])
+    
+    changed = [shipment.updated_at, shipment.tracking_refreshed_at]
+    changed += [update.created_at for update in shipment.ordered_tracking_updates]
+    changed += [package.updated_at for package in packages]
+    data = {
+        'shipment': serializer.data,
+        'tracking': shipment.tracking_data or None,
+        'tracking_refreshed_at': shipment.tracking_refreshed_at,
+        'tracking_updates': tracking_updates_data,  # Use serializer data which includes full tracking updates
+        'packages': package_serializer.data
+    }
+    return data, max(value for value in changed if value)
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def track_by_number(request, tracking_number):
     """Track shipment by tracking number, shipment number, or reference number (public access)"""
-    from django.db.models import Q
-    from .models import Package
+    from .services import tracking_cache
     try:
-        print("In tracking")
-        # Try to find by tracking number
-        shipment = LogisticsShipment.objects.filter(
-            Q(tracking_number=tracking_number) |
-            Q(shipment_number=tracking_number) |
-            Q(local_carrier_tracking_number=tracking_number)
-        ).select_related('transport_mode').first()
-        print("Shipment", shipment)
-        # If not found, try to find by package reference number
-        if not shipment:
-            package = Package.objects.filter(reference_number=tracking_number).first()
-            print("Package", package)
-            if package:
-                # Get the latest shipment for this package
-                shipment = package.shipments.first()
-        
-        
-        if not shipment:
-            print("No shipment")
+        # Identifier index lookup and rendered response are both cached; see tracking_cache
+        shipment_id = tracking_cache.shipment_id_for(tracking_number)
+        
+        if not shipment_id:
             return Response(
                 {'error': 'Tracking number not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
         
-
-        # Get tracking from EasyShip if available
-        tracking_data = None
-        if shipment.tracking_number and shipment.easyship_shipment_id:
-            try:
-                easyship = EasyShipService()
-                tracking_data = easyship.get_tracking(shipment.tracking_number)
-            except Exception as e:
-                # If EasyShip fails, continue without tracking data
-                pass
-        
-        serializer = LogisticsShipmentSerializer(shipment)
-        
-        # Get packages for this shipment
-        packages = Package.objects.filter(shipment=shipment).select_related('user')
-        package_serializer = PackageSerializer(packages, many=True)
-        
-        # Use tracking_updates from serializer (includes full data with raw_data)
-        tracking_updates_data = serializer.data.get('tracking_updates', [])
-        
-        return Response({
-            'shipment': serializer.data,
-            'tracking': tracking_data,
-            'tracking_updates': tracking_updates_data,  # Use serializer data which includes full tracking updates
-            'packages': package_serializer.data
-        })
+        # Tracking is kept up to date by the tracking refresher (logistics.tasks.refresh_tracking)
+        entry = tracking_cache.get_entry(shipment_id, _tracking_payload)
+        return tracking_cache.entry_response(request, entry)
     except Exception as e:
         return Response(
             {'error': 'An error occurred while tracking your package'},
@@ -1240,6 +1510,55 @@ def track_by_number(request, tracking_number):
         )
 
 
+async def track_events(request, tracking_number):
+    """
+    Live tracking for a shipment (Server-Sent Events, public access).
+    
+    Accepts any identifier track_by_number does. Events:
+    - shipment: current status on connect, then on every status change
+    - tracking_update: a new tracking update / checkpoint
+    - pickup: pickup request status changes
+    Comment lines are sent as heartbeats; the stream ends after
+    TRACKING_STREAM_MAX_SECONDS and EventSource reconnects on its own.
+    
+    Only served through ASGI (config.asgi): under WSGI an open stream would hold a
+    sync worker for TRACKING_STREAM_MAX_SECONDS, so the view answers 204, which
+    tells EventSource not to reconnect and the page keeps polling. Connections
+    are rate limited per client IP (TrackingStreamThrottle).
+    """
+    from .services import tracking_cache, tracking_events
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    if not settings.TRACKING_PUSH_ENABLED:
+        return JsonResponse({'error': 'Live tracking is not available'}, status=503)
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    if not await sync_to_async(TrackingStreamThrottle().allow_request)(request, None):
+        return JsonResponse({'error': 'Too many live tracking connections'}, status=429)
+    
+    shipment_id = await sync_to_async(tracking_cache.shipment_id_for)(tracking_number)
+    if not shipment_id:
+        return JsonResponse({'error': 'Tracking number not found'}, status=404)
+    shipment = await LogisticsShipment.objects.aget(id=shipment_id)
+    
+    async def events():
+        yield _sse_event('shipment', tracking_events.shipment_event(shipment))
+        try:
+            async for event, data in tracking_events.subscribe(shipment_id):
+                if event == 'heartbeat':
+                    yield ': heartbeat\n\n'
+                else:
+                    yield _sse_event(event, data)
+        except Exception as e:
+            logger.error(f"Tracking stream for shipment {shipment_id} failed: {str(e)}")
+            yield _sse_event('error', {'error': 'Live tracking interrupted'})
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+    return response
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def available_transport_modes(request):
@@ -1307,12 +1626,11 @@ def available_transport_modes(request):
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def easyship_webhook(request):
-    """Handle EasyShip webhooks for various events"""
+    """Receive EasyShip webhooks: verify, store in the inbox and acknowledge (applied by a worker)"""
     import hmac
     import hashlib
     import json
     from django.conf import settings
-    from datetime import datetime
     
     logger = logging.getLogger(__name__)
     
@@ -1336,224 +1654,14 @@ def easyship_webhook(request):
     try:
         data = json.loads(request.body)
         event_type = data.get('event_type')
-        webhook_data = data.get('data', {})
         
-        # Get EasyShip shipment ID from various possible locations
-        easyship_shipment_id = (
-            webhook_data.get('easyship_shipment_id') or
-            data.get('resource_id') or
-            webhook_data.get('id')
-        )
-        
-        if not easyship_shipment_id:
+        if not event_shipment_id(data):
             logger.warning(f"EasyShip webhook received without shipment ID. Event: {event_type}, Data: {data}")
             return Response({'status': 'ignored', 'reason': 'no_shipment_id'})
         
-        try:
-            shipment = LogisticsShipment.objects.get(easyship_shipment_id=str(easyship_shipment_id))
-        except LogisticsShipment.DoesNotExist:
-            logger.warning(f"EasyShip webhook received for unknown shipment: {easyship_shipment_id}, Event: {event_type}")
-            return Response({'status': 'ignored', 'reason': 'shipment_not_found'})
-        
-        # Handle different event types
-        if event_type == 'shipment.label.created':
-            # Label was successfully created
-            label_url = webhook_data.get('label_url', '')
-            tracking_number = webhook_data.get('tracking_number', '')
-            tracking_page_url = webhook_data.get('tracking_page_url', '')
-            
-            # Update shipment with label info
-            if label_url:
-                shipment.easyship_label_url = label_url
-            if tracking_number:
-                shipment.tracking_number = tracking_number
-                shipment.local_carrier_tracking_number = tracking_number
-            if tracking_page_url:
-                shipment.tracking_page_url = tracking_page_url
-            
-            # Change status from label_generating to processing
-            if shipment.status == 'label_generating':
-                shipment.status = 'processing'
-            
-            shipment.save()
-            
-            # Create tracking update
-            TrackingUpdate.objects.create(
-                shipment=shipment,
-                carrier_tracking_number=tracking_number,
-                status='label_created',
-                location='',
-                timestamp=timezone.now(),
-                source='webhook',
-                raw_data={
-                    'event_type': event_type,
-                    'label_url': label_url,
-                    'tracking_number': tracking_number,
-                    'status': 'success'
-                }
-            )
-            
-            logger.info(f"Label created for shipment {shipment.id}: {tracking_number}")
-            
-        elif event_type == 'shipment.label.failed':
-            # Label generation failed
-            shipment.status = 'payment_received'  # Revert to previous status
-            shipment.save()
-            
-            # Create tracking update
-            TrackingUpdate.objects.create(
-                shipment=shipment,
-                status='label_generation_failed',
-                location='',
-                timestamp=timezone.now(),
-                source='webhook',
-                raw_data={
-                    'event_type': event_type,
-                    'status': 'failed'
-                }
-            )
-            
-            logger.warning(f"Label generation failed for shipment {shipment.id}")
-            
-        elif event_type == 'shipment.tracking.status.changed':
-            # Tracking status changed
-            new_status = webhook_data.get('status', '')
-            tracking_number = webhook_data.get('tracking_number', shipment.tracking_number)
-            
-            # Map EasyShip status to our status
-            status_mapping = {
-                'Label Created': 'processing',
-                'Picked Up': 'dispatched',
-                'In Transit': 'in_transit',
-                'Out for Delivery': 'out_for_delivery',
-                'Delivered': 'delivered',
-                'Delivered': 'delivered',
-            }
-            
-            # Update shipment status
-            if new_status in status_mapping:
-                shipment.status = status_mapping[new_status]
-            
-            # Update tracking number if provided
-            if tracking_number:
-                shipment.tracking_number = tracking_number
-                shipment.local_carrier_tracking_number = tracking_number
-            
-            shipment.save()
-            
-            # Create tracking update
-            TrackingUpdate.objects.create(
-                shipment=shipment,
-                carrier_tracking_number=tracking_number,
-                status=new_status.lower().replace(' ', '_'),
-                location=webhook_data.get('destination', ''),
-                timestamp=timezone.now(),
-                source='webhook',
-                raw_data={
-                    'event_type': event_type,
-                    'status': new_status,
-                    'tracking_number': tracking_number
-                }
-            )
-            
-            logger.info(f"Tracking status changed for shipment {shipment.id}: {new_status}")
-            
-        elif event_type == 'shipment.tracking.checkpoints.created':
-            # New tracking checkpoints created
-            checkpoints = webhook_data.get('checkpoints', [])
-            tracking_number = webhook_data.get('tracking_number', shipment.tracking_number)
-            
-            # Update tracking number if provided
-            if tracking_number:
-                shipment.tracking_number = tracking_number
-                shipment.local_carrier_tracking_number = tracking_number
-            
-            # Update shipment status based on latest checkpoint
-            if checkpoints:
-                latest_checkpoint = max(checkpoints, key=lambda x: x.get('order_number', 0))
-                primary_status = latest_checkpoint.get('primary_status', '')
-                
-                # Map primary status to our status
-                status_mapping = {
-                    'Label Created': 'processing',
-                    'Picked Up': 'dispatched',
-                    'In Transit to Customer': 'in_transit',
-                    'In Transit': 'in_transit',
-                    'Out for Delivery': 'out_for_delivery',
-                    'Delivered': 'delivered',
-                }
-                
-                if primary_status in status_mapping:
-                    shipment.status = status_mapping[primary_status]
-            
-            shipment.save()
-            
-            # Create tracking updates for each checkpoint
-            for checkpoint in checkpoints:
-                checkpoint_time = checkpoint.get('checkpoint_time')
-                if checkpoint_time:
-                    try:
-                        # Parse ISO format timestamp
-                        checkpoint_timestamp = datetime.fromisoformat(checkpoint_time.replace('Z', '+00:00'))
-                    except:
-                        checkpoint_timestamp = timezone.now()
-                else:
-                    checkpoint_timestamp = timezone.now()
-                
-                location_parts = []
-                if checkpoint.get('city'):
-                    location_parts.append(checkpoint.get('city'))
-                if checkpoint.get('state'):
-                    location_parts.append(checkpoint.get('state'))
-                if checkpoint.get('postal_code'):
-                    location_parts.append(checkpoint.get('postal_code'))
-                if checkpoint.get('country_name'):
-                    location_parts.append(checkpoint.get('country_name'))
-                
-                location = ', '.join(location_parts) if location_parts else checkpoint.get('location', '')
-                
-                TrackingUpdate.objects.create(
-                    shipment=shipment,
-                    carrier_tracking_number=tracking_number,
-                    status=checkpoint.get('primary_status', '').lower().replace(' ', '_') or 'checkpoint',
-                    location=location,
-                    timestamp=checkpoint_timestamp,
-                    source='webhook',
-                    raw_data={
-                        'event_type': event_type,
-                        'checkpoint': checkpoint,
-                        'message': checkpoint.get('message', ''),
-                        'handler': checkpoint.get('handler', '')
-                    }
-                )
-            
-            logger.info(f"Created {len(checkpoints)} tracking checkpoints for shipment {shipment.id}")
-            
-        elif event_type == 'shipment.cancelled':
-            # Shipment was cancelled
-            shipment.status = 'cancelled'
-            shipment.save()
-            
-            # Create tracking update
-            TrackingUpdate.objects.create(
-                shipment=shipment,
-                status='cancelled',
-                location='',
-                timestamp=timezone.now(),
-                source='webhook',
-                raw_data={
-                    'event_type': event_type,
-                    'status': 'cancelled'
-                }
-            )
-            
-            logger.info(f"Shipment {shipment.id} was cancelled")
-            
-        else:
-            logger.warning(f"Unhandled EasyShip webhook event type: {event_type}")
-            return Response({'status': 'ignored', 'reason': 'unhandled_event_type'})
-        
-        return Response({'status': 'success', 'event_type': event_type})
+        # Store and acknowledge; logistics.tasks.process_easyship_webhooks applies it
+        event, created = receive_event(request.body, data)
+        return Response({'status': 'accepted' if created else 'duplicate', 'event_type': event_type})
         
     except json.JSONDecodeError:
         logger.error("EasyShip webhook: Invalid JSON")
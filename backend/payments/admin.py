@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Payment
+from .models import Payment, StripeEvent
 
 
 @admin.register(Payment)
@@ -8,3 +8,13 @@ class PaymentAdmin(admin.ModelAdmin):
     list_filter = ['status', 'payment_type', 'currency', 'created_at']
     search_fields = ['payment_id', 'stripe_payment_intent_id', 'user__email']
 
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    """Stripe webhook inbox (applied by payments.tasks.process_stripe_events)"""
+    list_display = ['event_id', 'event_type', 'ordering_key', 'status', 'attempts', 'received_at', 'processed_at']
+    list_filter = ['status', 'event_type']
+    search_fields = ['event_id', 'ordering_key']
+    readonly_fields = ['event_id', 'event_type', 'ordering_key', 'payload', 'status', 'attempts', 'error',
+                       'received_at', 'processed_at']
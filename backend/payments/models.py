@@ -50,3 +50,36 @@ class Payment(models.Model):
     def __str__(self):
         return f"Payment {self.payment_id} - {self.amount} {self.currency}"
 
+
+
+class StripeEvent(models.Model):
+    """
+    Stripe webhook inbox (see payments.services.stripe_events). The unique
+    event_id makes redeliveries no-ops; events are applied by
+    payments.tasks.process_stripe_events, in order per ordering_key (payment).
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed'),
+    ]
+    
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    ordering_key = models.CharField(max_length=255, db_index=True)  # PaymentIntent (or object) id
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'ordering_key']),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_type} {self.event_id} ({self.status})"
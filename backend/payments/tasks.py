@@ -0,0 +1,18 @@
+"""
+Celery tasks for payments
+"""
+from celery import shared_task
+
+
+@shared_task(ignore_result=True)
+def process_stripe_events(ordering_key):
+    """Apply pending Stripe events for one payment, in order"""
+    from payments.services.stripe_events import process_payment_events
+    return process_payment_events(ordering_key)
+
+
+@shared_task(ignore_result=True)
+def process_pending_stripe_events():
+    """Queue payments whose Stripe events are still pending (retries, lost dispatches)"""
+    from payments.services.stripe_events import process_pending_events
+    return process_pending_events()
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from logistics.sparse_fields import SparseFieldsMixin
 from .models import Vehicle, VehicleDocument
 
 
@@ -9,7 +10,7 @@ class VehicleDocumentSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class VehicleSerializer(serializers.ModelSerializer):
+class VehicleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     shipment = serializers.SerializerMethodField()
     inspection_photos = serializers.SerializerMethodField()
     documents_signed_display = serializers.SerializerMethodField()
@@ -19,6 +20,18 @@ class VehicleSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['id', 'created_at', 'updated_at', 'status', 'payment_paid', 'documents_signed_at', 
                            'inspection_completed_at', 'condition_report_signed_at', 'received_at_warehouse_at']
+        expandable_fields = ['shipment', 'inspection_photos', 'documents_signed_display']
+        field_dependencies = {
+            'shipment': ['shipment'],
+            'inspection_photos': [f'inspection_photo_{i}' for i in range(1, 21)] + ['inspection_photos'],
+            'documents_signed_display': ['documents_signed'],
+        }
+    
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None):
+        if cls.wants(fields, 'shipment'):
+            queryset = queryset.select_related('shipment')
+        return cls.only_requested(queryset, fields)
     
     def get_shipment(self, obj):
         if obj.shipment:
@@ -21,7 +21,8 @@ class VehicleViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Vehicle.objects.filter(user=self.request.user)
+        fields = VehicleSerializer.requested_fields(self.request)
+        return VehicleSerializer.setup_eager_loading(Vehicle.objects.filter(user=self.request.user), fields)
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)